@@ -0,0 +1,140 @@
+"""
+多账号池
+获取下载链接原本受单个账号的限速约束（每 3 秒 2 个请求），几千本要跑好几个小时。
+配置多个账号（config.ACCOUNTS 或环境变量 WNACG_ACCOUNTS）后，请求在账号之间分摊：
+每个账号有自己的限速（最小间隔 + 同时请求数）、Cookie 和健康状态，
+连续失败的账号暂停一段时间，登录失败的账号直接移出轮换，其余账号继续工作。
+
+收藏夹/书架属于各自的账号，不能在账号之间分摊，书架导出仍使用主账号。
+"""
+import asyncio
+import time
+from typing import List, Optional
+
+import aiohttp
+
+# 从配置文件导入
+from config import get_accounts, ACCOUNT_POOL_CONFIG
+from auth import CookieManager, SessionExpiredError, get_cookie_manager
+from http_client import HTTPStatusError, fetch_user_page
+from retry import is_retryable
+import metrics
+
+
+class NoAccountAvailableError(SessionExpiredError):
+    """所有账号都已失效"""
+    pass
+
+
+class Account:
+    """单个账号：Cookie、限速和健康状态"""
+
+    def __init__(self, name: str, manager: CookieManager):
+        self.name = name
+        self.manager = manager
+        self.failures = 0
+        self.disabled_until = 0.0  # 暂停到该时间（monotonic），inf 表示永久移出
+        self.requests = 0
+        self._next_time = 0.0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.disabled_until
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(ACCOUNT_POOL_CONFIG['max_inflight'])
+        return self._slots
+
+    def reserve(self) -> float:
+        """预约下一个请求时间，返回需要等待的秒数（与 search_id.RateLimiter 相同的做法）"""
+        now = time.monotonic()
+        wait_time = self._next_time - now
+        self._next_time = max(now, self._next_time) + ACCOUNT_POOL_CONFIG['min_interval']
+        return max(wait_time, 0.0)
+
+
+class AccountPool:
+    def __init__(self, accounts: List[Account]):
+        if not accounts:
+            raise ValueError("账号池至少需要一个账号")
+        self.accounts = accounts
+
+    @property
+    def concurrency(self) -> int:
+        """所有可用账号合计的同时请求数"""
+        return ACCOUNT_POOL_CONFIG['max_inflight'] * max(1, sum(1 for a in self.accounts if a.available))
+
+    def _pick(self) -> Account:
+        available = [a for a in self.accounts if a.available]
+        if not available:
+            if all(a.disabled_until == float("inf") for a in self.accounts):
+                raise NoAccountAvailableError("所有账号都已失效")
+            # 都在暂停中：选最早恢复的那个
+            account = min(self.accounts, key=lambda a: a.disabled_until)
+            account.disabled_until = 0.0
+            return account
+        return min(available, key=lambda a: a._next_time)
+
+    def _report_success(self, account: Account) -> None:
+        account.failures = 0
+        account.requests += 1
+        metrics.ACCOUNT_REQUESTS.inc(1, account.name, "success")
+
+    def _report_failure(self, account: Account, error: Exception) -> None:
+        account.failures += 1
+        metrics.ACCOUNT_REQUESTS.inc(1, account.name, "failed")
+        if isinstance(error, SessionExpiredError):
+            account.disabled_until = float("inf")
+            print(f"账号 {account.name} 登录失败，已移出轮换: {error}")
+        elif account.failures >= ACCOUNT_POOL_CONFIG['max_failures']:
+            account.disabled_until = time.monotonic() + ACCOUNT_POOL_CONFIG['cooldown']
+            account.failures = 0
+            print(f"账号 {account.name} 连续失败，暂停 {ACCOUNT_POOL_CONFIG['cooldown']} 秒: {error}")
+
+    async def fetch_user_page(self, session: aiohttp.ClientSession, url: str) -> str:
+        """用池中的某个账号获取需要登录的页面，失败时换一个账号重试"""
+        last_error: Optional[Exception] = None
+        for _ in range(len(self.accounts)):
+            account = self._pick()
+            wait_time = account.reserve()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            try:
+                async with account.slots:
+                    cookie = await account.manager.get()
+                    text = await fetch_user_page(session, cookie, url, manager=account.manager)
+            except (SessionExpiredError, HTTPStatusError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 404 等与账号无关的状态码换账号也一样，直接抛出，不计入账号的失败次数
+                if isinstance(e, HTTPStatusError) and not is_retryable(e):
+                    raise
+                self._report_failure(account, e)
+                last_error = e
+                continue
+            self._report_success(account)
+            return text
+        raise last_error
+
+    def summary(self) -> str:
+        parts = []
+        for account in self.accounts:
+            state = "正常" if account.available else (
+                "已移出" if account.disabled_until == float("inf") else "暂停中")
+            parts.append(f"{account.name}: {account.requests} 次请求 ({state})")
+        return "; ".join(parts)
+
+
+def get_account_pool() -> Optional[AccountPool]:
+    """按配置创建账号池：主账号 + 额外账号；没有配置额外账号时返回 None（沿用单账号逻辑）"""
+    extra = get_accounts()
+    if not extra:
+        return None
+    accounts = [Account("default", get_cookie_manager())]
+    for i, entry in enumerate(extra, 1):
+        name = entry.get("name") or entry.get("username") or f"account{i}"
+        manager = CookieManager(cookie=entry.get("cookie"), username=entry.get("username"),
+                                password=entry.get("password"), name=name)
+        accounts.append(Account(name, manager))
+    return AccountPool(accounts)
@@ -0,0 +1,211 @@
+"""
+压缩包内容寻址存储
+同一本漫画常出现在多个书架、搜索结果和重复运行中，按文件名判断会下载出多份相同的压缩包。
+下载完成的压缩包按 sha256 移入 下载目录/.store/objects/，下载目录中的文件名只是指向它的硬链接
+（不支持时依次退回符号链接、复制）；index.json 记录 漫画ID -> 内容哈希。
+再次遇到已存储的漫画时直接建立链接，不产生网络流量和额外的磁盘占用。
+
+用法: python archive_store.py [下载目录] [--verify] [--prune]
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 从配置文件导入
+from config import STORE_CONFIG
+
+HASH_CHUNK_SIZE = 1024 * 1024
+LINK_MODES = ("hardlink", "symlink", "copy")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArchiveStore:
+    """按内容寻址的压缩包存储
+
+    - 压缩包按 sha256 存放在 objects/<前两位>/<sha256><扩展名>，相同内容只存一份
+    - index.json 记录 漫画ID -> 内容哈希 的映射，以及每个对象的大小
+    """
+
+    def __init__(self, download_dir: str = "downloads", link_mode: Optional[str] = None):
+        self.download_dir = Path(download_dir)
+        self.store_dir = self.download_dir / STORE_CONFIG['dir']
+        self.objects_dir = self.store_dir / "objects"
+        self.index_path = self.store_dir / "index.json"
+        self.link_mode = link_mode or STORE_CONFIG['link']  # auto / hardlink / symlink / copy
+        if self.link_mode != "auto" and self.link_mode not in LINK_MODES:
+            raise ValueError(f"未知的链接方式: {self.link_mode}")
+        self.comics: Dict[str, Dict] = {}   # 漫画ID -> {"hash"}
+        self.objects: Dict[str, Dict] = {}  # 内容哈希 -> {"path", "size"}
+        self._load_index()
+
+    # ---------- 索引读写 ---------- #
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.comics = data.get("comics", {})
+        self.objects = data.get("objects", {})
+
+    def save_index(self) -> None:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"comics": self.comics, "objects": self.objects}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    # ---------- 查找 ---------- #
+    def lookup(self, comic_id) -> Optional[Path]:
+        """按漫画ID查找已存储的压缩包；对象缺失或大小不符时视为未存储"""
+        entry = self.comics.get(str(comic_id))
+        if not entry:
+            return None
+        obj = self.objects.get(entry["hash"])
+        if obj:
+            path = self.store_dir / obj["path"]
+            try:
+                if path.stat().st_size == obj["size"]:
+                    return path
+            except FileNotFoundError:
+                pass
+        del self.comics[str(comic_id)]
+        return None
+
+    def __contains__(self, comic_id) -> bool:
+        return self.lookup(comic_id) is not None
+
+    # ---------- 写入 & 链接 ---------- #
+    async def ingest(self, path: Path, comic_id) -> Path:
+        """把刚下载完成的 path 移入存储，原位置换成指向它的链接，返回对象路径
+
+        内容与已有对象相同（其他漫画ID或其他文件名下载过）时丢弃 path，只建立链接。
+        """
+        digest = await asyncio.to_thread(file_sha256, path)
+        obj = self.objects.get(digest)
+        obj_path = self.store_dir / obj["path"] if obj else None
+        if obj_path is None or not obj_path.exists():
+            rel_path = f"objects/{digest[:2]}/{digest}{path.suffix.lower()}"
+            obj_path = self.store_dir / rel_path
+            obj_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, obj_path)  # 存储在下载目录内，重命名不会跨文件系统
+            self.objects[digest] = {"path": rel_path, "size": obj_path.stat().st_size}
+        self.link(obj_path, path)
+        if comic_id is not None:
+            self.comics[str(comic_id)] = {"hash": digest}
+        self.save_index()
+        return obj_path
+
+    def link(self, obj_path: Path, target: Path) -> str:
+        """让 target 指向 obj_path，返回实际使用的方式（hardlink / symlink / copy / existing）"""
+        try:
+            if os.path.samefile(obj_path, target):
+                return "existing"
+        except FileNotFoundError:
+            pass
+
+        modes = LINK_MODES if self.link_mode == "auto" else (self.link_mode,)
+        tmp_path = target.with_name(target.name + ".link")
+        for mode in modes:
+            try:
+                if tmp_path.is_symlink() or tmp_path.exists():
+                    tmp_path.unlink()
+                if mode == "hardlink":
+                    os.link(obj_path, tmp_path)
+                elif mode == "symlink":
+                    os.symlink(os.path.relpath(obj_path, target.parent), tmp_path)
+                else:
+                    shutil.copy2(obj_path, tmp_path)
+            except OSError:
+                if mode == modes[-1]:
+                    raise
+                continue
+            os.replace(tmp_path, target)
+            return mode
+
+    # ---------- 维护 ---------- #
+    def verify(self) -> List[str]:
+        """重新计算每个对象的哈希，删除损坏或缺失的对象，返回它们的哈希"""
+        bad = []
+        for digest, obj in self.objects.items():
+            path = self.store_dir / obj["path"]
+            try:
+                ok = file_sha256(path) == digest
+            except FileNotFoundError:
+                ok = False
+            if not ok:
+                bad.append(digest)
+                path.unlink(missing_ok=True)
+        self._forget(bad)
+        return bad
+
+    def prune(self) -> int:
+        """删除下载目录中已没有文件名指向的对象（用户删除了对应文件），返回释放的字节数"""
+        linked = set()
+        for entry in self.download_dir.iterdir():
+            if entry.is_symlink():
+                linked.add(os.path.realpath(entry))
+
+        unused, freed = [], 0
+        for digest, obj in self.objects.items():
+            path = self.store_dir / obj["path"]
+            try:
+                nlink = path.stat().st_nlink
+            except FileNotFoundError:
+                unused.append(digest)
+                continue
+            if nlink <= 1 and os.path.realpath(path) not in linked:
+                path.unlink()
+                unused.append(digest)
+                freed += obj["size"]
+        self._forget(unused)
+        return freed
+
+    def _forget(self, digests: List[str]) -> None:
+        if not digests:
+            return
+        gone = set(digests)
+        for digest in gone:
+            self.objects.pop(digest, None)
+        self.comics = {cid: entry for cid, entry in self.comics.items() if entry["hash"] not in gone}
+        self.save_index()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(obj["size"] for obj in self.objects.values())
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+def main(download_dir: str = "downloads", verify: bool = False, prune: bool = False) -> int:
+    if not os.path.isdir(download_dir):
+        print(f"下载目录不存在: {download_dir}")
+        return 1
+    store = ArchiveStore(download_dir)
+    print(f"存储目录: {store.store_dir}")
+    print(f"漫画: {len(store.comics)} 本 | 对象: {len(store.objects)} 个 | 占用: {store.total_bytes / 1024 / 1024:.1f} MB")
+    if verify:
+        bad = store.verify()
+        print(f"校验完成，删除损坏或缺失的对象 {len(bad)} 个")
+    if prune:
+        freed = store.prune()
+        print(f"清理完成，释放 {freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    sys.exit(main(args[0] if args else "downloads", verify="--verify" in sys.argv, prune="--prune" in sys.argv))
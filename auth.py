@@ -0,0 +1,144 @@
+"""
+会话管理
+检测运行过程中Cookie失效（跳转到登录页、收藏夹页面为空），并以异步方式重新登录。
+同一时间只会有一次重新登录（single-flight）：几十个请求同时发现失效时，
+第一个触发登录，其余等待并直接复用新Cookie，事件循环不会被同步登录阻塞。
+"""
+import asyncio
+from typing import Optional, Set
+
+import aiohttp
+
+# 从配置文件导入
+from config import (
+    api_url, get_cookie, get_headers, get_login_config,
+    parse_cookie_expiry, load_cached_cookie, save_cached_cookie, invalidate_cached_cookie,
+    REQUEST_CONFIG
+)
+
+
+class SessionExpiredError(RuntimeError):
+    """Cookie已失效且无法重新登录"""
+    pass
+
+
+def is_session_expired(url: str, html: str) -> bool:
+    """根据最终URL和页面内容判断是否被重定向到了登录页"""
+    url = str(url).lower()
+    if 'users-login' in url or 'login.html' in url:
+        return True
+    return 'name="login_name"' in html or "name='login_name'" in html
+
+
+class CookieManager:
+    """持有当前Cookie，负责失效后的异步单飞重新登录
+
+    传入 name（或 username）时为独立账号：Cookie缓存在该账号自己的缓存文件中，
+    不使用全局配置的Cookie，也不会用全局账号重新登录。
+    """
+
+    def __init__(self, cookie: Optional[str] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, name: Optional[str] = None):
+        self._cookie = cookie
+        self._username = username
+        self._password = password
+        self.name = name or username
+        self._lock: Optional[asyncio.Lock] = None
+        self._superseded: Set[str] = set()  # 已被替换掉的旧Cookie
+
+    @property
+    def cookie(self) -> str:
+        if self._cookie is None:
+            if self.name:
+                self._cookie = load_cached_cookie(self.name)
+                if self._cookie is None:
+                    raise SessionExpiredError(f"账号 {self.name} 尚未登录")
+            else:
+                self._cookie = get_cookie()
+        return self._cookie
+
+    async def get(self) -> str:
+        """返回可用的Cookie；独立账号没有缓存时异步登录"""
+        if self._cookie is None and self.name:
+            self._cookie = load_cached_cookie(self.name)
+            if self._cookie is None:
+                return await self.refresh(None)
+        return self.cookie
+
+    def resolve(self, cookie: Optional[str]) -> str:
+        """如果传入的Cookie已被重新登录替换，返回最新的Cookie"""
+        if cookie is None or cookie in self._superseded:
+            return self.cookie
+        return cookie
+
+    async def refresh(self, stale_cookie: Optional[str]) -> str:
+        """Cookie失效时调用，返回可用的新Cookie
+
+        多个协程同时以同一个失效Cookie调用时只会登录一次。
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            # 在等待锁期间其他协程已经完成了重新登录
+            if stale_cookie is not None and self._cookie is not None and stale_cookie != self._cookie:
+                return self._cookie
+
+            if stale_cookie is not None:
+                self._superseded.add(stale_cookie)
+            if self._cookie is not None:
+                self._superseded.add(self._cookie)
+            invalidate_cached_cookie(self.name)
+
+            who = f"账号 {self.name} " if self.name else ""
+            print(f"{who}Cookie已失效或不存在，正在登录...")
+            try:
+                cookie, expires_at = await self._login()
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+                raise SessionExpiredError(f"Cookie已失效且重新登录失败: {e}") from e
+
+            save_cached_cookie(cookie, expires_at, self.name)
+            self._cookie = cookie
+            print(f"✓ {who}登录成功，已更新cookie")
+            return cookie
+
+    async def _login(self):
+        """异步登录，返回 (cookie, 过期时间戳)"""
+        if self._username and self._password:
+            username, password = self._username, self._password
+        elif self.name:
+            raise RuntimeError(f"账号 {self.name} 没有配置用户名和密码，无法重新登录")
+        else:
+            username, password = get_login_config()
+
+        data = {
+            "login_name": username,
+            "login_pass": password,
+        }
+        timeout = aiohttp.ClientTimeout(total=REQUEST_CONFIG['timeout'] * 3)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.post(api_url("/users-check_login.html"),
+                                    data=data, headers=get_headers()) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"登录请求失败，状态码: {resp.status}")
+                login_resp = await resp.json(content_type=None)
+                if not login_resp.get("ret"):
+                    raise RuntimeError(f"登录失败: {login_resp}")
+
+                set_cookie = ", ".join(resp.headers.getall("Set-Cookie", []))
+                cookie = "; ".join(f"{name}={morsel.value}" for name, morsel in resp.cookies.items())
+                if not cookie:
+                    raise RuntimeError(f"响应中没有找到cookie: {login_resp}")
+
+        return cookie, parse_cookie_expiry(set_cookie)
+
+
+_default_manager: Optional[CookieManager] = None
+
+
+def get_cookie_manager() -> CookieManager:
+    """获取进程内共享的 CookieManager"""
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = CookieManager()
+    return _default_manager
@@ -0,0 +1,359 @@
+"""
+本地 WNACG 模拟服务器
+用 fixtures/ 下录制的页面模板生成搜索页、标签页、收藏夹页和 download-index-aid-* 页面，
+并提供可配置大小的压缩包文件（支持 Range），可注入延迟、带宽限制和错误率，用于离线基准测试。
+
+单独运行:
+  python benchmarks/mock_server.py --port 8080 --latency-ms 50 --bandwidth-mbps 20 --error-rate 0.01
+然后:
+  WNACG_API_SCHEME=http WNACG_API_DOMAINS=127.0.0.1:8080 WNACG_COOKIE=bench=1 python wnacg.py ...
+"""
+import argparse
+import asyncio
+import io
+import random
+import threading
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from string import Template
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+PAGE_SIZE = 24
+
+
+@dataclass
+class ServerOptions:
+    latency_ms: float = 0.0  # 每个请求的额外延迟
+    jitter_ms: float = 0.0  # 延迟抖动（均匀分布）
+    bandwidth_mbps: float = 0.0  # 文件下载带宽上限（MB/s），0 表示不限
+    error_rate: float = 0.0  # 返回 503 的概率
+    archive_mb: float = 4.0  # 压缩包大小（MB）
+    archive_pages: int = 40  # 压缩包内图片数
+    shelf_size: int = 120  # 每个书架的漫画数
+    shelves: int = 3  # 书架数
+    search_total: int = 240  # 每个搜索词的结果总数
+    seed: int = 0
+
+
+def _load(name: str) -> Template:
+    return Template((FIXTURES_DIR / name).read_text(encoding="utf-8"))
+
+
+def build_archive(size_bytes: int, pages: int, seed: int = 0) -> bytes:
+    """生成一个真实的 ZIP（存储模式），内含 pages 张"图片"，总大小约为 size_bytes"""
+    rng = random.Random(seed)
+    per_page = max(1, size_bytes // max(pages, 1))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for i in range(1, pages + 1):
+            zf.writestr(f"{i:03d}.jpg", rng.randbytes(per_page))
+    return buf.getvalue()
+
+
+class MockWnacgServer:
+    def __init__(self, options: Optional[ServerOptions] = None):
+        self.options = options or ServerOptions()
+        self.rng = random.Random(self.options.seed)
+        self.templates = {
+            name: _load(f"{name}.html")
+            for name in ("search_page", "search_item", "favorite_page", "favorite_item", "download_page")
+        }
+        self.archive = build_archive(int(self.options.archive_mb * 1024 * 1024),
+                                     self.options.archive_pages, self.options.seed)
+        self.records: List[Dict] = []  # 每个请求: kind, status, duration, bytes
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 应用 ---------- #
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/", self.handle_index)
+        app.router.add_get("/search/index.php", self.handle_search)
+        app.router.add_get(r"/albums-index-page-{page:\d+}-tag-{tag}.html", self.handle_tag)
+        app.router.add_get(r"/users-users_fav-page-{page:\d+}-c-{shelf:\d+}.html", self.handle_favorite)
+        app.router.add_get(r"/download-index-aid-{aid:\d+}.html", self.handle_download_page)
+        app.router.add_get(r"/files/{name}", self.handle_file)
+        app.router.add_get(r"/photos-gallery-aid-{aid:\d+}.html", self.handle_gallery)
+        app.router.add_get(r"/images/{aid:\d+}/{name}", self.handle_image)
+        app.router.add_post("/users-check_login.html", self.handle_login)
+        app.router.add_get("/__stats", self.handle_stats)
+        app.router.add_post("/__reset", self.handle_reset)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if request.path.startswith("/__"):
+            return await handler(request)
+
+        start = time.perf_counter()
+        kind = self._kind(request.path)
+        delay = self.options.latency_ms + self.rng.uniform(0, self.options.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        if self.options.error_rate and self.rng.random() < self.options.error_rate:
+            resp = web.Response(status=503, text="Service Unavailable")
+        else:
+            resp = await handler(request)
+
+        self.records.append({
+            "kind": kind,
+            "status": resp.status,
+            "duration": time.perf_counter() - start,
+            "bytes": request.get("bytes_sent", resp.content_length or 0),
+        })
+        return resp
+
+    @staticmethod
+    def _kind(path: str) -> str:
+        if path.startswith("/search/"):
+            return "search"
+        if path.startswith("/albums-index-"):
+            return "tag"
+        if path.startswith("/users-users_fav-"):
+            return "favorite"
+        if path.startswith("/download-index-"):
+            return "download_page"
+        if path.startswith("/files/"):
+            return "file"
+        if path.startswith("/photos-gallery-"):
+            return "gallery"
+        if path.startswith("/images/"):
+            return "image"
+        if path.startswith("/users-check_login"):
+            return "login"
+        return "other"
+
+    # ---------- 页面 ---------- #
+    def _paginator(self, page: int, total_pages: int, href: str) -> str:
+        links = [f'    <a href="{href.format(p)}">{p}</a>' for p in range(1, total_pages + 1) if p != page]
+        return "\n".join(links)
+
+    def _search_items(self, query: str, page: int, total: int) -> str:
+        start = (page - 1) * PAGE_SIZE
+        items = []
+        for i in range(start, min(start + PAGE_SIZE, total)):
+            comic_id = 500000 + (zlib.crc32(query.encode("utf-8")) % 1000) * 1000 + i
+            day = 28 - (i // PAGE_SIZE) % 28
+            items.append(self.templates["search_item"].substitute(
+                id=comic_id, title=f"{query} 第{i + 1}話", pages=20 + i % 30, date=f"2024-06-{day:02d}",
+            ))
+        return "".join(items)
+
+    async def handle_index(self, request: web.Request) -> web.Response:
+        return web.Response(text="<html><body>mock wnacg</body></html>", content_type="text/html")
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        page = int(request.query.get("p", 1))
+        total = self.options.search_total
+        total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        html = self.templates["search_page"].substitute(
+            total=total, page=page, items=self._search_items(query, page, total),
+            paginator=self._paginator(page, total_pages, "/search/index.php?q=&p={}"),
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_tag(self, request: web.Request) -> web.Response:
+        tag = request.match_info["tag"]
+        page = int(request.match_info["page"])
+        total = self.options.search_total
+        total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        html = self.templates["search_page"].substitute(
+            total=total, page=page, items=self._search_items(tag, page, total),
+            paginator=self._paginator(page, total_pages, f"/albums-index-page-{{}}-tag-{tag}.html"),
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_favorite(self, request: web.Request) -> web.Response:
+        page = int(request.match_info["page"])
+        shelf_id = int(request.match_info["shelf"])
+        shelf_ids = range(1, self.options.shelves + 1) if shelf_id == 0 else [shelf_id]
+        comics = [(s, i) for s in shelf_ids for i in range(self.options.shelf_size)]
+        total_pages = max(1, (len(comics) + PAGE_SIZE - 1) // PAGE_SIZE)
+
+        items = []
+        for s, i in comics[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]:
+            items.append(self.templates["favorite_item"].substitute(
+                id=s * 100000 + i, title=f"書架{s} 漫畫{i}", shelf_id=s, shelf_name=f"書架{s}",
+                date="2024-05-01 12:00:00",
+            ))
+
+        shelves = [("全部", 0)] + [(f"書架{s}", s) for s in range(1, self.options.shelves + 1)]
+        shelf_links = "\n".join(
+            f'  <a{cur_attr} href="/users-users_fav-page-1-c-{sid}.html">{name}</a>'
+            for name, sid in shelves
+            for cur_attr in [' class="cur"' if sid == shelf_id else '']
+        )
+        html = self.templates["favorite_page"].substitute(
+            shelves=shelf_links, items="".join(items), page=page,
+            paginator=self._paginator(page, total_pages, f"/users-users_fav-page-{{}}-c-{shelf_id}.html"),
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_download_page(self, request: web.Request) -> web.Response:
+        aid = request.match_info["aid"]
+        html = self.templates["download_page"].substitute(id=aid, title=f"漫畫{aid}", base=self.base_url)
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_gallery(self, request: web.Request) -> web.Response:
+        """与真实站点相同的格式：document.writeln 输出的脚本里带转义引号的 imglist，最后一项是广告图"""
+        aid = request.match_info["aid"]
+        items = [f'{{ url: fast_img_host+\\"//{request.host}/images/{aid}/{i:03d}.jpg\\", caption: \\"[{i:03d}]\\"}}'
+                 for i in range(1, self.options.archive_pages + 1)]
+        items.append(f'{{ url: fast_img_host+\\"//{request.host}/themes/weitu/images/bg/shoucang.jpg\\", '
+                     f'caption: \\"喜歡紳士漫畫的同學請加入收藏哦！\\"}}')
+        script = (f'var fast_img_host=\\"\\";\n'
+                  f'document.writeln("<script>var imglist = [{",".join(items)}];</script>");\n')
+        return web.Response(text=script, content_type="application/javascript")
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        per_page = max(1, int(self.options.archive_mb * 1024 * 1024) // max(self.options.archive_pages, 1))
+        seed = f"{self.options.seed}/{request.match_info['aid']}/{request.match_info['name']}"
+        data = random.Random(seed).randbytes(per_page)
+        request["bytes_sent"] = len(data)
+        return web.Response(body=data, content_type="image/jpeg")
+
+    async def handle_login(self, request: web.Request) -> web.Response:
+        resp = web.json_response({"ret": True, "html": "登录成功"})
+        resp.set_cookie("bench_session", "1", max_age=3600, path="/")
+        return resp
+
+    async def handle_file(self, request: web.Request) -> web.StreamResponse:
+        data = self.archive
+        size = len(data)
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = request.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[6:].split(",")[0].partition("-")
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(0, size - int(last))
+            if start >= size:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+
+        headers = {"Content-Length": str(end - start + 1), "Accept-Ranges": "bytes",
+                   "Content-Type": "application/zip"}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        if request.method == "HEAD":
+            await resp.write_eof()
+            return resp
+
+        chunk_size = 64 * 1024
+        rate = self.options.bandwidth_mbps * 1024 * 1024
+        sent = 0
+        began = time.perf_counter()
+        for offset in range(start, end + 1, chunk_size):
+            chunk = data[offset:min(offset + chunk_size, end + 1)]
+            await resp.write(chunk)
+            sent += len(chunk)
+            if rate:
+                ahead = sent / rate - (time.perf_counter() - began)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await resp.write_eof()
+        request["bytes_sent"] = sent
+        return resp
+
+    # ---------- 统计 ---------- #
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"options": asdict(self.options), "records": self.records})
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.records = []
+        return web.json_response({"ok": True})
+
+    # ---------- 启停 ---------- #
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{bound_host}:{bound_port}"
+        return f"{bound_host}:{bound_port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """在后台线程中运行服务器（供同步代码和子进程基准测试使用），返回 host:port"""
+        ready = threading.Event()
+        result = {}
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            result["address"] = self._loop.run_until_complete(self.start(host, port))
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-wnacg", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return result["address"]
+
+    def stop_thread(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = ServerOptions()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--bandwidth-mbps", type=float, default=defaults.bandwidth_mbps)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--archive-mb", type=float, default=defaults.archive_mb)
+    parser.add_argument("--archive-pages", type=int, default=defaults.archive_pages)
+    parser.add_argument("--shelf-size", type=int, default=defaults.shelf_size)
+    parser.add_argument("--shelves", type=int, default=defaults.shelves)
+    parser.add_argument("--search-total", type=int, default=defaults.search_total)
+
+
+def options_from_args(args) -> ServerOptions:
+    return ServerOptions(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, bandwidth_mbps=args.bandwidth_mbps,
+        error_rate=args.error_rate, archive_mb=args.archive_mb, archive_pages=args.archive_pages,
+        shelf_size=args.shelf_size, shelves=args.shelves, search_total=args.search_total,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 WNACG 模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockWnacgServer(options_from_args(args))
+
+    async def serve():
+        address = await server.start(args.host, args.port)
+        print(f"模拟服务器已启动: http://{address}  (Ctrl+C 退出)")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
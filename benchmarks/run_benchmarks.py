@@ -0,0 +1,250 @@
+"""
+端到端吞吐基准测试
+在本地启动模拟服务器，分别在独立子进程中运行 搜索 / 书架导出 / 获取下载链接 / 下载 四个场景，
+统计 请求数、requests/sec、MB/s、p50/p99 延迟和峰值内存（RSS），
+结果保存到 benchmarks/results/，并与上一次（或指定的）结果对比。
+
+用法:
+  python benchmarks/run_benchmarks.py                       # 运行全部场景
+  python benchmarks/run_benchmarks.py --scenarios search links --latency-ms 30
+  python benchmarks/run_benchmarks.py --compare benchmarks/results/20240101_120000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.request import Request, urlopen
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+SCENARIOS = ["search", "shelf", "links", "download"]
+
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(ROOT_DIR))
+
+
+# --------------------------------------------------------------------------- #
+#                          子进程：运行单个场景                                 #
+# --------------------------------------------------------------------------- #
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _write_comics(path: Path, comics: List[Dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"comics": comics, "total_comics": len(comics)}, f, ensure_ascii=False, indent=2)
+
+
+def run_child(args) -> None:
+    # 必须在导入 config 之前设置，让各工具连到模拟服务器
+    os.environ["WNACG_API_SCHEME"] = "http"
+    os.environ["WNACG_API_DOMAINS"] = args.server
+    os.environ["WNACG_COOKIE"] = "bench_session=1"
+
+    import config
+    workdir = Path(args.workdir)
+    config.DIRECTORIES["search_results"] = str(workdir / "search_results")
+    config.DIRECTORIES["downloads"] = str(workdir / "url")
+    config.DIRECTORIES["covers"] = str(workdir / "covers")
+    if not args.keep_delays:
+        config.REQUEST_CONFIG["delay_between_requests"] = 0
+        config.REQUEST_CONFIG["download_delay"] = (0, 0)
+
+    cookie = config.get_cookie()
+    base_url = f"http://{args.server}"
+    items = 0
+    start = time.perf_counter()
+
+    if args.child == "search":
+        import search_id
+        comics = search_id.get_all_search_results(search_id.search_by_keyword, "bench", args.max_pages, delay=0)
+        items = len(comics)
+
+    elif args.child == "shelf":
+        import get_shelf_info
+        asyncio.run(get_shelf_info.main(cookie, 0))
+        items = args.shelf_total
+
+    elif args.child == "links":
+        import get_url
+        input_file = workdir / "links_input.json"
+        _write_comics(input_file, [{"id": 100000 + i, "title": f"漫畫{i}"} for i in range(args.links)])
+        start = time.perf_counter()
+        asyncio.run(get_url.main_from_json(cookie, str(input_file)))
+        items = args.links
+
+    elif args.child == "download":
+        from download import ComicDownloader
+        input_file = workdir / "download_input.json"
+        _write_comics(input_file, [
+            {"id": 100000 + i, "title": f"漫畫{i}",
+             "download_links": {"本地下載一": {"url": f"{base_url}/files/{100000 + i}.zip",
+                                               "text": "本地下載一", "type": "direct_link"}}}
+            for i in range(args.downloads)
+        ])
+        start = time.perf_counter()
+        asyncio.run(ComicDownloader(str(workdir / "downloads")).download_from_json(str(input_file)))
+        items = args.downloads
+
+    elapsed = time.perf_counter() - start
+    with open(args.result_file, "w", encoding="utf-8") as f:
+        json.dump({"elapsed": elapsed, "items": items, "peak_rss_mb": _peak_rss_mb()}, f)
+
+
+# --------------------------------------------------------------------------- #
+#                          父进程：调度与统计                                   #
+# --------------------------------------------------------------------------- #
+def _server_call(address: str, path: str, method: str = "GET") -> Dict:
+    with urlopen(Request(f"http://{address}{path}", method=method), timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(scenario: str, child: Dict, records: List[Dict]) -> Dict:
+    elapsed = child["elapsed"]
+    durations = [r["duration"] for r in records]
+    file_bytes = sum(r["bytes"] for r in records if r["kind"] == "file")
+    return {
+        "scenario": scenario,
+        "elapsed_s": round(elapsed, 3),
+        "items": child["items"],
+        "requests": len(records),
+        "errors": sum(1 for r in records if r["status"] >= 400),
+        "requests_per_s": round(len(records) / elapsed, 2) if elapsed else None,
+        "mb_per_s": round(file_bytes / 1024 / 1024 / elapsed, 2) if elapsed and file_bytes else None,
+        "p50_ms": round(_percentile(durations, 50) * 1000, 2) if durations else None,
+        "p99_ms": round(_percentile(durations, 99) * 1000, 2) if durations else None,
+        "peak_rss_mb": round(child["peak_rss_mb"], 1) if child["peak_rss_mb"] else None,
+    }
+
+
+def run_scenario(scenario: str, address: str, args) -> Dict:
+    with tempfile.TemporaryDirectory(prefix=f"wnacg_bench_{scenario}_") as workdir:
+        result_file = os.path.join(workdir, "result.json")
+        cmd = [
+            sys.executable, str(Path(__file__).resolve()), "--child", scenario,
+            "--server", address, "--workdir", workdir, "--result-file", result_file,
+            "--links", str(args.links), "--downloads", str(args.downloads),
+            "--shelf-total", str(args.shelf_size * args.shelves),
+        ]
+        if args.max_pages:
+            cmd += ["--max-pages", str(args.max_pages)]
+        if args.keep_delays:
+            cmd.append("--keep-delays")
+
+        _server_call(address, "/__reset", "POST")
+        output = None if args.verbose else subprocess.DEVNULL
+        proc = subprocess.run(cmd, cwd=str(ROOT_DIR), stdout=output, stderr=output)
+        if proc.returncode != 0:
+            raise RuntimeError(f"场景 {scenario} 失败，退出码 {proc.returncode}（加 --verbose 查看输出）")
+
+        with open(result_file, "r", encoding="utf-8") as f:
+            child = json.load(f)
+        records = _server_call(address, "/__stats")["records"]
+        return summarize(scenario, child, records)
+
+
+def _latest_result() -> Optional[Path]:
+    files = sorted(RESULTS_DIR.glob("*.json"))
+    return files[-1] if files else None
+
+
+def print_report(results: List[Dict], baseline: Optional[Dict]) -> None:
+    base_by_name = {r["scenario"]: r for r in (baseline or {}).get("results", [])}
+    metrics = ["elapsed_s", "requests_per_s", "mb_per_s", "p50_ms", "p99_ms", "peak_rss_mb"]
+
+    print("\n=== 基准测试结果 ===")
+    for result in results:
+        print(f"\n[{result['scenario']}] {result['items']} 项, {result['requests']} 个请求, {result['errors']} 个错误")
+        base = base_by_name.get(result["scenario"], {})
+        for metric in metrics:
+            value = result.get(metric)
+            if value is None:
+                continue
+            line = f"  {metric:<16} {value:>10}"
+            old = base.get(metric)
+            if old:
+                line += f"   (上次 {old}, {(value - old) / old * 100:+.1f}%)"
+            print(line)
+
+
+def main() -> None:
+    from mock_server import MockWnacgServer, add_server_arguments, options_from_args
+
+    parser = argparse.ArgumentParser(description="WNACG 端到端吞吐基准测试")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--links", type=int, default=60, help="links 场景的漫画数")
+    parser.add_argument("--downloads", type=int, default=8, help="download 场景的漫画数")
+    parser.add_argument("--max-pages", type=int, default=None, help="search 场景的最大页数")
+    parser.add_argument("--keep-delays", action="store_true", help="保留工具内置的防封延迟")
+    parser.add_argument("--compare", help="与指定的结果文件对比（默认与上一次结果对比）")
+    parser.add_argument("--no-save", action="store_true", help="不保存本次结果")
+    parser.add_argument("--verbose", action="store_true", help="显示各工具自身的输出")
+    add_server_arguments(parser)
+
+    # 子进程参数
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("--shelf-total", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    options = options_from_args(args)
+    server = MockWnacgServer(options)
+    address = server.start_in_thread()
+    print(f"模拟服务器: http://{address}")
+
+    results = []
+    try:
+        for scenario in args.scenarios:
+            print(f"运行场景: {scenario} ...", flush=True)
+            results.append(run_scenario(scenario, address, args))
+    finally:
+        server.stop_thread()
+
+    baseline_path = Path(args.compare) if args.compare else _latest_result()
+    baseline = None
+    if baseline_path and baseline_path.exists():
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"对比基准: {baseline_path}")
+
+    print_report(results, baseline)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"time": datetime.now().isoformat(), "server_options": vars(options),
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,32 @@
 WNACG 工具配置文件
 在这里统一管理Cookie、域名等配置信息
 """
-import requests
 import os
+import json
+import time
+from email.utils import parsedate_to_datetime
 
 # API域名配置
 API_DOMAIN = "www.wnacg01.cc"
 
+# 协议 - 连接本地测试服务器时可通过环境变量 WNACG_API_SCHEME=http 切换
+API_SCHEME = os.environ.get('WNACG_API_SCHEME', 'https')
+
+# 镜像域名列表 - 运行时会测速并自动选择最快的可用域名，当前域名失效时自动切换
+# 也可以通过环境变量 WNACG_API_DOMAINS 设置（逗号分隔）
+API_DOMAINS = [
+    API_DOMAIN,
+]
+
+# 镜像测速配置
+MIRROR_CONFIG = {
+    "probe_interval": 300,  # 后台测速间隔（秒）
+    "probe_timeout": 5,  # 单次测速超时（秒）
+    "failure_threshold": 2,  # 连续失败多少次后判定域名不可用并切换
+}
+
+_active_domain = None
+
 # 登录配置 - 请在这里填入你的登录信息
 LOGIN_CONFIG = {
     "username": "",  # 你的用户名
@@ -17,13 +37,165 @@ LOGIN_CONFIG = {
 # Cookie配置 - 可以手动填入，也可以留空让程序自动获取
 WNACG_COOKIE = ""
 
+# 额外账号 - 获取下载链接时在多个账号之间分摊请求，每个账号有独立的限速和健康状态
+# 每项为 {"username": ..., "password": ...} 或 {"name": ..., "cookie": ...}
+# 也可以通过环境变量 WNACG_ACCOUNTS 设置（"用户名:密码" 逗号分隔）
+ACCOUNTS = []
+
+ACCOUNT_POOL_CONFIG = {
+    "min_interval": 1.5,  # 单个账号两次请求之间的最小间隔（秒）
+    "max_inflight": 2,  # 单个账号同时进行的请求数
+    "max_failures": 3,  # 连续失败多少次后暂停该账号
+    "cooldown": 300,  # 暂停时长（秒）
+}
+
+# Cookie缓存配置 - 登录获取的Cookie连同过期时间保存在磁盘上，下次启动直接复用
+COOKIE_CONFIG = {
+    "cache_file": ".wnacg_cookie.json",  # 相对于本文件所在目录
+    "default_ttl_hours": 24 * 7,  # 响应中没有过期时间时使用的默认有效期
+}
+
 # 请求配置
 REQUEST_CONFIG = {
     "timeout": 10,
-    "max_retries": 3,
     "delay_between_requests": 3,  # 秒
     "batch_size": 2,  # 批量处理大小
     "max_pages": 20,  # 默认最大页数
+    "download_delay": (5, 10),  # 下载相邻两本漫画之间的随机延迟范围（秒）
+}
+
+# HTTP连接池配置（所有工具共用）
+HTTP_CONFIG = {
+    "pool_limit": 100,  # 连接池总连接数
+    "pool_limit_per_host": 10,  # 单个主机最大连接数
+    "dns_cache_ttl": 300,  # DNS缓存时间（秒）
+    "keepalive_timeout": 60,  # 空闲连接保活时间（秒）
+}
+
+# 逐页图片下载配置（gallery.py）
+GALLERY_CONFIG = {
+    # fallback: 所有压缩包链接都失败时改为逐页下载图片 / always: 总是逐页下载 / off: 不使用
+    "mode": "fallback",
+    "concurrency": 6,  # 同一本漫画并发下载的图片数
+    "image_timeout": 60,  # 单张图片超时（秒）
+}
+
+# 全局漫画ID索引（seen_index.py）
+SEEN_INDEX_CONFIG = {
+    "enabled": True,  # 获取链接/下载前跳过其他文件中已有链接或已下载的漫画
+    "file": ".seen_index",  # 索引文件名（位于 url 目录）
+    "download_dir": "downloads",  # 已下载漫画所在的下载目录（读取其中的压缩包存储）
+}
+
+# 压缩包存储配置（archive_store.py）
+STORE_CONFIG = {
+    "enabled": True,  # 下载完成的压缩包按内容哈希存储，重复的漫画不再下载
+    "dir": ".store",  # 存储目录（位于下载目录内，保证可以建立硬链接）
+    "link": "auto",  # 文件名指向存储对象的方式: auto（硬链接 → 符号链接 → 复制）/ hardlink / symlink / copy
+}
+
+# 下载后处理配置（postprocess.py）
+POSTPROCESS_CONFIG = {
+    "enabled": False,  # 下载完成后自动处理（也可用 download --postprocess 开启）
+    "workers": 0,  # 进程池大小，0 表示 CPU 核数
+    "output_dir": "library",  # 处理后的 CBZ 输出目录
+    "transcode": None,  # 图片转码格式: None（不转码）/ "webp" / "jpeg"，需要安装 Pillow
+    "quality": 80,  # 转码质量
+    "max_width": 0,  # 宽度超过该值时等比缩小，0 表示不缩放
+    "keep_archive": True,  # 处理完成后保留原压缩包
+}
+
+# 重试与熔断配置（retry.py，所有工具共用）
+RETRY_CONFIG = {
+    # 各类请求的重试策略：最多尝试次数，第n次重试前随机等待 0 ~ min(cap, base * 2**n) 秒（full jitter）
+    "page": {"max_attempts": 3, "base": 1, "cap": 30},  # 页面/封面请求
+    "download": {"max_attempts": 3, "base": 2, "cap": 60},  # 压缩包下载（每个下载链接）
+    "max_retry_after": 300,  # 服务器返回 Retry-After 时最多等待多久（秒）
+    "breaker_threshold": 5,  # 同一主机连续失败多少次后熔断
+    "breaker_cooldown": 60,  # 熔断后多久放行一个试探请求（秒）
+}
+
+# 运行指标配置 - 端口和 textfile 都为空时不输出（也可用环境变量 WNACG_METRICS_PORT / WNACG_METRICS_TEXTFILE）
+METRICS_CONFIG = {
+    "port": 0,  # HTTP /metrics 端点端口，0 表示不开启
+    "textfile": "",  # 定期写入的 textfile 路径，空表示不写
+    "textfile_interval": 15,  # textfile 写入间隔（秒）
+}
+
+# 请求追踪配置（Chrome trace JSON，默认关闭）
+TRACING_CONFIG = {
+    "output": "",  # 追踪文件路径，空表示不开启；也可用环境变量 WNACG_TRACE 或 --trace 指定
+}
+
+# 性能剖析配置（cProfile + tracemalloc，默认关闭）
+PROFILING_CONFIG = {
+    "enabled": False,  # 也可用环境变量 WNACG_PROFILE=1 或 --profile 开启
+    "output_dir": "profiles",  # .prof / .tracemalloc / 报告 的输出目录
+    "traceback_frames": 1,  # tracemalloc 记录的调用栈深度，越深越慢
+    "top": 25,  # 报告中列出的函数/代码行数
+}
+
+# 守护进程配置
+DAEMON_CONFIG = {
+    "queue_file": ".wnacg_jobs.db",  # 持久化任务队列（SQLite），相对于本文件所在目录
+    "sync_interval_minutes": 60,  # 书架/保存的查询 同步间隔
+    "shelves": [0],  # 需要同步的书架ID（0 = 全部）
+    "queries": [],  # 需要同步的查询，格式同批量查询文件，如 "keyword:关键词"、"tag:标签名"
+    "queries_file": "",  # 也可以从批量查询文件读取
+    "query_max_pages": 5,  # 每个查询最多同步的页数（遇到已入队的漫画会提前停止）
+    "link_workers": 2,  # 并发获取下载链接的任务数
+    "download_workers": 1,  # 并发下载的任务数
+    "download_dir": "downloads",
+    "max_attempts": 3,  # 单个任务最多尝试次数
+    "retry_delay": 300,  # 任务失败后多久再重试（秒）
+    # 多节点共用队列：把 queue_file 指向共享目录；网络文件系统上请把 journal_mode 改为 DELETE
+    "node_id": "",  # 节点ID，空则使用 主机名:队列文件路径（同一台机器上运行多个节点时需分别设置）
+    "lease_seconds": 120,  # 任务租约有效期，节点宕机后最多这么久任务会被其他节点接手
+    "heartbeat_seconds": 30,  # 处理期间续期租约的间隔
+    "queue_journal_mode": "WAL",
+    "queue_busy_timeout": 30,  # 等待其他节点释放数据库锁的最长时间（秒）
+    # 优先级 = shelf * 来源优先级 + size * 体积分 + age * 新近度分，数值越大越先处理
+    "priority_weights": {"shelf": 1.0, "size": 0.0, "age": 1.0},
+    "shelf_priority": {},  # 书架ID -> 来源优先级（默认 0），如 {12345: 10}
+    "query_priority": 0,  # 查询结果的来源优先级
+}
+
+# 下载调度配置
+DOWNLOAD_CONFIG = {
+    "order": "size",  # 下载顺序: size（先下小的）/ priority（按 priority 字段，大的优先）/ file（JSON中的顺序）
+    "order_window": 200,  # 每读入这么多本就探测大小、排序并开始下载（流式读取大文件时内存不随文件增长）
+    "probe_concurrency": 8,  # 并发探测压缩包大小的请求数
+    "probe_timeout": 15,  # 单个探测请求超时（秒）
+    "min_free_gb": 5,  # 磁盘剩余空间（扣除已预留部分）低于该值时暂停开始新的下载
+    "unknown_size_mb": 300,  # 探测不到大小时按该大小预留
+    "space_check_interval": 60,  # 暂停期间重新检查磁盘空间的间隔（秒）
+    "stall_min_speed_kb": 20,  # 最近 stall_window 秒的平均速度低于该值（KB/s）时放弃该链接，0 表示不检查速度
+    "stall_window": 30,  # 速度监测窗口（秒），同时也是等待下一块数据的最长时间
+}
+
+# 下载镜像历史表现配置（mirror_stats.py）
+MIRROR_STATS_CONFIG = {
+    "enabled": True,  # 按各镜像的历史成功率、TTFB、速度排列下载链接
+    "file": ".mirror_stats",  # 记录文件名（位于 url 目录）
+    "epsilon": 0.1,  # 每本漫画以该概率先试一个非最优链接，用于发现恢复正常的镜像
+    "decay": 0.9,  # 每次记录时旧的成功/失败次数乘以该系数
+    "window": 20,  # TTFB 和速度各保留的最近样本数
+    "prior_ttfb": 2.0,  # 没有记录的镜像按该 TTFB（秒）估计
+    "prior_speed_kb": 500,  # 没有记录的镜像按该速度（KB/s）估计
+    "min_speed_kb": 1,  # 估计时速度的下限（KB/s），停滞记录的速度为 0
+}
+
+# 压缩包目录探测配置（zip_probe.py）
+ZIP_PROBE_CONFIG = {
+    "enabled": False,  # 下载前用 Range 请求读取压缩包目录，按下面的条件过滤，下载后按其中的 CRC32 校验
+    "tail_bytes": 64 * 1024,  # 第一次读取的文件末尾字节数（目录较小时一次就能读完）
+    "sample_bytes": 64 * 1024,  # 读取第一张图片开头的字节数（用于获取分辨率）
+    "max_directory_mb": 16,  # 中央目录超过该大小时放弃探测
+    "min_pages": 0,  # 页数少于该值时不下载，0 表示不限
+    "max_pages": 0,  # 页数多于该值时不下载，0 表示不限
+    "min_width": 0,  # 第一页宽度小于该值（低分辨率版本）时不下载，0 表示不限
+    "verify": True,  # 下载完成后对照探测到的文件列表和 CRC32 校验
+    "cache_file": ".zip_manifests",  # 探测结果缓存（位于 url 目录，按漫画ID保存）
 }
 
 # User-Agent配置
@@ -33,14 +205,97 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 DIRECTORIES = {
     "search_results": "search_results",  # 搜索结果和书架信息存储目录
     "downloads": "url",  # 下载链接存储目录
+    "covers": "covers",  # 封面缓存目录
+}
+
+# 封面缓存配置
+COVER_CONFIG = {
+    "concurrency": 8,  # 并发下载封面数
+    "max_cache_mb": 1024,  # 缓存总大小上限（MB），超出后按最近最少使用淘汰
+}
+
+# 封面去重配置（cover_dedupe.py，需要 Pillow）
+COVER_DEDUPE_CONFIG = {
+    "enabled": True,  # 获取下载链接前，跳过封面与已下载漫画相似的漫画（重新上传的同一作品）
+    "max_distance": 4,  # 64 位 dHash 的最大汉明距离，越大越容易误判
+    "library_dir": "downloads",  # 已下载漫画所在的下载目录（读取其中的压缩包存储）
 }
 
 # 搜索配置
 SEARCH_CONFIG = {
     "min_similarity": 0.3,  # 最小相似度阈值
     "page_size": 24,  # 每页结果数
+    "batch_workers": 4,  # 批量搜索并发查询数
+    "batch_min_interval": 0.5,  # 批量搜索共享限速：两次请求最小间隔（秒）
+    "high_similarity": 0.8,  # 高度匹配阈值
+    "stream_top_k": 50,  # 流式搜索保留的最佳结果数
+    "stream_enough_high": 10,  # 流式搜索：高度匹配达到该数量后提前结束
+    "stream_empty_page_patience": 2,  # 流式搜索：连续多少页无匹配后提前结束
 }
 
+def _cookie_cache_path(account=None):
+    """Cookie缓存文件路径；额外账号各自使用 <缓存文件名>.<账号>.json"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), COOKIE_CONFIG['cache_file'])
+    if account:
+        base, ext = os.path.splitext(path)
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in account)
+        path = f"{base}.{safe}{ext}"
+    return path
+
+def parse_cookie_expiry(set_cookie: str) -> float:
+    """从 Set-Cookie 头中解析最早的过期时间（时间戳），没有则使用默认有效期"""
+    now = time.time()
+    expiries = []
+    for part in set_cookie.split(';'):
+        key, _, value = part.strip().partition('=')
+        key = key.strip().lower()
+        if key == 'max-age':
+            try:
+                expiries.append(now + int(value))
+            except ValueError:
+                pass
+        elif key == 'expires':
+            # expires 值本身可能带逗号（如 "Wed, 01-Jan-2025 00:00:00 GMT"），截到 GMT 为止
+            value = value.split('GMT')[0].strip() + ' GMT'
+            try:
+                expiries.append(parsedate_to_datetime(value.replace('-', ' ')).timestamp())
+            except (TypeError, ValueError):
+                pass
+    future = [t for t in expiries if t > now]
+    if future:
+        return min(future)
+    return now + COOKIE_CONFIG['default_ttl_hours'] * 3600
+
+def load_cached_cookie(account=None):
+    """读取磁盘上未过期的Cookie缓存，没有或已过期返回 None"""
+    try:
+        with open(_cookie_cache_path(account), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, OSError):
+        return None
+    
+    cookie = data.get('cookie')
+    if not cookie or data.get('expires_at', 0) <= time.time():
+        return None
+    return cookie
+
+def save_cached_cookie(cookie: str, expires_at: float = None, account=None):
+    """将Cookie及其过期时间保存到磁盘"""
+    if expires_at is None:
+        expires_at = parse_cookie_expiry(cookie)
+    path = _cookie_cache_path(account)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'cookie': cookie, 'expires_at': expires_at, 'saved_at': time.time()}, f)
+    os.replace(tmp_path, path)
+
+def invalidate_cached_cookie(account=None):
+    """删除磁盘上的Cookie缓存（会话已失效时调用）"""
+    try:
+        os.remove(_cookie_cache_path(account))
+    except FileNotFoundError:
+        pass
+
 def _login_and_get_cookie(username: str = None, password: str = None) -> str:
     """登录 WNACG 并获取 cookie"""
     # 如果没有提供用户名密码，从配置文件获取
@@ -52,11 +307,12 @@ def _login_and_get_cookie(username: str = None, password: str = None) -> str:
         "login_pass": password,
     }
     headers = get_headers()
+    import requests  # 只有登录时才需要，避免拖慢启动
 
-    print(f"正在登录 {API_DOMAIN}...")
+    print(f"正在登录 {get_api_domain()}...")
     
     # 发送登录请求
-    resp = requests.post(f"https://{API_DOMAIN}/users-check_login.html",
+    resp = requests.post(api_url("/users-check_login.html"),
                          data=data, headers=headers)
     if resp.status_code != 200:
         raise RuntimeError(f"登录请求失败，状态码: {resp.status_code}")
@@ -72,10 +328,11 @@ def _login_and_get_cookie(username: str = None, password: str = None) -> str:
         raise RuntimeError(f"响应中没有找到cookie: {login_resp}")
 
     print("✓ 登录成功，已获取cookie")
+    save_cached_cookie(cookie)
     return cookie
 
 def get_cookie():
-    """获取Cookie，优先级：配置文件 > 环境变量 > 自动登录获取"""
+    """获取Cookie，优先级：配置文件 > 环境变量 > 磁盘缓存 > 自动登录获取"""
     
     # 1. 优先使用配置文件中的cookie
     if WNACG_COOKIE:
@@ -86,16 +343,17 @@ def get_cookie():
     if env_cookie:
         return env_cookie
     
-    # 3. 自动登录获取cookie
+    # 3. 使用磁盘上未过期的缓存cookie
+    cached_cookie = load_cached_cookie()
+    if cached_cookie:
+        return cached_cookie
+    
+    # 4. 自动登录获取cookie
     try:
         print("配置文件和环境变量中都没有找到cookie，尝试自动登录获取...")
         cookie = _login_and_get_cookie()
         
-        # 提示用户可以将cookie保存到配置文件中
-        print("\n" + "="*50)
-        print("建议将以下cookie复制到config.py的WNACG_COOKIE变量中，避免频繁登录：")
-        print(f'WNACG_COOKIE = "{cookie}"')
-        print("="*50 + "\n")
+        print(f"cookie已缓存到 {_cookie_cache_path()}，过期前无需重新登录")
         
         return cookie
     except Exception as e:
@@ -114,6 +372,40 @@ def get_login_config():
     
     return username, password
 
+def get_accounts():
+    """额外账号列表，环境变量 WNACG_ACCOUNTS 优先（格式 "用户名:密码,用户名:密码"）"""
+    env_accounts = os.environ.get('WNACG_ACCOUNTS')
+    if env_accounts:
+        accounts = []
+        for item in env_accounts.split(','):
+            username, sep, password = item.strip().partition(':')
+            if sep and username and password:
+                accounts.append({"username": username, "password": password})
+        return accounts
+    return list(ACCOUNTS)
+
+def get_api_domains():
+    """获取镜像域名列表，环境变量优先"""
+    env_domains = os.environ.get('WNACG_API_DOMAINS')
+    if env_domains:
+        domains = [d.strip() for d in env_domains.split(',') if d.strip()]
+        if domains:
+            return domains
+    return list(API_DOMAINS) or [API_DOMAIN]
+
+def get_api_domain():
+    """获取当前选用的域名"""
+    return _active_domain or get_api_domains()[0]
+
+def set_api_domain(domain):
+    """切换当前选用的域名"""
+    global _active_domain
+    _active_domain = domain
+
+def api_url(path, domain=None):
+    """用当前选用的域名（或指定域名）拼接完整URL，path 以 / 开头"""
+    return f"{API_SCHEME}://{domain or get_api_domain()}{path}"
+
 def get_headers(referer=None):
     """获取标准请求头"""
     headers = {
@@ -123,7 +415,7 @@ def get_headers(referer=None):
     if referer:
         headers["referer"] = referer
     else:
-        headers["referer"] = f"https://{API_DOMAIN}/"
+        headers["referer"] = api_url("/")
     
     return headers
 
@@ -142,8 +434,8 @@ def validate_config():
     """验证配置是否有效"""
     errors = []
     
-    if not API_DOMAIN:
-        errors.append("API_DOMAIN 不能为空")
+    if not get_api_domains():
+        errors.append("API_DOMAINS 不能为空")
     
     # 验证登录配置
     try:
@@ -169,7 +461,7 @@ def validate_config():
 
 if __name__ == "__main__":
     print("=== WNACG 配置文件检查 ===")
-    print(f"API域名: {API_DOMAIN}")
+    print(f"API域名: {', '.join(get_api_domains())}")
     
     try:
         cookie = get_cookie()
@@ -0,0 +1,210 @@
+"""
+封面缓存工具
+并发预取搜索结果/书架文件中所有漫画的封面，保存到按内容寻址的本地磁盘缓存，
+缓存总大小超出上限时按最近最少使用（LRU）淘汰，可按漫画ID直接查找
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from tqdm import tqdm
+
+# 从配置文件导入
+from config import COVER_CONFIG, DIRECTORIES, REQUEST_CONFIG
+from http_client import create_session, HTTPStatusError
+from retry import PAGE_POLICY, CircuitOpenError
+import profiling
+
+
+class CoverCache:
+    """按内容寻址的封面磁盘缓存
+
+    - 图片按 sha256 存放在 objects/<前两位>/<sha256><扩展名>，相同内容只存一份
+    - index.json 记录 漫画ID -> 内容哈希 的映射，以及每个对象的大小和最近访问时间
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['covers'])
+        if max_bytes is None:
+            max_bytes = COVER_CONFIG['max_cache_mb'] * 1024 * 1024
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.index_path = self.cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.comics: Dict[str, Dict] = {}   # 漫画ID -> {"hash", "url"}
+        self.objects: Dict[str, Dict] = {}  # 内容哈希 -> {"path", "size", "last_access"}
+        self._dirty = False  # 有尚未保存的访问时间
+        self._load_index()
+        self.total_bytes = sum(obj["size"] for obj in self.objects.values())
+
+    # ---------- 索引读写 ---------- #
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.comics = data.get("comics", {})
+        self.objects = data.get("objects", {})
+
+    def save_index(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"comics": self.comics, "objects": self.objects}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def flush(self) -> None:
+        """保存 get_path 更新的访问时间，否则下次运行的 LRU 淘汰只能按写入顺序"""
+        if self._dirty:
+            self.save_index()
+
+    # ---------- 查找 ---------- #
+    def get_path(self, comic_id) -> Optional[Path]:
+        """按漫画ID查找封面文件路径，未缓存返回 None"""
+        entry = self.comics.get(str(comic_id))
+        if not entry:
+            return None
+        obj = self.objects.get(entry["hash"])
+        if not obj:
+            return None
+        path = self.cache_dir / obj["path"]
+        if not path.exists():
+            return None
+        # 查找很频繁，访问时间只在内存中更新，由调用方在一批查找后 flush
+        obj["last_access"] = time.time()
+        self._dirty = True
+        return path
+
+    def __contains__(self, comic_id) -> bool:
+        entry = self.comics.get(str(comic_id))
+        return bool(entry) and entry["hash"] in self.objects
+
+    # ---------- 写入 & 淘汰 ---------- #
+    def put(self, comic_id, url: str, data: bytes) -> Path:
+        """写入一张封面，返回缓存文件路径"""
+        digest = hashlib.sha256(data).hexdigest()
+        obj = self.objects.get(digest)
+        if obj is None:
+            ext = os.path.splitext(urlparse(url).path)[1].lower() or ".jpg"
+            rel_path = f"objects/{digest[:2]}/{digest}{ext}"
+            path = self.cache_dir / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            obj = {"path": rel_path, "size": len(data)}
+            self.objects[digest] = obj
+            self.total_bytes += len(data)
+        obj["last_access"] = time.time()
+        self.comics[str(comic_id)] = {"hash": digest, "url": url}
+        self.evict()
+        return self.cache_dir / obj["path"]
+
+    def evict(self) -> int:
+        """按最近最少使用淘汰对象，直到总大小不超过上限，返回淘汰的对象数"""
+        if self.total_bytes <= self.max_bytes:
+            return 0
+
+        evicted = set()
+        for digest, obj in sorted(self.objects.items(), key=lambda item: item[1].get("last_access", 0)):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                (self.cache_dir / obj["path"]).unlink()
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= obj["size"]
+            evicted.add(digest)
+
+        for digest in evicted:
+            del self.objects[digest]
+        self.comics = {cid: entry for cid, entry in self.comics.items() if entry["hash"] not in evicted}
+        return len(evicted)
+
+
+async def fetch_cover(session: aiohttp.ClientSession, url: str) -> bytes:
+    """获取封面，按统一策略重试；图片服务器熔断时立即失败"""
+    async def attempt() -> bytes:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                raise HTTPStatusError(resp.status)
+            return await resp.read()
+
+    return await PAGE_POLICY.run(attempt, host=urlparse(url).netloc, component="cover")
+
+
+async def prefetch_covers(comics: Iterable[Dict], cache: CoverCache, concurrency: Optional[int] = None) -> Dict[str, int]:
+    """以有限并发预取所有封面，已缓存的漫画会被跳过"""
+    if concurrency is None:
+        concurrency = COVER_CONFIG['concurrency']
+
+    pending = [c for c in comics if c.get("id") is not None and c.get("cover") and c["id"] not in cache]
+    stats = {"fetched": 0, "failed": 0}
+    if not pending:
+        return stats
+
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_CONFIG['timeout'] * 3)
+
+    async with create_session(timeout=timeout, limit_per_host=concurrency) as session:
+        with tqdm(total=len(pending), desc="封面预取", dynamic_ncols=True) as bar:
+            async def fetch_one(comic):
+                async with semaphore:
+                    try:
+                        data = await fetch_cover(session, comic["cover"])
+                        cache.put(comic["id"], comic["cover"], data)
+                        stats["fetched"] += 1
+                    except (asyncio.TimeoutError, aiohttp.ClientError, HTTPStatusError, CircuitOpenError) as e:
+                        stats["failed"] += 1
+                        tqdm.write(f"✗ 封面获取失败 (ID: {comic['id']}): {e}")
+                    except OSError as e:
+                        # 写入缓存失败（磁盘满、权限等）只算这一张失败，不中断整个预取
+                        stats["failed"] += 1
+                        tqdm.write(f"✗ 封面写入失败 (ID: {comic['id']}): {e}")
+                    finally:
+                        bar.update(1)
+
+            await asyncio.gather(*(fetch_one(c) for c in pending))
+
+    cache.save_index()
+    return stats
+
+
+async def main(json_file: str) -> None:
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"读取 JSON 失败: {e}")
+        return
+
+    comics = data.get("comics", [])
+    cache = CoverCache()
+    print(f"共 {len(comics)} 本漫画，缓存目录: {cache.cache_dir}")
+
+    stats = await prefetch_covers(comics, cache)
+    cached = sum(1 for c in comics if c.get("id") in cache)
+    print(f"新获取: {stats['fetched']} | 失败: {stats['failed']} | 已缓存: {cached}/{len(comics)}")
+    print(f"缓存占用: {cache.total_bytes / 1024 / 1024:.1f} MB / {cache.max_bytes / 1024 / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
+    if len(sys.argv) < 2:
+        print("用法: python cover_cache.py <搜索结果/书架/下载链接 JSON 文件> [--profile]")
+        sys.exit(1)
+    try:
+        asyncio.run(main(sys.argv[1]))
+    except KeyboardInterrupt:
+        print("\n用户取消")
@@ -0,0 +1,256 @@
+"""
+封面感知哈希去重
+同一作品常以新的漫画ID重新上传，ID 不同，按 ID 去重无法识别。获取下载链接之前先比较封面：
+- 每张封面缩放为 9x8 灰度图，比较相邻像素得到 64 位差值哈希（dHash），整批一起计算
+  （安装 numpy 时向量化，否则逐张计算）；
+- 已下载漫画（压缩包存储中的漫画ID）的封面哈希放入 BK 树，按汉明距离查找相近的封面；
+- 距离不超过 max_distance 的漫画标记为 duplicate_of，不再获取下载链接，也不会被下载。
+封面来自 cover_cache.py 的缓存，哈希按封面内容保存在 covers/phash.json，不会重复计算。
+需要 Pillow（pip install Pillow）。
+
+用法: python cover_dedupe.py <搜索结果/书架 JSON 文件>
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 从配置文件导入
+from config import COVER_DEDUPE_CONFIG
+from cover_cache import CoverCache, prefetch_covers
+from archive_store import ArchiveStore
+import tracing
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖，没有时不做封面去重
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，只用于整批向量化计算
+    np = None
+
+HASH_WIDTH, HASH_HEIGHT = 9, 8  # 每行 9 个像素产生 8 位，共 64 位
+
+
+# --------------------------------------------------------------------------- #
+#                                  感知哈希                                    #
+# --------------------------------------------------------------------------- #
+def _thumbnail(data: bytes) -> Optional[bytes]:
+    """解码封面并缩放为 9x8 灰度像素，无法解码时返回 None"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.convert("L").resize((HASH_WIDTH, HASH_HEIGHT), Image.LANCZOS).tobytes()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _dhash_python(pixels: bytes) -> int:
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for col in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col + 1] > pixels[offset + col])
+    return value
+
+
+def dhash_batch(images: List[bytes]) -> List[Optional[int]]:
+    """计算一批封面的 dHash；无法解码的图片对应 None"""
+    thumbs = [_thumbnail(data) for data in images]
+    valid = [t for t in thumbs if t is not None]
+    if np is not None and valid:
+        pixels = np.frombuffer(b"".join(valid), dtype=np.uint8).reshape(-1, HASH_HEIGHT, HASH_WIDTH)
+        bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+        packed = np.packbits(bits.reshape(len(valid), -1), axis=1)
+        hashes = iter(int.from_bytes(row.tobytes(), "big") for row in packed)
+    else:
+        hashes = iter(_dhash_python(t) for t in valid)
+    return [next(hashes) if t is not None else None for t in thumbs]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树：查找半径 r 内的哈希只需访问距离在 [d-r, d+r] 内的子树"""
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [哈希, 条目列表, {距离: 子节点}]
+        self.size = 0
+
+    def add(self, value: int, item) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """返回距离不超过 radius 的 (距离, 条目)，按距离排序"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def __len__(self) -> int:
+        return self.size
+
+
+# --------------------------------------------------------------------------- #
+#                                  去重                                       #
+# --------------------------------------------------------------------------- #
+class CoverDedupe:
+    """已下载漫画的封面哈希索引，用于在获取下载链接前标记疑似重复的漫画"""
+
+    def __init__(self, library_dir: Optional[str] = None, cache: Optional[CoverCache] = None,
+                 max_distance: Optional[int] = None):
+        self.cache = cache or CoverCache()
+        self.max_distance = COVER_DEDUPE_CONFIG['max_distance'] if max_distance is None else max_distance
+        self.store = ArchiveStore(library_dir or COVER_DEDUPE_CONFIG['library_dir'])
+        self.hash_path = self.cache.cache_dir / "phash.json"
+        self.hashes: Dict[str, str] = {}  # 封面内容哈希 -> dHash（16位十六进制）
+        self.tree = BKTree()
+        self._indexed = set()
+        self._load_hashes()
+
+    @classmethod
+    def from_config(cls) -> Optional["CoverDedupe"]:
+        """按配置创建；未启用或缺少 Pillow 时返回 None"""
+        if not COVER_DEDUPE_CONFIG['enabled']:
+            return None
+        if Image is None:
+            print("未安装 Pillow（pip install Pillow），跳过封面去重")
+            return None
+        return cls()
+
+    def _load_hashes(self) -> None:
+        try:
+            with open(self.hash_path, "r", encoding="utf-8") as f:
+                self.hashes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.hashes = {}
+
+    def save_hashes(self) -> None:
+        self.hash_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.hash_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_path, self.hash_path)
+
+    async def _hash_covers(self, comic_ids: Iterable) -> Dict[str, int]:
+        """漫画ID -> 封面 dHash；已计算过的封面直接读取，其余整批计算"""
+        result, missing = {}, []
+        for comic_id in comic_ids:
+            entry = self.cache.comics.get(str(comic_id))
+            path = self.cache.get_path(comic_id)
+            if entry is None or path is None:
+                continue
+            known = self.hashes.get(entry["hash"])
+            if known is not None:
+                result[str(comic_id)] = int(known, 16)
+            else:
+                missing.append((str(comic_id), entry["hash"], path))
+        self.cache.flush()  # 保存这批封面的访问时间
+
+        if missing:
+            images = [path.read_bytes() for _, _, path in missing]
+            with tracing.span("cover_dhash", "cpu", count=len(images)):
+                hashes = await asyncio.to_thread(dhash_batch, images)
+            for (comic_id, content_hash, _), value in zip(missing, hashes):
+                if value is None:
+                    continue
+                self.hashes[content_hash] = f"{value:016x}"
+                result[comic_id] = value
+            self.save_hashes()
+        return result
+
+    async def refresh_library(self) -> int:
+        """把新下载（尚未加入索引）的漫画封面加入 BK 树，返回索引中的漫画数"""
+        self.store = ArchiveStore(self.store.download_dir)  # 重新读取索引，包含本次运行期间的下载
+        new_ids = [cid for cid in self.store.comics if cid not in self._indexed]
+        for comic_id, value in (await self._hash_covers(new_ids)).items():
+            self.tree.add(value, comic_id)
+            self._indexed.add(comic_id)
+        return len(self._indexed)
+
+    async def find_duplicates(self, comics: List[Dict]) -> Dict[str, Tuple[str, int]]:
+        """返回 漫画ID -> (已下载的相似漫画ID, 汉明距离)，并在漫画记录上标记 duplicate_of"""
+        # 即使还没有已下载的漫画也先缓存封面，这些漫画下载后就能加入索引
+        candidates = [c for c in comics if c.get("id") is not None and c.get("cover")]
+        await prefetch_covers(candidates, self.cache)
+        await self.refresh_library()
+        if not len(self.tree):
+            return {}
+
+        hashes = await self._hash_covers(c["id"] for c in candidates)
+
+        duplicates = {}
+        for comic in candidates:
+            comic_id = str(comic["id"])
+            value = hashes.get(comic_id)
+            if value is None:
+                continue
+            matches = [(d, other) for d, other in self.tree.search(value, self.max_distance) if other != comic_id]
+            if matches:
+                distance, other = matches[0]
+                duplicates[comic_id] = (other, distance)
+                comic["duplicate_of"] = int(other) if other.isdigit() else other
+        return duplicates
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+async def main(json_file: str) -> int:
+    if Image is None:
+        print("封面去重需要 Pillow: pip install Pillow")
+        return 1
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            comics = json.load(f).get("comics", [])
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"读取 JSON 失败: {e}")
+        return 1
+
+    dedupe = CoverDedupe()
+    indexed = await dedupe.refresh_library()
+    print(f"已下载漫画中有封面的: {indexed} 本")
+    duplicates = await dedupe.find_duplicates(comics)
+    titles = {str(c.get("id")): c.get("title", "") for c in comics}
+    for comic_id, (other, distance) in duplicates.items():
+        print(f"  {titles.get(comic_id, '')} (ID: {comic_id}) ≈ 已下载 ID {other}，距离 {distance}")
+    print(f"疑似重复: {len(duplicates)}/{len(comics)} 本")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python cover_dedupe.py <搜索结果/书架 JSON 文件>")
+        sys.exit(1)
+    try:
+        sys.exit(asyncio.run(main(sys.argv[1])))
+    except KeyboardInterrupt:
+        print("\n用户取消")
+        sys.exit(130)
@@ -0,0 +1,397 @@
+"""
+守护进程模式
+替代 cron 串联 get_shelf_info.py → get_url.py → download.py 的做法：只启动一次，
+整个运行期间共用一个事件循环和一个连接池会话，定期增量同步配置的书架和保存的查询，
+把新漫画放进持久化优先级队列（job_queue），由后台任务依次获取下载链接并下载。
+
+增量同步：收藏夹和搜索结果都是新的在前，某一页上的漫画全部已入过队时就停止翻页，
+因此只有第一次运行会完整抓取。
+
+停止：收到 SIGINT/SIGTERM 后不再取新任务，等待进行中的任务完成后退出；再按一次立即退出，
+未完成的任务在下次启动时自动放回队列。
+
+多节点：把 DAEMON_CONFIG['queue_file']（或 --queue）指向共享目录中的同一个文件，
+一个节点负责同步，其余节点用 --no-sync 只处理任务。任务带租约并由心跳续期，
+节点宕机后租约过期，任务会被其他节点接手。
+
+用法:
+  python daemon.py            # 持续运行
+  python daemon.py --once     # 同步一次并处理完队列后退出（适合 cron）
+  python daemon.py --status   # 查看队列状态
+  python daemon.py --no-sync --queue /mnt/shared/wnacg_jobs.db   # 只处理任务的工作节点
+"""
+import argparse
+import asyncio
+import re
+import signal
+import sys
+from dataclasses import asdict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+# 从配置文件导入
+from config import get_cookie, DAEMON_CONFIG, REQUEST_CONFIG
+from http_client import create_session, fetch_text
+from mirrors import mirror_probing
+from retry import CircuitOpenError
+from job_queue import JobQueue, Job, LINKS, DOWNLOAD, default_node_id
+from get_shelf_info import get_favorite
+from get_url import get_download_links
+from account_pool import get_account_pool
+from search_id import (
+    keyword_search_request, tag_search_request, parse_search_result,
+    load_batch_queries, extract_create_date
+)
+from download import ComicDownloader
+import metrics
+import tracing
+import profiling
+
+IDLE_POLL_SECONDS = 5
+
+
+def _page_count(comic: Dict) -> Optional[int]:
+    match = re.search(r'(\d+)\s*張', comic.get('additional_info', ''))
+    return int(match.group(1)) if match else None
+
+
+def comic_priority(comic: Dict, source_priority: float) -> float:
+    """按 DAEMON_CONFIG['priority_weights'] 计算优先级，数值越大越先处理
+
+    shelf: 来源（书架/查询）的优先级
+    size:  页数越少分数越高（每100页 -1），未知时为 0
+    age:   越新分数越高（每30天 -1），使用创建/收藏日期，未知时为 0
+    """
+    weights = DAEMON_CONFIG['priority_weights']
+    pages = _page_count(comic)
+    size_score = -pages / 100 if pages else 0.0
+
+    created = extract_create_date(comic) or extract_create_date(
+        {"additional_info": comic.get('favorite_time', '')})
+    age_score = -(date.today() - created).days / 30 if created else 0.0
+
+    return (weights.get('shelf', 0) * source_priority
+            + weights.get('size', 0) * size_score
+            + weights.get('age', 0) * age_score)
+
+
+def configured_queries() -> List[Tuple[str, str]]:
+    """DAEMON_CONFIG 中的查询加上查询文件中的查询，格式同批量查询文件"""
+    queries = []
+    for line in DAEMON_CONFIG['queries']:
+        prefix, sep, rest = line.partition(':')
+        if sep and prefix.strip().lower() in ('keyword', 'tag'):
+            queries.append((prefix.strip().lower(), rest.strip()))
+        else:
+            queries.append(('keyword', line.strip()))
+    if DAEMON_CONFIG['queries_file']:
+        queries.extend(load_batch_queries(DAEMON_CONFIG['queries_file']))
+    return list(dict.fromkeys(q for q in queries if q[1]))
+
+
+class Daemon:
+    def __init__(self, cookie: str, queue: Optional[JobQueue] = None, once: bool = False,
+                 sync: bool = True, node_id: Optional[str] = None):
+        self.cookie = cookie
+        self.queue = queue or JobQueue()
+        self.once = once
+        self.sync = sync
+        self.node_id = node_id or default_node_id(self.queue.path)
+        self.downloader = ComicDownloader(DAEMON_CONFIG['download_dir'])
+        self.pool = get_account_pool()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stopping = asyncio.Event()
+        self.wakeup = asyncio.Event()  # 有新任务入队或需要停止时唤醒空闲的任务
+        self.sync_done = asyncio.Event()
+        self.busy = {LINKS: 0, DOWNLOAD: 0}
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- 运行与停止 ---------- #
+    async def run(self) -> None:
+        # 队列操作可能等待其他节点释放数据库锁，都放到线程中执行，不阻塞事件循环
+        recovered = await asyncio.to_thread(self.queue.recover, self.node_id)
+        if recovered:
+            print(f"上次未完成的 {recovered} 个任务已放回队列")
+        print(f"节点 {self.node_id} 启动，队列: {self.queue.path}")
+        self._install_signal_handlers()
+
+        async with create_session() as session, mirror_probing(session):
+            self.session = session
+            # 配置了账号池时，获取链接的并发数随账号数增长
+            link_workers = max(DAEMON_CONFIG['link_workers'], self.pool.concurrency if self.pool else 0)
+            self._tasks = [asyncio.create_task(self._worker(LINKS, self.resolve_links), name=f"links-{i}")
+                           for i in range(link_workers)]
+            self._tasks += [asyncio.create_task(self._worker(DOWNLOAD, self.download), name=f"download-{i}")
+                            for i in range(DAEMON_CONFIG['download_workers'])]
+            if self.sync:
+                self._tasks.append(asyncio.create_task(self._sync_loop(), name="sync"))
+            else:
+                self.sync_done.set()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # 后处理在进程池中进行，退出前等它们完成，避免留下 .part 文件
+        await self.downloader.close_postprocessor()
+
+        await self._update_queue_metrics()
+        print(f"守护进程已退出，队列状态: {await asyncio.to_thread(self.queue.counts)}")
+
+    def request_stop(self) -> None:
+        if not self.stopping.is_set():
+            print("\n正在停止：不再接收新任务，等待进行中的任务完成（再按一次立即退出）")
+            self.stopping.set()
+            self.wakeup.set()
+            return
+        print("\n立即退出，未完成的任务下次启动时会重新处理")
+        for task in self._tasks:
+            task.cancel()
+
+    def _install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows 不支持，Ctrl+C 时直接退出，任务在下次启动时恢复
+                pass
+
+    async def _sleep(self, seconds: float) -> None:
+        """可被停止信号打断的等待"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout=IDLE_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    # ---------- 同步 ---------- #
+    async def _sync_loop(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                await self.sync_once()
+            except Exception as e:
+                print(f"同步失败: {e}")
+            self.sync_done.set()
+            self.wakeup.set()
+            if self.once:
+                return
+            await self._sleep(DAEMON_CONFIG['sync_interval_minutes'] * 60)
+
+    async def sync_once(self) -> int:
+        added = 0
+        for shelf_id in DAEMON_CONFIG['shelves']:
+            if self.stopping.is_set():
+                break
+            with tracing.span("sync_shelf", shelf_id=shelf_id):
+                added += await self.sync_shelf(shelf_id)
+        for search_type, query in configured_queries():
+            if self.stopping.is_set():
+                break
+            with tracing.span("sync_query", query=f"{search_type}:{query}"):
+                added += await self.sync_query(search_type, query)
+        await self._update_queue_metrics()
+        print(f"同步完成：新增 {added} 本，队列状态: {await asyncio.to_thread(self.queue.counts)}")
+        return added
+
+    async def _enqueue(self, comics: List[Dict], source: str, source_priority: float) -> int:
+        def push_all() -> int:
+            return sum(self.queue.push(LINKS, comic['id'], dict(comic, source=source),
+                                       comic_priority(comic, source_priority))
+                       for comic in comics)
+
+        added = await asyncio.to_thread(push_all)
+        if added:
+            self.wakeup.set()
+        return added
+
+    async def sync_shelf(self, shelf_id: int) -> int:
+        source_priority = DAEMON_CONFIG['shelf_priority'].get(shelf_id, 0)
+        added, page = 0, 1
+        while not self.stopping.is_set():
+            result = await get_favorite(self.session, self.cookie, shelf_id, page)
+            comics = [asdict(comic) for comic in result.comics]
+            new = await self._enqueue(comics, f"shelf:{shelf_id}", source_priority)
+            added += new
+            # 这一页全部已入过队，说明后面都是旧数据
+            if not comics or new == 0 or page >= result.total_page:
+                break
+            page += 1
+            await self._sleep(REQUEST_CONFIG['delay_between_requests'])
+        if added:
+            print(f"书架 {shelf_id}: 新增 {added} 本")
+        return added
+
+    async def sync_query(self, search_type: str, query: str) -> int:
+        build = tag_search_request if search_type == 'tag' else keyword_search_request
+        added = 0
+        for page in range(1, DAEMON_CONFIG['query_max_pages'] + 1):
+            if self.stopping.is_set():
+                break
+            url, params = build(query, page)
+            text, _ = await fetch_text(self.session, url, params=params)
+            result = parse_search_result(text, is_tag=search_type == 'tag')
+            new = await self._enqueue(result['comics'], f"{search_type}:{query}", DAEMON_CONFIG['query_priority'])
+            added += new
+            if not result['comics'] or new == 0 or page >= result['total_page']:
+                break
+            await self._sleep(REQUEST_CONFIG['delay_between_requests'])
+        if added:
+            print(f"查询 {search_type}:{query}: 新增 {added} 本")
+        return added
+
+    # ---------- 任务处理 ---------- #
+    async def _worker(self, kind: str, handler) -> None:
+        while not self.stopping.is_set():
+            job = await asyncio.to_thread(self.queue.claim, kind, self.node_id)
+            if job is None:
+                self.wakeup.clear()
+                # --once：同步完成且不会再有新的下载任务产生时退出；
+                # 最后再查一次本类队列，链接任务可能在上面的 claim 之后才入队了下载任务
+                if self.once and self.sync_done.is_set() and self.busy[LINKS] == 0 \
+                        and await asyncio.to_thread(self.queue.ready_count, LINKS) == 0 \
+                        and await asyncio.to_thread(self.queue.ready_count, kind) == 0:
+                    return
+                await self._idle()
+                continue
+
+            self.busy[kind] += 1
+            metrics.INFLIGHT.inc(1, f"daemon_{kind}")
+            work = asyncio.ensure_future(handler(job))
+            lease = _LeaseKeeper(self.queue, job, work)
+            try:
+                await work
+            except asyncio.CancelledError:
+                if not lease.lost:
+                    self.queue.release(job)  # 任务正在被取消，直接执行，确保放回队列
+                    raise
+                # 租约丢失被心跳取消：任务已由其他节点接手，继续领取下一个
+                print(f"[{kind}] {job.payload.get('title', job.comic_id)} 租约已丢失，放弃处理")
+            except CircuitOpenError as e:
+                # 主机熔断中：不计入失败次数，冷却结束后再处理
+                print(f"[{kind}] {job.payload.get('title', job.comic_id)} 暂缓: {e}")
+                await asyncio.to_thread(self.queue.release, job, e.retry_in)
+            except Exception as e:
+                await self._fail(job, str(e) or type(e).__name__)
+            finally:
+                lease.stop()
+                self.busy[kind] -= 1
+                metrics.INFLIGHT.dec(1, f"daemon_{kind}")
+            await self._update_queue_metrics()
+
+            delay = REQUEST_CONFIG['delay_between_requests'] if kind == LINKS \
+                else REQUEST_CONFIG['download_delay'][0]
+            await self._sleep(delay)
+
+    async def _fail(self, job: Job, error: str) -> None:
+        title = job.payload.get('title', job.comic_id)
+        retry = await asyncio.to_thread(self.queue.fail, job, error, DAEMON_CONFIG['retry_delay'])
+        if retry is None:
+            print(f"[{job.kind}] {title} 失败，但租约已被其他节点接手，不记录: {error}")
+        elif retry:
+            print(f"[{job.kind}] {title} 失败，稍后重试: {error}")
+        else:
+            print(f"[{job.kind}] {title} 失败 {job.attempts + 1} 次，放弃: {error}")
+
+    async def resolve_links(self, job: Job) -> None:
+        links = await get_download_links(self.session, self.cookie, job.comic_id, self.pool)
+        if not links:
+            await self._fail(job, "没有找到下载链接")
+            return
+        # 完成和入队下载任务在同一个事务里，租约已丢失时两者都不会发生
+        if await asyncio.to_thread(self.queue.complete, job, (DOWNLOAD, dict(job.payload, download_links=links))):
+            self.wakeup.set()
+
+    async def download(self, job: Job) -> None:
+        print(f"开始下载: {job.payload.get('title')}")
+        # 所有下载主机都在熔断中时抛出 CircuitOpenError，由 run 放回队列，不消耗重试次数
+        if await self.downloader.download_comic(self.session, job.payload, defer_circuit_open=True):
+            if not await asyncio.to_thread(self.queue.complete, job):
+                print(f"{job.payload.get('title')} 下载完成，但租约已被其他节点接手，不重复记录")
+        else:
+            await self._fail(job, "所有下载链接均失败")
+
+    async def _update_queue_metrics(self) -> None:
+        links, downloads = await asyncio.to_thread(
+            lambda: (self.queue.pending_count(LINKS), self.queue.pending_count(DOWNLOAD)))
+        metrics.QUEUE_DEPTH.set(links, "daemon_links")
+        metrics.QUEUE_DEPTH.set(downloads, "daemon_download")
+
+
+class _LeaseKeeper:
+    """任务处理期间定期续期租约；续期失败（租约已被其他节点接手）时取消处理"""
+
+    def __init__(self, queue: JobQueue, job: Job, work: asyncio.Future):
+        self.queue = queue
+        self.job = job
+        self.work = work
+        self.lost = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self.work.done():
+            await asyncio.sleep(DAEMON_CONFIG['heartbeat_seconds'])
+            if self.work.done():
+                return
+            if not await asyncio.to_thread(self.queue.heartbeat, self.job):
+                self.lost = True
+                self.work.cancel()
+                return
+
+    def stop(self) -> None:
+        self._task.cancel()
+
+
+def print_status(queue: JobQueue) -> None:
+    counts = queue.counts()
+    if not counts:
+        print("队列为空")
+        return
+    for kind in (LINKS, DOWNLOAD):
+        states = counts.get(kind, {})
+        summary = ", ".join(f"{state} {count}" for state, count in sorted(states.items()))
+        print(f"{kind:<10} {summary or '无'}")
+    for node, count in sorted(queue.running_by_node().items()):
+        print(f"节点 {node}: 正在处理 {count} 个任务")
+
+
+def run_daemon(once: bool = False, queue_file: Optional[str] = None, status: bool = False,
+               sync: bool = True, node_id: Optional[str] = None) -> int:
+    queue = JobQueue(queue_file)
+    try:
+        if status:
+            print_status(queue)
+            return 0
+        try:
+            cookie = get_cookie()
+        except ValueError as e:
+            print(f"配置错误: {e}")
+            return 1
+        asyncio.run(Daemon(cookie, queue, once=once, sync=sync, node_id=node_id).run())
+        return 0
+    finally:
+        queue.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="WNACG 守护进程：定期同步书架和查询，按优先级获取链接并下载")
+    parser.add_argument("--once", action="store_true", help="同步一次并处理完队列后退出")
+    parser.add_argument("--queue", default=None, help="任务队列文件（默认 DAEMON_CONFIG['queue_file']）")
+    parser.add_argument("--status", action="store_true", help="只显示队列状态")
+    parser.add_argument("--no-sync", action="store_true", help="不同步书架/查询，只处理队列中的任务（工作节点）")
+    parser.add_argument("--node-id", default=None, help="节点ID（默认 主机名:队列文件路径）")
+    args = parser.parse_args(argv)
+    return run_daemon(args.once, args.queue, args.status, not args.no_sync, args.node_id)
+
+
+if __name__ == "__main__":
+    metrics.start_from_config()
+    tracing.start_from_config()
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n用户取消，未完成的任务下次启动时会重新处理")
@@ -2,26 +2,73 @@ import asyncio
 import json
 import os
 import random
+import re
 import ssl
+import sys
 import time
+from collections import deque
 from pathlib import Path
 from urllib.parse import unquote, urlparse
 from typing import Dict, List, Optional
 
 import aiohttp
-from aiohttp import ClientTimeout, TCPConnector
+from aiohttp import ClientTimeout
 from tqdm import tqdm
 
 # === 你的其它依赖或配置 ===
-from config import get_request_headers_with_cookie, REQUEST_CONFIG, DIRECTORIES
+from config import get_request_headers_with_cookie, REQUEST_CONFIG, DIRECTORIES, DOWNLOAD_CONFIG, GALLERY_CONFIG, \
+    POSTPROCESS_CONFIG, STORE_CONFIG, ZIP_PROBE_CONFIG
+from http_client import create_session, HTTPStatusError
+from retry import DOWNLOAD_POLICY, RETRYABLE_STATUS, CircuitOpenError, HostDegraded, parse_retry_after
+from download_scheduler import DiskBudget, DiskSpaceError, format_size, order_comics, probe_comic_size, probe_sizes
+from json_stream import JsonStream
+from archive_store import ArchiveStore
+from mirror_stats import MirrorStats
+from seen_index import SeenIndex
+from gallery import GalleryDownloader
+from zip_probe import filter_reason, get_manifest_cache, probe_manifests, verify_archive
+from postprocess import PostProcessor
+import metrics
+import tracing
+import profiling
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-\d+/(\d+)")
+
+# 下载循环中每累计这么多字节才上报一次指标，避免逐块加锁
+METRICS_FLUSH_BYTES = 1024 * 1024
+
+# 压缩包体积大，不限制总时长（几百MB的文件正常速度下也可能超过固定的总超时），
+# 过慢或停滞由下载循环中的速度监测处理；按请求设置，因此也可以复用页面请求的会话
+DOWNLOAD_TIMEOUT = ClientTimeout(total=None, connect=30, sock_read=DOWNLOAD_CONFIG['stall_window'])
+
+
+class DownloadStalled(HostDegraded):
+    """下载速度在整个监测窗口内低于下限（或完全没有数据），.part 文件保留，用于在其他链接上续传"""
+
+    def __init__(self, offset: int, speed: float):
+        super().__init__(f"下载速度过低 ({speed / 1024:.1f} KB/s)")
+        self.offset = offset
+        self.speed = speed
 
 # --------------------------------------------------------------------------- #
 #                                核心下载类                                   #
 # --------------------------------------------------------------------------- #
 class ComicDownloader:
-    def __init__(self, download_dir: str = "downloads"):
+    def __init__(self, download_dir: str = "downloads", gallery_mode: Optional[str] = None,
+                 postprocess: Optional[bool] = None):
         self.download_dir = Path(download_dir)
         self.download_dir.mkdir(exist_ok=True)
+        self.disk = DiskBudget(self.download_dir)
+        self.gallery = GalleryDownloader(self.download_dir)
+        self.gallery_mode = gallery_mode or GALLERY_CONFIG['mode']  # fallback / always / off
+        # 按内容哈希存储压缩包，下载目录中的文件名是指向存储的链接
+        self.store: Optional[ArchiveStore] = ArchiveStore(self.download_dir) if STORE_CONFIG['enabled'] else None
+        if postprocess is None:
+            postprocess = POSTPROCESS_CONFIG['enabled']
+        # 下载完成的压缩包交给进程池后处理，与后续下载并行
+        self.postprocessor: Optional[PostProcessor] = PostProcessor() if postprocess else None
+        # 各下载镜像的历史表现，用于排列下载链接
+        self.mirror_stats: Optional[MirrorStats] = MirrorStats.from_config()
         self.failed_downloads: List[str] = []
         self.success_count: int = 0
         self.total_count: int = 0
@@ -47,13 +94,25 @@ class ComicDownloader:
             return f"{safe_title}_{safe_link_name}{ext}"
         return f"{safe_title}{ext}"
 
+    @staticmethod
+    def part_path(filepath: Path) -> Path:
+        """下载过程中写入的临时文件，完成后才重命名为正式文件名"""
+        return filepath.with_name(filepath.name + ".part")
+
     # ---------- 单文件下载 ---------- #
     async def download_file(
         self,
         session: aiohttp.ClientSession,
         url: str,
         filepath: Path,
-    ) -> bool:
+        expected_size: Optional[int] = None,
+    ) -> None:
+        """下载一次，失败时抛出异常，是否重试由 download_comic 中的重试策略决定
+
+        已有 .part 文件（上一次尝试或其他链接留下的）时用 Range 从断点继续；服务器不支持 Range 时从头下载，
+        返回的范围或总大小（expected_size）与断点不符时删除 .part 并按普通错误重试。
+        失败时保留 .part，由重试或下一个链接续传；所有链接都失败后由 download_comic 删除。
+        """
         headers = {
             "User-Agent": (
                 "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -62,37 +121,104 @@ class ComicDownloader:
             )
         }
 
+        host = urlparse(url).netloc
+        part = self.part_path(filepath)
+        offset = part.stat().st_size if part.exists() else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        start = time.monotonic()
+        ttfb: Optional[float] = None
+        metrics.INFLIGHT.inc(1, "download")
         try:
-            async with session.get(url, headers=headers, ssl=False) as resp:
-                if resp.status != 200:
-                    tqdm.write(f"✗ HTTP {resp.status}: {url}")
-                    return False
+            # 下载镜像的证书经常不规范，沿用原来的不校验证书行为
+            async with session.get(url, headers=headers, ssl=False, timeout=DOWNLOAD_TIMEOUT) as resp:
+                ttfb = time.monotonic() - start
+                metrics.observe_request(url, resp.status, ttfb)
+                if resp.status == 206 and offset:
+                    match = _CONTENT_RANGE.search(resp.headers.get("Content-Range", ""))
+                    if not match or int(match.group(1)) != offset or \
+                            (expected_size and int(match.group(2)) != expected_size):
+                        part.unlink(missing_ok=True)  # 与已下载部分对不上，不能再续传
+                        raise aiohttp.ClientPayloadError(f"续传位置与已下载部分不符: {resp.headers.get('Content-Range')}")
+                    tqdm.write(f"  从 {format_size(offset)} 处继续下载")
+                elif resp.status == 200:
+                    offset = 0  # 不支持 Range，从头下载
+                else:
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After")) \
+                        if resp.status in RETRYABLE_STATUS else None
+                    raise HTTPStatusError(resp.status, retry_after=retry_after)
 
                 filepath.parent.mkdir(parents=True, exist_ok=True)
                 total = int(resp.headers.get("Content-Length", 0))
 
+                # 速度监测：每秒记录一次已接收字节数，最近 stall_window 秒的平均速度低于下限时放弃这个连接
+                window = DOWNLOAD_CONFIG['stall_window']
+                min_speed = DOWNLOAD_CONFIG['stall_min_speed_kb'] * 1024
+                samples = deque([(start, 0)])
+                next_sample = start + 1
+
                 # 子进度条
                 with tqdm(
-                    total=total or None,
+                    total=(offset + total) or None,
+                    initial=offset,
                     unit="B",
                     unit_scale=True,
                     unit_divisor=1024,
                     desc=filepath.name[:30],      # 避免过长撑爆终端
                     dynamic_ncols=True,
                     leave=False,
-                ) as bar, open(filepath, "wb") as f:
-                    async for chunk in resp.content.iter_chunked(8192):
-                        f.write(chunk)
-                        bar.update(len(chunk))
-
-            return True
+                ) as bar, open(part, "ab" if offset else "wb") as f, \
+                        profiling.stage_span("download_body", "net", file=filepath.name):
+                    received = 0
+                    unreported = 0
+                    try:
+                        async for chunk in resp.content.iter_chunked(8192):
+                            f.write(chunk)
+                            bar.update(len(chunk))
+                            unreported += len(chunk)
+                            if unreported >= METRICS_FLUSH_BYTES:
+                                metrics.DOWNLOAD_BYTES.inc(unreported, host)
+                                received += unreported
+                                unreported = 0
+
+                            now = time.monotonic()
+                            if min_speed and now >= next_sample:
+                                next_sample = now + 1
+                                samples.append((now, received + unreported))
+                                while len(samples) > 2 and now - samples[1][0] >= window:
+                                    samples.popleft()
+                                span = now - samples[0][0]
+                                speed = (received + unreported - samples[0][1]) / span
+                                if span >= window and speed < min_speed:
+                                    raise DownloadStalled(offset + received + unreported, speed)
+                    except asyncio.TimeoutError:
+                        # 整个窗口内没有收到任何数据（sock_read 超时）
+                        raise DownloadStalled(offset + received + unreported, 0.0)
+
+            received += unreported
+            metrics.DOWNLOAD_BYTES.inc(unreported, host)
+            os.replace(part, filepath)
+            elapsed = time.monotonic() - start
+            if elapsed > 0:
+                metrics.DOWNLOAD_THROUGHPUT.set(received / elapsed, host)
+            if self.mirror_stats is not None:
+                self.mirror_stats.record_success(host, ttfb, received / max(elapsed - ttfb, 1e-3))
 
         except (asyncio.TimeoutError, aiohttp.ClientError) as e:
-            tqdm.write(f"✗ 网络/超时错误: {e}")
-            return False
-        except Exception as e:
-            tqdm.write(f"✗ 未知错误: {e}")
-            return False
+            metrics.observe_request(url, type(e).__name__, time.monotonic() - start)
+            if self.mirror_stats is not None:
+                self.mirror_stats.record_failure(host, type(e).__name__, ttfb)
+            raise
+        except DownloadStalled as e:
+            if self.mirror_stats is not None:
+                self.mirror_stats.record_failure(host, "stalled", ttfb, e.speed)
+            raise
+        except HTTPStatusError as e:
+            if self.mirror_stats is not None:
+                self.mirror_stats.record_failure(host, f"HTTP {e.status}", ttfb)
+            raise
+        finally:
+            metrics.INFLIGHT.dec(1, "download")
 
     # ---------- 下载单本漫画 ---------- #
     async def download_comic(
@@ -100,82 +226,291 @@ class ComicDownloader:
         session: aiohttp.ClientSession,
         comic: Dict,
         *,
-        max_retries: int = 3,
+        max_retries: Optional[int] = None,
+        defer_circuit_open: bool = False,
     ) -> bool:
+        """依次尝试各下载链接，成功返回 True
+
+        defer_circuit_open 为 True 时，如果所有链接都因主机熔断被跳过（一次请求也没有发出），
+        抛出 CircuitOpenError 而不是返回 False，调用方可以等冷却结束后再试，不计为一次失败。
+        """
         title = comic["title"]
         links = comic.get("download_links", {})
-        if not links:
+        use_gallery = self.gallery_mode != "off" and comic.get("id") is not None
+        if not links and not use_gallery:
             return False
 
-        for idx, (link_name, link_info) in enumerate(links.items(), 1):
-            url = link_info["url"]
-            filename = self.get_filename_from_url(url, title, link_name)
-            filepath = self.download_dir / filename
-            tqdm.write(f"  尝试链接 {idx}: {link_name}")
+        # 已经下载过（可能在其他书架或文件名下）：直接链接到存储中的压缩包
+        if self._link_from_store(comic):
+            return True
 
-            for attempt in range(1, max_retries + 1):
-                success = await self.download_file(session, url, filepath)
-                if success:
-                    tqdm.write(f"  ✓ 成功: {filename}")
+        # 先预留磁盘空间，空间不足时在这里暂停，而不是写到一半失败
+        size = comic.get("size")
+        if size is None:
+            size = await probe_comic_size(session, comic)
+        try:
+            reservation = await self.disk.reserve(size, title)
+        except DiskSpaceError as e:
+            tqdm.write(f"  ✗ {e}")
+            metrics.DOWNLOADS.inc(1, "failed")
+            return False
+
+        with reservation:
+            if use_gallery and self.gallery_mode == "always" and await self._download_gallery(session, comic):
+                return True
+
+            # 按历史表现排列链接，通常先从最快、最稳定的镜像开始
+            if self.mirror_stats is not None:
+                links = self.mirror_stats.order(links, size)
+
+            # 之前的链接留下的 .part，由下一个真正开始下载的链接续传；
+            # 上次因熔断暂缓时保留的 .part 可能属于任意一个链接的文件名（链接顺序每次可能不同）
+            resume_part: Optional[Path] = next(
+                (part for part in (self.part_path(self.download_dir / self.get_filename_from_url(
+                    info["url"], title, name)) for name, info in links.items()) if part.exists()),
+                None,
+            )
+            circuit_open: List[CircuitOpenError] = []  # 因主机熔断被跳过的链接
+            for idx, (link_name, link_info) in enumerate(links.items(), 1):
+                url = link_info["url"]
+                filename = self.get_filename_from_url(url, title, link_name)
+                filepath = self.download_dir / filename
+                part = self.part_path(filepath)
+                if resume_part is not None and resume_part != part:
+                    os.replace(resume_part, part)
+                resume_part = part  # 这个链接失败（包括熔断时根本没有发起请求）后继续交给下一个链接
+                reservation.path = part
+                tqdm.write(f"  尝试链接 {idx}: {link_name}")
+
+                def on_retry(attempt: int, delay: float, error: Exception) -> None:
+                    tqdm.write(f"  … {error}，重试 {attempt + 1}，等待 {delay:.1f}s")
+
+                try:
+                    await DOWNLOAD_POLICY.run(
+                        lambda: self.download_file(session, url, filepath, comic.get("size")),
+                        host=urlparse(url).netloc,
+                        component="download",
+                        max_attempts=max_retries,
+                        on_retry=on_retry,
+                    )
+                except CircuitOpenError as e:
+                    # 主机熔断中：不在它身上花时间，直接换下一个链接
+                    tqdm.write(f"  ✗ 跳过链接 {idx}: {e}")
+                    circuit_open.append(e)
+                except DownloadStalled as e:
+                    # 不在慢链接上重试，已下载的部分交给下一个链接续传
+                    tqdm.write(f"  ✗ 链接 {idx} {e}，已下载 {format_size(e.offset)}，换下一个链接继续")
+                except (asyncio.TimeoutError, aiohttp.ClientError, HTTPStatusError) as e:
+                    tqdm.write(f"  ✗ 链接 {idx} 失败: {e}\n")
+                except OSError as e:
+                    tqdm.write(f"  ✗ 写入文件失败: {e}")
+                except Exception as e:
+                    tqdm.write(f"  ✗ 未知错误: {e}")
+                else:
+                    problem = await self._verify_manifest(filepath, comic)
+                    if problem is None:
+                        tqdm.write(f"  ✓ 成功: {filename}")
+                        metrics.DOWNLOADS.inc(1, "success")
+                        await self._store(filepath, comic)
+                        self._postprocess(filepath, comic)
+                        return True
+                    tqdm.write(f"  ✗ 与下载前探测到的目录不一致，已删除: {problem}")
+                    filepath.unlink(missing_ok=True)
+                    get_manifest_cache().forget(comic.get("id"))
+
+                # 当前链接失败 → 换下一个链接，已下载的部分由它续传
+                if not part.exists():
+                    resume_part = None
+                if idx < len(links):
+                    metrics.MIRROR_FALLBACKS.inc(1, "download_link")
+
+            # 所有链接都因熔断被跳过、稍后再试时保留 .part 供下次续传；否则已经没有可以续传的链接了
+            deferred = defer_circuit_open and bool(links) and len(circuit_open) == len(links)
+            if resume_part is not None and not deferred:
+                resume_part.unlink(missing_ok=True)
+
+            if use_gallery and self.gallery_mode == "fallback":
+                if links:
+                    metrics.MIRROR_FALLBACKS.inc(1, "gallery")
+                    tqdm.write("  压缩包链接均失败，改为逐页下载图片")
+                if await self._download_gallery(session, comic):
+                    if resume_part is not None:
+                        resume_part.unlink(missing_ok=True)
                     return True
-                if attempt < max_retries:
-                    wait = 2 * attempt
-                    tqdm.write(f"  … 重试 {attempt}/{max_retries-1}，等待 {wait}s")
-                    await asyncio.sleep(wait)
 
-            # 当前链接所有重试均失败 → 换下一个链接
-            tqdm.write(f"  ✗ 链接 {idx} 全部重试失败\n")
-            await asyncio.sleep(random.uniform(3, 8))
+        if deferred:
+            tqdm.write(f"  … {title} 的下载主机均在熔断中，稍后再试")
+            raise min(circuit_open, key=lambda e: e.retry_in)
 
         # 所有链接失败
         tqdm.write(f"  ✗ {title} 所有下载链接均失败")
+        metrics.DOWNLOADS.inc(1, "failed")
         return False
 
+    async def _download_gallery(self, session: aiohttp.ClientSession, comic: Dict) -> bool:
+        filepath = self._gallery_path(comic)
+        tqdm.write(f"  逐页下载: {filepath.name}")
+        with tracing.span("download_gallery", "phase", id=comic["id"]):
+            ok = await self.gallery.download(session, comic, filepath)
+        if ok:
+            tqdm.write(f"  ✓ 成功: {filepath.name}")
+            metrics.DOWNLOADS.inc(1, "success")
+            await self._store(filepath, comic)
+            self._postprocess(filepath, comic)
+        return ok
+
+    @staticmethod
+    async def _verify_manifest(filepath: Path, comic: Dict) -> Optional[str]:
+        """有探测到的 manifest 时校验下载的压缩包，返回问题描述（没有问题返回 None）"""
+        manifest = comic.get("manifest")
+        if not manifest or not ZIP_PROBE_CONFIG['verify'] or filepath.suffix.lower() not in (".zip", ".cbz"):
+            return None
+        with tracing.span("verify_archive", "io", file=filepath.name):
+            return await asyncio.to_thread(verify_archive, str(filepath), manifest)
+
+    def _gallery_path(self, comic: Dict) -> Path:
+        return self.download_dir / f"{self._clean_name(comic['title']) or comic['id']}.cbz"
+
+    # ---------- 内容寻址存储 ---------- #
+    def _is_stored(self, comic: Dict) -> bool:
+        return self.store is not None and comic.get("id") is not None and comic["id"] in self.store
+
+    def _link_from_store(self, comic: Dict) -> bool:
+        if self.store is None or comic.get("id") is None:
+            return False
+        obj_path = self.store.lookup(comic["id"])
+        if obj_path is None:
+            return False
+
+        links = comic.get("download_links") or {}
+        if links:
+            link_name, link_info = next(iter(links.items()))
+            filename = self.get_filename_from_url(link_info["url"], comic["title"], link_name)
+            filepath = (self.download_dir / filename).with_suffix(obj_path.suffix)
+        else:
+            filepath = self._gallery_path(comic)
+        try:
+            mode = self.store.link(obj_path, filepath)
+        except OSError as e:
+            tqdm.write(f"  ✗ 链接已存储的压缩包失败，重新下载: {e}")
+            return False
+        tqdm.write(f"  ✓ 已下载过，{mode} → {filepath.name}")
+        metrics.DOWNLOADS.inc(1, "deduplicated")
+        return True
+
+    async def _store(self, filepath: Path, comic: Dict) -> None:
+        if self.store is None:
+            return
+        try:
+            with tracing.span("store_archive", "io", file=filepath.name):
+                await self.store.ingest(filepath, comic.get("id"))
+        except OSError as e:
+            # 文件已完整下载，存储失败只是失去去重，不影响本次结果
+            tqdm.write(f"  ⚠ 存入压缩包存储失败: {e}")
+
+    def _postprocess(self, filepath: Path, comic: Dict) -> None:
+        if self.postprocessor is not None:
+            self.postprocessor.submit(filepath, comic)
+
+    async def close_postprocessor(self) -> None:
+        """等待已提交的后处理任务全部完成"""
+        if self.postprocessor is not None:
+            await self.postprocessor.close()
+            self.postprocessor = None
+
     # ---------- 主入口：从 JSON 下载 ---------- #
     async def download_from_json(self, json_path: str) -> None:
+        """流式读取 JSON：每读入 order_window 本就探测大小、排序并下载这一批，不必等整个文件读完"""
+        window = DOWNLOAD_CONFIG['order_window'] or float("inf")
+        tqdm.write(f"开始下载 → {self.download_dir.resolve()}\n")
+        seen = SeenIndex.from_config(self.download_dir)
+        skipped = 0
+
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            async with create_session(verify_ssl=False, timeout=DOWNLOAD_TIMEOUT) as session:
+                with JsonStream(json_path) as stream, tqdm(
+                    desc="漫画总进度",
+                    unit="本",
+                    dynamic_ncols=True,
+                ) as pbar, profiling.stage_span("download_loop"):
+                    batch: List[Dict] = []
+                    for comic in stream:
+                        # 没有压缩包链接（全部失效或获取失败）时，只要允许逐页下载就仍然交给 download_comic
+                        if not comic.get("download_links") and \
+                                (self.gallery_mode == "off" or comic.get("id") is None):
+                            continue
+                        if comic.get("duplicate_of") is not None:  # 封面与已下载的漫画相同
+                            continue
+                        # 已下载过：只在下载目录中补上文件名链接，不探测、不下载
+                        if seen is not None and seen.is_downloaded(comic.get("id")) and \
+                                (self.store is None or self._link_from_store(comic)):
+                            skipped += 1
+                            continue
+                        batch.append(comic)
+                        if len(batch) >= window:
+                            await self._download_batch(session, batch, pbar)
+                            batch = []
+                    await self._download_batch(session, batch, pbar)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             tqdm.write(f"读取 JSON 失败: {e}")
             return
-
-        comics = [c for c in data.get("comics", []) if c.get("download_links")]
-        if not comics:
-            tqdm.write("JSON 中没有带下载链接的漫画")
+        finally:
+            await self.close_postprocessor()
+
+        if skipped:
+            tqdm.write(f"跳过 {skipped} 本已下载的漫画")
+        if not self.total_count:
+            if not skipped:
+                tqdm.write("JSON 中没有带下载链接的漫画")
             return
 
-        self.total_count = len(comics)
-        tqdm.write(f"共有 {self.total_count} 本可下载 → {self.download_dir.resolve()}\n")
-
-        connector = TCPConnector(ssl=False, limit=100, limit_per_host=10)
-        timeout = ClientTimeout(total=300, connect=30, sock_read=60)
-
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            with tqdm(
-                total=self.total_count,
-                desc="漫画总进度",
-                dynamic_ncols=True,
-            ) as pbar:
-                for idx, comic in enumerate(comics, 1):
-                    tqdm.write(f"\n[{idx}/{self.total_count}] 开始下载: {comic['title']}")
-                    ok = await self.download_comic(session, comic)
-                    self.success_count += int(ok)
-                    if not ok:
-                        self.failed_downloads.append(comic["title"])
-
-                    pbar.update(1)
-                    pbar.set_postfix(
-                        成功=self.success_count,
-                        失败=len(self.failed_downloads),
-                    )
-
-                    # 非最后一本 → 随机延迟
-                    if idx < self.total_count:
-                        await asyncio.sleep(random.uniform(5, 10))
-
+        metrics.QUEUE_DEPTH.set(0, "download")
         self.print_summary()
 
+    async def _download_batch(
+        self,
+        session: aiohttp.ClientSession,
+        comics: List[Dict],
+        pbar: tqdm,
+    ) -> None:
+        # 探测各压缩包大小，按 DOWNLOAD_CONFIG['order'] 重新排列这一批的下载顺序
+        # 已存储的漫画不会发起下载，也不必探测
+        pending = [c for c in comics if not self._is_stored(c)]
+        if ZIP_PROBE_CONFIG['enabled']:
+            # 读取压缩包目录（同时得到大小），页数/分辨率不符合条件的不下载
+            await probe_manifests(session, pending)
+            kept = []
+            for comic in comics:
+                reason = filter_reason(comic)
+                if reason is None:
+                    kept.append(comic)
+                else:
+                    tqdm.write(f"跳过 {comic['title']}: {reason}")
+            comics = kept
+        await probe_sizes(session, pending)
+        comics = order_comics(comics)
+
+        for idx, comic in enumerate(comics, 1):
+            # 上一批的最后一本与这一批之间同样需要延迟
+            if self.total_count:
+                with tracing.span("download_delay", "wait"):
+                    await asyncio.sleep(random.uniform(*REQUEST_CONFIG['download_delay']))
+
+            self.total_count += 1
+            metrics.QUEUE_DEPTH.set(len(comics) - idx + 1, "download")
+            tqdm.write(f"\n[{self.total_count}] 开始下载: {comic['title']}")
+            with tracing.span("download_comic", "phase", id=comic.get("id")):
+                ok = await self.download_comic(session, comic)
+            self.success_count += int(ok)
+            if not ok:
+                self.failed_downloads.append(comic["title"])
+
+            pbar.update(1)
+            pbar.set_postfix(
+                成功=self.success_count,
+                失败=len(self.failed_downloads),
+            )
+
     # ---------- 打印汇总 ---------- #
     def print_summary(self) -> None:
         line = "=" * 60
@@ -201,16 +536,18 @@ def scan_json_files_with_downloads(url_dir: str = "url") -> List[Dict]:
     results = []
     for jf in p.glob("*.json"):
         try:
-            with open(jf, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            comics = data.get("comics", [])
-            if any(c.get("download_links") for c in comics):
+            # 流式逐条统计，不把整个文件读进内存
+            links = 0
+            with JsonStream(str(jf)) as stream:
+                for comic in stream:
+                    links += bool(comic.get("download_links"))
+            if links:
                 results.append(
                     dict(
                         filename=jf.name,
                         filepath=str(jf),
-                        total=len(comics),
-                        links=sum(1 for c in comics if c.get("download_links")),
+                        total=stream.count,
+                        links=links,
                         mtime=jf.stat().st_mtime,
                     )
                 )
@@ -263,6 +600,9 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
+    metrics.start_from_config()
+    tracing.start_from_config()
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
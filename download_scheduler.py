@@ -0,0 +1,178 @@
+"""
+下载调度
+- 下载前用 HEAD（不支持时用 Range: bytes=0-0）探测每本漫画压缩包的大小，按大小或优先级排序；
+- 每本漫画开始下载前先在目标磁盘上预留空间，剩余空间（扣除进行中下载尚未写入的部分）
+  低于阈值时暂停开始新的下载，等空间释放后再继续，而不是写到一半时磁盘被占满。
+"""
+import asyncio
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import ClientTimeout
+from tqdm import tqdm
+
+# 从配置文件导入
+from config import DOWNLOAD_CONFIG
+import metrics
+import tracing
+
+_CONTENT_RANGE_TOTAL = re.compile(r"/\s*(\d+)\s*$")
+
+
+class DiskSpaceError(RuntimeError):
+    """磁盘总容量都放不下该文件，等待也没有用"""
+    pass
+
+
+# --------------------------------------------------------------------------- #
+#                                  大小探测                                    #
+# --------------------------------------------------------------------------- #
+async def probe_size(session: aiohttp.ClientSession, url: str) -> Optional[int]:
+    """探测文件大小（字节），探测失败返回 None"""
+    timeout = ClientTimeout(total=DOWNLOAD_CONFIG['probe_timeout'])
+    try:
+        async with session.head(url, ssl=False, timeout=timeout, allow_redirects=True) as resp:
+            if resp.status == 200 and resp.headers.get("Content-Length"):
+                return int(resp.headers["Content-Length"])
+        # 部分镜像不支持 HEAD：请求第一个字节，从 Content-Range 中取总大小
+        async with session.get(url, headers={"Range": "bytes=0-0"}, ssl=False, timeout=timeout) as resp:
+            match = _CONTENT_RANGE_TOTAL.search(resp.headers.get("Content-Range", ""))
+            if resp.status == 206 and match:
+                return int(match.group(1))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        pass
+    return None
+
+
+async def probe_comic_size(session: aiohttp.ClientSession, comic: Dict) -> Optional[int]:
+    """按顺序探测漫画的下载链接，返回第一个能拿到的大小，并记录到 comic['size']"""
+    for link_info in comic.get("download_links", {}).values():
+        size = await probe_size(session, link_info["url"])
+        if size is not None:
+            comic["size"] = size
+            return size
+    return None
+
+
+async def probe_sizes(session: aiohttp.ClientSession, comics: List[Dict]) -> None:
+    """并发探测所有漫画的大小（已有 size 字段的跳过）"""
+    todo = [c for c in comics if c.get("size") is None]
+    if not todo:
+        return
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONFIG['probe_concurrency'])
+
+    with tracing.span("probe_sizes", "phase", count=len(todo)), \
+            tqdm(total=len(todo), desc="探测文件大小", dynamic_ncols=True, leave=False) as bar:
+        async def probe(comic: Dict) -> None:
+            async with semaphore:
+                await probe_comic_size(session, comic)
+            bar.update(1)
+
+        await asyncio.gather(*(probe(c) for c in todo))
+
+    known = [c["size"] for c in comics if c.get("size") is not None]
+    tqdm.write(f"已探测 {len(known)}/{len(comics)} 本的大小，合计 {format_size(sum(known))}")
+
+
+def order_comics(comics: List[Dict], order: Optional[str] = None) -> List[Dict]:
+    """按 DOWNLOAD_CONFIG['order'] 排序，大小未知的排在最后"""
+    order = order or DOWNLOAD_CONFIG['order']
+    if order == "file":
+        return list(comics)
+
+    def size_key(comic: Dict):
+        size = comic.get("size")
+        return (size is None, size or 0)
+
+    if order == "priority":
+        return sorted(comics, key=lambda c: (-(c.get("priority") or 0), size_key(c)))
+    return sorted(comics, key=size_key)
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+# --------------------------------------------------------------------------- #
+#                                  磁盘预留                                    #
+# --------------------------------------------------------------------------- #
+class Reservation:
+    """一次下载预留的空间；path 为正在写入的文件，已写入的部分不再重复计入预留"""
+
+    def __init__(self, budget: "DiskBudget", size: int):
+        self.budget = budget
+        self.size = size
+        self.path: Optional[Path] = None
+
+    @property
+    def outstanding(self) -> int:
+        written = 0
+        if self.path is not None:
+            try:
+                written = self.path.stat().st_size
+            except OSError:
+                pass
+        return max(0, self.size - written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.budget.release(self)
+
+
+class DiskBudget:
+    """下载目录所在磁盘的空间预算"""
+
+    def __init__(self, directory, min_free_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        if min_free_bytes is None:
+            min_free_bytes = int(DOWNLOAD_CONFIG['min_free_gb'] * 1024 ** 3)
+        self.min_free_bytes = min_free_bytes
+        self.reservations: List[Reservation] = []
+
+    @property
+    def reserved(self) -> int:
+        return sum(r.outstanding for r in self.reservations)
+
+    def available(self) -> int:
+        """扣除预留和最低剩余空间后还能用于新下载的字节数"""
+        free = shutil.disk_usage(self.directory).free
+        reserved = self.reserved
+        metrics.DISK_BYTES.set(free, "free")
+        metrics.DISK_BYTES.set(reserved, "reserved")
+        return free - reserved - self.min_free_bytes
+
+    async def reserve(self, size: Optional[int], label: str = "") -> Reservation:
+        """预留空间，不足时暂停等待；size 为 None 时按 unknown_size_mb 预留"""
+        if size is None:
+            size = DOWNLOAD_CONFIG['unknown_size_mb'] * 1024 * 1024
+        if size > shutil.disk_usage(self.directory).total - self.min_free_bytes:
+            raise DiskSpaceError(f"{label} 大小 {format_size(size)} 超过磁盘可用容量")
+
+        paused_at = None
+        while self.available() < size:
+            if paused_at is None:
+                paused_at = time.monotonic()
+                tqdm.write(f"⏸ 磁盘剩余空间不足（需要 {format_size(size)}，"
+                           f"最低保留 {format_size(self.min_free_bytes)}），暂停开始新的下载...")
+            with tracing.span("disk_wait", "wait", size=size):
+                await asyncio.sleep(DOWNLOAD_CONFIG['space_check_interval'])
+        if paused_at is not None:
+            tqdm.write(f"▶ 磁盘空间已恢复，暂停了 {time.monotonic() - paused_at:.0f} 秒")
+
+        reservation = Reservation(self, size)
+        self.reservations.append(reservation)
+        return reservation
+
+    def release(self, reservation: Reservation) -> None:
+        if reservation in self.reservations:
+            self.reservations.remove(reservation)
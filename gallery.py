@@ -0,0 +1,231 @@
+"""
+逐页图片下载
+压缩包镜像全部失效或被限速时的备用下载方式：读取漫画阅读页的图片列表（imglist），
+以有限并发逐张下载图片，最后在本地打包为 CBZ。
+- 图片列表和已下载的图片保存在 下载目录/.gallery/<漫画ID>/ 中，中断后重新运行只下载缺少的图片；
+- 每张图片先写入 .part 文件，完整下载后才重命名，已存在的正式文件即视为已完成；
+- 全部完成后打包为 CBZ（存储模式，图片本身已经压缩），并删除临时目录。
+
+用法: python gallery.py <漫画ID> [标题]
+"""
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import zipfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import unquote, urlparse
+
+import aiohttp
+from aiohttp import ClientTimeout
+from tqdm import tqdm
+
+# 从配置文件导入
+from config import API_SCHEME, api_url, get_headers, GALLERY_CONFIG
+from http_client import HTTPStatusError, fetch_text
+from retry import PAGE_POLICY, RETRYABLE_STATUS, CircuitOpenError, parse_retry_after
+import metrics
+import tracing
+import profiling
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+_FAST_IMG_HOST = re.compile(r'fast_img_host\s*=\s*\\?["\']([^"\'\\]*)')
+_IMAGE_ENTRY = re.compile(
+    r'url:\s*(fast_img_host\s*\+\s*)?\\?["\']((?:[^"\'\\]|\\/)+)\\?["\']\s*,\s*'
+    r'caption:\s*\\?["\']((?:[^"\'\\]|\\/)*)'
+)
+
+
+@dataclass
+class GalleryImage:
+    url: str
+    caption: str = ""
+
+
+def gallery_path(comic_id: int) -> str:
+    return f"/photos-gallery-aid-{comic_id}.html"
+
+
+def _absolute_url(url: str) -> str:
+    if url.startswith("//"):
+        return f"{API_SCHEME}:{url}"
+    if url.startswith("/"):
+        return api_url(url)
+    return url
+
+
+@profiling.stage()
+def parse_gallery(text: str) -> List[GalleryImage]:
+    """解析阅读页脚本中的 imglist（引号可能被转义），跳过末尾的站点广告图"""
+    host_match = _FAST_IMG_HOST.search(text)
+    fast_img_host = host_match.group(1) if host_match else ""
+
+    images = []
+    for prefixed, url, caption in _IMAGE_ENTRY.findall(text):
+        url = url.replace("\\/", "/")
+        if prefixed:
+            url = fast_img_host + url
+        if "/themes/" in url:
+            continue
+        images.append(GalleryImage(_absolute_url(url), caption.replace("\\/", "/")))
+    return images
+
+
+async def fetch_gallery(session: aiohttp.ClientSession, comic_id: int) -> List[GalleryImage]:
+    text, _ = await fetch_text(session, gallery_path(comic_id))
+    return parse_gallery(text)
+
+
+def page_name(index: int, url: str) -> str:
+    """第 index 页在本地和 CBZ 中的文件名（按页码补零，保证排序正确）"""
+    ext = os.path.splitext(unquote(urlparse(url).path))[1].lower()
+    return f"{index:03d}{ext if ext in IMAGE_EXTENSIONS else '.jpg'}"
+
+
+class GalleryDownloader:
+    def __init__(self, download_dir: str = "downloads"):
+        self.download_dir = Path(download_dir)
+        self.work_root = self.download_dir / ".gallery"
+
+    async def _image_list(self, session: aiohttp.ClientSession, comic_id: int, work_dir: Path) -> List[GalleryImage]:
+        """图片列表只获取一次，保存在临时目录中，继续下载时直接使用"""
+        state_path = work_dir / "imglist.json"
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                return [GalleryImage(**item) for item in json.load(f)]
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            pass
+
+        images = await fetch_gallery(session, comic_id)
+        if images:
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump([asdict(image) for image in images], f, ensure_ascii=False)
+        return images
+
+    async def fetch_image(self, session: aiohttp.ClientSession, url: str, path: Path) -> None:
+        """下载单张图片，按统一策略重试"""
+        timeout = ClientTimeout(total=GALLERY_CONFIG['image_timeout'])
+        host = urlparse(url).netloc
+        part = path.with_name(path.name + ".part")
+
+        async def attempt() -> None:
+            start = time.monotonic()
+            try:
+                # 图片服务器会检查 Referer
+                async with session.get(url, headers=get_headers(), ssl=False, timeout=timeout) as resp:
+                    metrics.observe_request(url, resp.status, time.monotonic() - start)
+                    if resp.status != 200:
+                        retry_after = parse_retry_after(resp.headers.get("Retry-After")) \
+                            if resp.status in RETRYABLE_STATUS else None
+                        raise HTTPStatusError(resp.status, retry_after=retry_after)
+                    data = await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.observe_request(url, type(e).__name__, time.monotonic() - start)
+                raise
+            part.write_bytes(data)
+            os.replace(part, path)
+            metrics.DOWNLOAD_BYTES.inc(len(data), host)
+
+        await PAGE_POLICY.run(attempt, host=host, component="gallery")
+
+    async def download(self, session: aiohttp.ClientSession, comic: Dict, cbz_path: Path) -> bool:
+        """逐页下载漫画并打包到 cbz_path；有图片失败时保留已下载的部分，返回 False"""
+        comic_id = comic["id"]
+        work_dir = self.work_root / str(comic_id)
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            images = await self._image_list(session, comic_id, work_dir)
+        except (HTTPStatusError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            tqdm.write(f"  ✗ 获取图片列表失败: {e}")
+            return False
+        if not images:
+            tqdm.write("  ✗ 阅读页中没有找到图片列表")
+            return False
+
+        pages = [work_dir / page_name(i, image.url) for i, image in enumerate(images, 1)]
+        todo = [(path, image) for path, image in zip(pages, images) if not path.exists()]
+        if len(todo) < len(pages):
+            tqdm.write(f"  继续上次的进度: 已有 {len(pages) - len(todo)}/{len(pages)} 页")
+
+        semaphore = asyncio.Semaphore(GALLERY_CONFIG['concurrency'])
+        failed = 0
+
+        with tqdm(
+            total=len(pages),
+            initial=len(pages) - len(todo),
+            unit="页",
+            desc=cbz_path.stem[:30],
+            dynamic_ncols=True,
+            leave=False,
+        ) as bar, profiling.stage_span("gallery_download", "net", id=comic_id, pages=len(todo)):
+            async def fetch(path: Path, image: GalleryImage) -> None:
+                nonlocal failed
+                async with semaphore:
+                    metrics.INFLIGHT.inc(1, "gallery")
+                    try:
+                        await self.fetch_image(session, image.url, path)
+                    except (HTTPStatusError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        failed += 1
+                        tqdm.write(f"  ✗ {path.name} 下载失败: {e}")
+                    except OSError as e:
+                        # 写入失败（磁盘满、权限等）只影响这一页，不中断整个下载
+                        failed += 1
+                        tqdm.write(f"  ✗ {path.name} 写入失败: {e}")
+                    finally:
+                        metrics.INFLIGHT.dec(1, "gallery")
+                bar.update(1)
+
+            await asyncio.gather(*(fetch(path, image) for path, image in todo))
+
+        if failed:
+            tqdm.write(f"  ✗ {failed} 页下载失败，已下载的页面保留在 {work_dir}，重新运行会继续下载")
+            return False
+
+        with tracing.span("pack_cbz", "io", pages=len(pages)):
+            pack_cbz(pages, cbz_path)
+        shutil.rmtree(work_dir)
+        return True
+
+
+def pack_cbz(pages: List[Path], cbz_path: Path) -> None:
+    """按页码顺序打包为 CBZ（先写 .part，完成后重命名）"""
+    part = cbz_path.with_name(cbz_path.name + ".part")
+    with zipfile.ZipFile(part, "w", compression=zipfile.ZIP_STORED) as zf:
+        for path in pages:
+            zf.write(path, path.name)
+    os.replace(part, cbz_path)
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+async def main(comic_id: int, title: str) -> bool:
+    from download import ComicDownloader, DOWNLOAD_TIMEOUT
+    from http_client import create_session
+    from mirrors import mirror_probing
+
+    downloader = ComicDownloader(gallery_mode="always")
+    async with create_session(verify_ssl=False, timeout=DOWNLOAD_TIMEOUT) as session, mirror_probing(session):
+        return await downloader.download_comic(session, {"id": comic_id, "title": title})
+
+
+if __name__ == "__main__":
+    metrics.start_from_config()
+    tracing.start_from_config()
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit():
+        print("用法: python gallery.py <漫画ID> [标题] [--profile]")
+        sys.exit(1)
+    try:
+        ok = asyncio.run(main(int(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else sys.argv[1]))
+    except KeyboardInterrupt:
+        print("\n用户取消")
+        sys.exit(130)
+    sys.exit(0 if ok else 1)
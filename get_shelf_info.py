@@ -5,12 +5,19 @@ import json
 import re
 from datetime import datetime
 import os
+import sys
 
 import aiohttp
 from bs4 import BeautifulSoup
 
 # 从配置文件导入
-from config import API_DOMAIN, get_cookie, get_request_headers_with_cookie, DIRECTORIES
+from config import get_cookie, DIRECTORIES
+from auth import get_cookie_manager
+from http_client import create_session, fetch_user_page
+from mirrors import mirror_probing
+import metrics
+import tracing
+import profiling
 
 @dataclass
 class Shelf:
@@ -33,14 +40,23 @@ class GetFavoriteResult:
     shelf: Shelf
 
 async def get_favorite(session: aiohttp.ClientSession, cookie: str, shelf_id: int, page_num: int) -> GetFavoriteResult:
-    url = f"https://{API_DOMAIN}/users-users_fav-page-{page_num}-c-{shelf_id}.html"
-    headers = get_request_headers_with_cookie(cookie)
-    async with session.get(url, headers=headers) as resp:
-        text = await resp.text()
-        if resp.status != 200:
-            raise RuntimeError(f"Unexpected status {resp.status}: {text}")
-    return parse_get_favorite(text)
-
+    url = f"/users-users_fav-page-{page_num}-c-{shelf_id}.html"
+    manager = get_cookie_manager()
+    # 请求前取定本次使用的Cookie，重新登录时以它为准：其他页面已刷新过时不会再登录一次
+    cookie = manager.resolve(cookie)
+    metrics.INFLIGHT.inc(1, "favorite")
+    try:
+        text = await fetch_user_page(session, cookie, url, manager)
+    finally:
+        metrics.INFLIGHT.dec(1, "favorite")
+    result = parse_get_favorite(text)
+    # 收藏夹页面既没有漫画也没有当前书架标识，说明拿到的不是登录后的页面
+    if not result.comics and not result.shelf.name:
+        cookie = await manager.refresh(cookie)
+        result = parse_get_favorite(await fetch_user_page(session, cookie, url, manager))
+    return result
+
+@profiling.stage()
 def parse_get_favorite(html: str) -> GetFavoriteResult:
     soup = BeautifulSoup(html, "html.parser")
     comics = [parse_comic(div) for div in soup.select('.asTB')]
@@ -89,12 +105,8 @@ def parse_shelf(a):
 
 async def get_shelves(session: aiohttp.ClientSession, cookie: str) -> List[Shelf]:
     """获取所有书架列表"""
-    url = f"https://{API_DOMAIN}/users-users_fav-page-1-c-0.html"
-    headers = get_request_headers_with_cookie(cookie)
-    async with session.get(url, headers=headers) as resp:
-        text = await resp.text()
-        if resp.status != 200:
-            raise RuntimeError(f"Unexpected status {resp.status}: {text}")
+    url = "/users-users_fav-page-1-c-0.html"
+    text = await fetch_user_page(session, cookie, url)
     
     soup = BeautifulSoup(text, "html.parser")
     shelves = [parse_shelf(a) for a in soup.select('.nav_list > a')]
@@ -127,7 +139,7 @@ async def get_all_comics_from_shelf(session: aiohttp.ClientSession, cookie: str,
     return all_comics
 
 async def main(cookie: str, shelf_id: int = None):
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session, mirror_probing(session):
         # 如果没有指定书架ID，先获取书架列表让用户选择
         if shelf_id is None:
             print("正在获取书架列表...")
@@ -153,7 +165,8 @@ async def main(cookie: str, shelf_id: int = None):
                 shelf_id = 0
         
         # 获取所有书籍
-        all_comics = await get_all_comics_from_shelf(session, cookie, shelf_id)
+        with tracing.span("fetch_shelf", shelf_id=shelf_id):
+            all_comics = await get_all_comics_from_shelf(session, cookie, shelf_id)
         
         # 构造结果
         result = {
@@ -179,16 +192,28 @@ async def main(cookie: str, shelf_id: int = None):
         filename = f"shelf_{safe_shelf_name}_{timestamp}.json"
         filepath = os.path.join(save_dir, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with profiling.stage_span("json_dump", "io"), open(filepath, 'w', encoding='utf-8') as f:
             json.dump(result, f, ensure_ascii=False, indent=2)
         
         print(f"书架信息已保存到文件: {filepath}")
         print(f"共获取到 {len(all_comics)} 本漫画")
         print(f"格式说明: 已保存为统一JSON格式，保存在search_results目录下")
         print(f"可使用get_url.py自动扫描该目录并选择文件获取下载链接")
+        return filepath
+
+async def list_shelves(cookie: str) -> List[Shelf]:
+    """列出所有书架（非交互）"""
+    async with create_session() as session, mirror_probing(session):
+        shelves = await get_shelves(session, cookie)
+    for shelf in shelves:
+        print(f"{shelf.id}\t{shelf.name}")
+    return shelves
 
 if __name__ == "__main__":
     try:
+        metrics.start_from_config()
+        tracing.start_from_config()
+        profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
         # 从配置文件获取cookie
         ck = get_cookie()
         # 运行主程序
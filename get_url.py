@@ -1,6 +1,6 @@
 import asyncio
 from dataclasses import dataclass
-from typing import List, Union
+from typing import List, Optional, Union
 import json
 import re
 import os
@@ -11,9 +11,20 @@ from bs4 import BeautifulSoup
 
 # 从配置文件导入
 from config import (
-    API_DOMAIN, get_cookie, get_request_headers_with_cookie, 
-    REQUEST_CONFIG, DIRECTORIES
+    get_cookie, api_url, REQUEST_CONFIG, DIRECTORIES
 )
+from http_client import create_session, fetch_user_page
+from mirrors import mirror_probing
+from account_pool import AccountPool, get_account_pool
+from cover_dedupe import CoverDedupe
+from seen_index import SeenIndex
+from json_stream import JsonStream, JsonStreamWriter
+import metrics
+import tracing
+import profiling
+
+# 流式处理输入文件时每批获取下载链接的漫画数
+STREAM_BATCH = 100
 
 @dataclass
 class DownloadLink:
@@ -21,18 +32,17 @@ class DownloadLink:
     text: str
     type: str
 
-async def get_download_links(session: aiohttp.ClientSession, cookie: str, comic_id: int) -> dict:
-    """获取漫画的下载链接"""
-    url = f"https://{API_DOMAIN}/download-index-aid-{comic_id}.html"
-    headers = get_request_headers_with_cookie(cookie)
-    
-    async with session.get(url, headers=headers) as resp:
-        text = await resp.text()
-        if resp.status != 200:
-            raise RuntimeError(f"Unexpected status {resp.status}: {text}")
-    
+async def get_download_links(session: aiohttp.ClientSession, cookie: str, comic_id: int,
+                             pool: Optional[AccountPool] = None) -> dict:
+    """获取漫画的下载链接（传入 pool 时由账号池中的某个账号请求）"""
+    url = f"/download-index-aid-{comic_id}.html"
+    if pool is not None:
+        text = await pool.fetch_user_page(session, url)
+    else:
+        text = await fetch_user_page(session, cookie, url)
     return parse_download_links(text)
 
+@profiling.stage()
 def parse_download_links(html: str) -> dict:
     """解析下载页面获取下载链接"""
     soup = BeautifulSoup(html, "html.parser")
@@ -52,7 +62,7 @@ def parse_download_links(html: str) -> dict:
                 full_url = f"https:{href}"
             # 如果是相对路径，添加域名
             elif href.startswith('/'):
-                full_url = f"https://{API_DOMAIN}{href}"
+                full_url = api_url(href)
             # 否则直接使用
             else:
                 full_url = href
@@ -81,7 +91,7 @@ def parse_download_links(html: str) -> dict:
                 if href.startswith('//'):
                     full_url = f"https:{href}"
                 elif href.startswith('/'):
-                    full_url = f"https://{API_DOMAIN}{href}"
+                    full_url = api_url(href)
                 else:
                     full_url = href
                 
@@ -93,17 +103,28 @@ def parse_download_links(html: str) -> dict:
     
     return links
 
-async def get_download_links_safe(session: aiohttp.ClientSession, cookie: str, comic_id: int, comic_title: str = "") -> dict:
+async def get_download_links_safe(session: aiohttp.ClientSession, cookie: str, comic_id: int, comic_title: str = "",
+                                  pool: Optional[AccountPool] = None) -> dict:
     """安全地获取单个漫画的下载链接，出错时返回空字典"""
     try:
-        links = await get_download_links(session, cookie, comic_id)
+        links = await get_download_links(session, cookie, comic_id, pool)
         return links
     except Exception as e:
         print(f"获取漫画 '{comic_title}' (ID: {comic_id}) 的下载链接失败: {e}")
         return {}
 
-async def get_download_links_batch(session: aiohttp.ClientSession, cookie: str, comic_ids: List[Union[int, dict]]) -> dict:
-    """批量获取漫画的下载链接"""
+async def get_download_links_batch(session: aiohttp.ClientSession, cookie: str, comic_ids: List[Union[int, dict]],
+                                   pool: Optional[AccountPool] = None, dedupe: Optional[CoverDedupe] = None) -> dict:
+    """批量获取漫画的下载链接
+
+    传入账号池时不再按固定批次+延迟处理，而是由各账号自己的限速控制节奏，并发数随账号数增长。
+    传入 dedupe 时先比较封面，与已下载漫画相似的漫画标记 duplicate_of，不获取链接。
+    """
+    if dedupe is not None:
+        comic_ids = await _skip_duplicates(comic_ids, dedupe)
+    if pool is not None:
+        return await _get_download_links_pooled(session, comic_ids, pool)
+
     results = {}
     
     # 从配置文件获取批量处理大小和延迟时间
@@ -113,6 +134,7 @@ async def get_download_links_batch(session: aiohttp.ClientSession, cookie: str,
     for i in range(0, len(comic_ids), batch_size):
         batch = comic_ids[i:i + batch_size]
         tasks = []
+        metrics.QUEUE_DEPTH.set(len(comic_ids) - i, "links")
         
         for item in batch:
             if isinstance(item, dict):
@@ -126,7 +148,11 @@ async def get_download_links_batch(session: aiohttp.ClientSession, cookie: str,
             tasks.append((comic_id, task))
         
         # 执行当前批次
-        batch_results = await asyncio.gather(*[task for _, task in tasks])
+        metrics.INFLIGHT.inc(len(tasks), "links")
+        try:
+            batch_results = await asyncio.gather(*[task for _, task in tasks])
+        finally:
+            metrics.INFLIGHT.dec(len(tasks), "links")
         
         # 存储结果
         for (comic_id, _), links in zip(tasks, batch_results):
@@ -138,8 +164,49 @@ async def get_download_links_batch(session: aiohttp.ClientSession, cookie: str,
         
         # 增加延迟避免请求过于频繁，防止IP被封
         if i + batch_size < len(comic_ids):
-            await asyncio.sleep(delay)
+            with tracing.span("batch_delay", "wait"):
+                await asyncio.sleep(delay)
     
+    metrics.QUEUE_DEPTH.set(0, "links")
+    return results
+
+async def _skip_duplicates(comic_ids: List[Union[int, dict]], dedupe: CoverDedupe) -> List[Union[int, dict]]:
+    comics = [item for item in comic_ids if isinstance(item, dict)]
+    with tracing.span("cover_dedupe", "phase", count=len(comics)):
+        duplicates = await dedupe.find_duplicates(comics)
+    if not duplicates:
+        return comic_ids
+    for comic in comics:
+        match = duplicates.get(str(comic.get('id')))
+        if match:
+            print(f"跳过疑似重复: {comic.get('title', '')} (ID: {comic['id']}) ≈ 已下载 ID {match[0]}，距离 {match[1]}")
+    return [item for item in comic_ids if not (isinstance(item, dict) and str(item.get('id')) in duplicates)]
+
+async def _get_download_links_pooled(session: aiohttp.ClientSession, comic_ids: List[Union[int, dict]],
+                                     pool: AccountPool) -> dict:
+    results = {}
+    semaphore = asyncio.Semaphore(pool.concurrency)
+    total = len(comic_ids)
+    done = 0
+
+    async def resolve(item):
+        nonlocal done
+        if isinstance(item, dict):
+            comic_id, comic_title = item.get('id'), item.get('title', '')
+        else:
+            comic_id, comic_title = item, ""
+        async with semaphore:
+            metrics.INFLIGHT.inc(1, "links")
+            try:
+                results[comic_id] = await get_download_links_safe(session, "", comic_id, comic_title, pool)
+            finally:
+                metrics.INFLIGHT.dec(1, "links")
+        done += 1
+        metrics.QUEUE_DEPTH.set(total - done, "links")
+        if done % 10 == 0 or done == total:
+            print(f"已处理 {done}/{total} 本漫画的下载链接")
+
+    await asyncio.gather(*(resolve(item) for item in comic_ids))
     return results
 
 def scan_json_files():
@@ -154,9 +221,9 @@ def scan_json_files():
         if filename.endswith('.json'):
             filepath = os.path.join(search_dir, filename)
             try:
-                # 尝试读取JSON文件获取基本信息
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                # 流式读取JSON文件获取基本信息（元数据在 comics 数组之后，逐条跳过数组）
+                with JsonStream(filepath) as stream:
+                    data = stream.drain()
                 
                 total_comics = data.get('total_comics', 0)
                 
@@ -244,73 +311,120 @@ def select_json_file():
             print("\n操作已取消")
             return None
 
+class _EmptyInput(Exception):
+    """输入文件中没有漫画，不生成输出文件"""
+
+async def _resolve_and_write(session, cookie, comics, pool, writer, dedupe=None, seen=None) -> int:
+    """获取一批漫画的下载链接并写入输出文件，返回获取成功的数量
+
+    seen 中记录的、已在其他 url 文件中拿到链接的漫画不再获取，直接复制那里的链接（下载时仍会下载）；
+    已经下载过的漫画不再获取，原样写出。
+    """
+    pending = comics
+    download_results = {}
+    if seen is not None:
+        resolved = [c.get('id') for c in comics if seen.is_resolved(c.get('id'))]
+        copied = seen.find_links(resolved) if resolved else {}
+        pending = []
+        for comic in comics:
+            comic_id = comic.get('id')
+            if str(comic_id) in copied:
+                download_results[comic_id] = copied[str(comic_id)]
+            elif not seen.is_downloaded(comic_id):
+                # 找不到原链接（其他文件在建索引后被改动）的漫画照常获取
+                pending.append(comic)
+        if len(pending) < len(comics):
+            print(f"跳过 {len(comics) - len(pending)} 本已在其他文件中获取过链接或已下载的漫画"
+                  f"（复制已有链接 {len(download_results)} 本）")
+    if pending:
+        download_results.update(await get_download_links_batch(session, cookie, pending, pool, dedupe))
+    found = 0
+    with profiling.stage_span("json_dump", "io"):
+        for comic in comics:
+            comic_id = comic.get('id')
+            if comic_id in download_results:
+                comic['download_links'] = download_results[comic_id]
+            found += bool(comic.get('download_links'))
+            writer.write(comic)
+    return found
+
 async def main_from_json(cookie: str, json_file: str):
-    """从JSON文件读取漫画信息并获取下载链接"""
+    """从JSON文件读取漫画信息并获取下载链接，返回输出文件路径（失败返回 None）
+
+    边读边处理：每读到 STREAM_BATCH 本就获取这一批的下载链接并写入输出文件，
+    不需要先把整个文件读进内存，内存占用与文件大小无关。
+    """
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        comics = data.get('comics', [])
-        if not comics:
-            print("JSON文件中没有找到漫画数据")
-            return
-        
+        # 创建url目录
+        url_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['downloads'])
+        os.makedirs(url_dir, exist_ok=True)
+
+        # 生成输出文件名
+        input_filename = os.path.basename(json_file)
+        if input_filename.endswith('.json'):
+            base_name = input_filename[:-5]  # 去掉.json
+        else:
+            base_name = input_filename
+
+        output_filename = f"{base_name}_with_downloads.json"
+        output_filepath = os.path.join(url_dir, output_filename)
+
+        pool = get_account_pool()
+        dedupe = CoverDedupe.from_config()
+        # 输出文件本身不算：重新处理同一个输入文件时应当重新获取链接
+        seen = SeenIndex.from_config(exclude=[output_filepath])
+        total_with_links = 0
+        shelf_name = None
+
+        async with create_session() as session, mirror_probing(session):
+            print("正在获取下载链接...")
+            if pool is not None:
+                print(f"使用 {len(pool.accounts)} 个账号并发获取下载链接")
+            # 保持原有数据结构，只添加下载链接
+            with JsonStream(json_file) as stream, \
+                    JsonStreamWriter(output_filepath, fields_before=stream.fields) as writer, \
+                    tracing.span("resolve_links"):
+                batch = []
+                for comic in stream:
+                    if shelf_name is None and isinstance(comic.get('shelf'), dict):
+                        shelf_name = comic['shelf'].get('name', '未知书架')
+                    batch.append(comic)
+                    if len(batch) >= STREAM_BATCH:
+                        total_with_links += await _resolve_and_write(session, cookie, batch, pool, writer, dedupe, seen)
+                        batch = []
+                if batch:
+                    total_with_links += await _resolve_and_write(session, cookie, batch, pool, writer, dedupe, seen)
+
+                if not stream.count:
+                    raise _EmptyInput()
+                writer.fields_after.update(stream.fields)
+                data = stream.fields
+
         # 检查JSON格式类型
-        is_search_result = 'search_metadata' in data
-        metadata_info = ""
-        
-        if is_search_result:
+        if 'search_metadata' in data:
             search_meta = data.get('search_metadata', {})
             search_query = search_meta.get('search_query', '')
             search_type = search_meta.get('search_type', '')
             metadata_info = f" (搜索结果: {search_query}, 类型: {search_type})"
-        else:
+        elif 'shelf_metadata' in data:
             # 书架信息格式
-            if 'shelf_metadata' in data:
-                shelf_meta = data['shelf_metadata']
-                shelf_name = shelf_meta.get('shelf_name', '未知书架')
-                metadata_info = f" (书架: {shelf_name})"
-            elif comics and comics[0].get('shelf'):
-                shelf_name = comics[0]['shelf'].get('name', '未知书架')
-                metadata_info = f" (书架: {shelf_name})"
-        
-        print(f"从JSON文件中读取到 {len(comics)} 本漫画{metadata_info}")
-        
-        async with aiohttp.ClientSession() as session:
-            # 获取下载链接
-            print("正在获取下载链接...")
-            download_results = await get_download_links_batch(session, cookie, comics)
-            
-            # 更新漫画数据
-            for comic in comics:
-                comic_id = comic.get('id')
-                if comic_id in download_results:
-                    comic['download_links'] = download_results[comic_id]
-            
-            # 创建url目录
-            url_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['downloads'])
-            os.makedirs(url_dir, exist_ok=True)
-            
-            # 生成输出文件名
-            input_filename = os.path.basename(json_file)
-            if input_filename.endswith('.json'):
-                base_name = input_filename[:-5]  # 去掉.json
-            else:
-                base_name = input_filename
-            
-            output_filename = f"{base_name}_with_downloads.json"
-            output_filepath = os.path.join(url_dir, output_filename)
-            
-            # 保持原有数据结构，只添加下载链接
-            with open(output_filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            print(f"下载链接已添加并保存到: {output_filepath}")
-            
-            # 统计下载链接情况
-            total_with_links = sum(1 for comic in comics if comic.get('download_links'))
-            print(f"成功获取下载链接的漫画: {total_with_links}/{len(comics)}")
-            
+            metadata_info = f" (书架: {data['shelf_metadata'].get('shelf_name', '未知书架')})"
+        elif shelf_name:
+            metadata_info = f" (书架: {shelf_name})"
+        else:
+            metadata_info = ""
+
+        print(f"从JSON文件中读取到 {stream.count} 本漫画{metadata_info}")
+        print(f"下载链接已添加并保存到: {output_filepath}")
+
+        # 统计下载链接情况
+        print(f"成功获取下载链接的漫画: {total_with_links}/{stream.count}")
+        if pool is not None:
+            print(f"账号使用情况: {pool.summary()}")
+        return output_filepath
+
+    except _EmptyInput:
+        print("JSON文件中没有找到漫画数据")
     except FileNotFoundError:
         print(f"文件 {json_file} 不存在")
     except json.JSONDecodeError:
@@ -340,7 +454,7 @@ async def main_interactive():
 
 async def main_single(cookie: str, comic_id: int):
     """获取单个漫画的下载链接"""
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session, mirror_probing(session):
         print(f"正在获取漫画 ID: {comic_id} 的下载链接...")
         links = await get_download_links_safe(session, cookie, comic_id)
         
@@ -358,6 +472,9 @@ if __name__ == "__main__":
     import sys
     
     try:
+        metrics.start_from_config()
+        tracing.start_from_config()
+        profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
         # 从配置文件获取cookie
         ck = get_cookie()
         
@@ -0,0 +1,182 @@
+"""
+统一HTTP客户端
+所有工具共用的连接池会话：keep-alive 连接复用、DNS缓存、共享TLS上下文、统一超时与重试策略（retry.py），
+重复请求同一主机时无需重新建立TCP和TLS连接
+"""
+import asyncio
+import ssl
+import threading
+import time
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+# 从配置文件导入
+from config import (
+    get_headers, get_request_headers_with_cookie, get_api_domain, api_url,
+    HTTP_CONFIG, REQUEST_CONFIG
+)
+from auth import CookieManager, get_cookie_manager, is_session_expired
+from mirrors import get_mirror_selector
+from retry import PAGE_POLICY, RETRYABLE_STATUS, parse_retry_after
+import metrics
+import tracing
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_sync_session: Optional[requests.Session] = None
+_sync_lock = threading.Lock()
+
+
+class HTTPStatusError(RuntimeError):
+    """非200响应"""
+
+    def __init__(self, status: int, text: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"Unexpected status {status}: {text[:200]}")
+        self.status = status
+        self.retry_after = retry_after  # 服务器要求的等待时间（Retry-After），由重试策略使用
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """进程内共享的TLS上下文"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def create_session(*, verify_ssl: bool = True, timeout: Optional[aiohttp.ClientTimeout] = None,
+                   limit_per_host: Optional[int] = None, **kwargs) -> aiohttp.ClientSession:
+    """创建带连接池的 aiohttp 会话（需在事件循环中调用）"""
+    connector = aiohttp.TCPConnector(
+        ssl=get_ssl_context() if verify_ssl else False,
+        limit=HTTP_CONFIG['pool_limit'],
+        limit_per_host=limit_per_host or HTTP_CONFIG['pool_limit_per_host'],
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_CONFIG['dns_cache_ttl'],
+        keepalive_timeout=HTTP_CONFIG['keepalive_timeout'],
+    )
+    if timeout is None:
+        timeout = aiohttp.ClientTimeout(total=REQUEST_CONFIG['timeout'] * 3, connect=REQUEST_CONFIG['timeout'])
+    trace_configs = tracing.trace_configs()
+    if trace_configs:
+        kwargs["trace_configs"] = trace_configs + kwargs.get("trace_configs", [])
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=get_headers(), **kwargs)
+
+
+def get_sync_session() -> requests.Session:
+    """进程内共享的 requests 会话（用于同步工具）"""
+    global _sync_session
+    with _sync_lock:
+        if _sync_session is None:
+            session = requests.Session()
+            # pool_connections 是缓存的主机连接池个数，pool_maxsize 是每个主机连接池的连接数
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_CONFIG['pool_limit'],
+                pool_maxsize=HTTP_CONFIG['pool_limit_per_host'],
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(get_headers())
+            _sync_session = session
+        return _sync_session
+
+
+def resolve_url(url: str) -> Tuple[str, Optional[str]]:
+    """以 / 开头的站内路径用当前选用的域名拼接，返回 (完整URL, 使用的域名)"""
+    if url.startswith("/"):
+        domain = get_api_domain()
+        return api_url(url), domain
+    return url, None
+
+
+async def fetch_text(session: aiohttp.ClientSession, url: str, *, headers: Optional[dict] = None,
+                     params: Optional[dict] = None, max_retries: Optional[int] = None) -> Tuple[str, str]:
+    """GET 页面并返回 (文本, 最终URL)，网络错误和可重试状态码按统一策略（retry.PAGE_POLICY）重试
+
+    url 为站内路径（以 / 开头）时，每次尝试都使用当前选用的域名，失败会上报给镜像选择器，
+    当前域名不可用时下一次重试会自动切换到其他镜像。主机熔断时直接抛出 CircuitOpenError。
+    """
+    selector = get_mirror_selector()
+    target = {}
+
+    def pick_host() -> str:
+        # 每次尝试前重新拼接URL，镜像切换后重试直接使用新域名
+        target["url"], target["domain"] = resolve_url(url)
+        return urlparse(target["url"]).netloc
+
+    async def attempt() -> Tuple[str, str]:
+        full_url, domain = target["url"], target["domain"]
+        # referer 跟随当前域名
+        request_headers = get_headers() if domain and headers is None else headers
+        start = time.monotonic()
+        try:
+            async with session.get(full_url, headers=request_headers, params=params) as resp:
+                with tracing.span("body", "net"):
+                    text = await resp.text()
+                metrics.observe_request(full_url, resp.status, time.monotonic() - start)
+                if resp.status == 200:
+                    if domain:
+                        selector.report_success(domain)
+                    return text, str(resp.url)
+                if domain and resp.status >= 500:
+                    selector.report_failure(domain)
+                retry_after = parse_retry_after(resp.headers.get("Retry-After")) \
+                    if resp.status in RETRYABLE_STATUS else None
+                raise HTTPStatusError(resp.status, text, retry_after)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.observe_request(full_url, type(e).__name__, time.monotonic() - start)
+            if domain:
+                selector.report_failure(domain)
+            raise
+
+    return await PAGE_POLICY.run(attempt, host=pick_host, component="http", max_attempts=max_retries)
+
+
+async def fetch_user_page(session: aiohttp.ClientSession, cookie: str, url: str,
+                          manager: Optional[CookieManager] = None) -> str:
+    """获取需要登录的页面（url 可以是站内路径），Cookie失效时自动重新登录并重试一次
+
+    manager 为该Cookie所属账号的 CookieManager，默认使用全局账号。
+    """
+    manager = manager or get_cookie_manager()
+    cookie = manager.resolve(cookie)
+    for attempt in range(2):
+        text, final_url = await fetch_text(session, url, headers=get_request_headers_with_cookie(cookie))
+        # Cookie失效时重新登录（多个并发请求只会触发一次登录）后重试
+        if attempt == 0 and is_session_expired(final_url, text):
+            cookie = await manager.refresh(cookie)
+            continue
+        return text
+
+
+def sync_get(url: str, *, params: Optional[dict] = None, headers: Optional[dict] = None,
+             timeout: Optional[float] = None) -> requests.Response:
+    """使用共享会话发送同步 GET 请求（不含重试，由调用方决定重试策略）
+
+    url 为站内路径时使用当前选用的域名，连接失败或5xx会上报给镜像选择器。
+    """
+    if timeout is None:
+        timeout = REQUEST_CONFIG['timeout']
+    full_url, domain = resolve_url(url)
+    if domain and headers is None:
+        headers = get_headers()  # referer 跟随当前域名
+    selector = get_mirror_selector()
+    start = time.monotonic()
+    try:
+        with tracing.span(f"GET {urlparse(full_url).netloc}{urlparse(full_url).path}", "request"):
+            resp = get_sync_session().get(full_url, params=params, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        metrics.observe_request(full_url, type(e).__name__, time.monotonic() - start)
+        if domain:
+            selector.report_failure(domain)
+        raise
+    metrics.observe_request(full_url, resp.status_code, time.monotonic() - start)
+    if domain:
+        if resp.status_code >= 500:
+            selector.report_failure(domain)
+        else:
+            selector.report_success(domain)
+    return resp
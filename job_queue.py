@@ -0,0 +1,267 @@
+"""
+持久化任务队列
+基于 SQLite 的优先级队列，守护进程用它保存待获取下载链接 / 待下载的漫画，重启后不会丢失也不会重复抓取。
+同一种任务里每本漫画只会入队一次（kind + comic_id 唯一），已完成的记录保留下来用于去重。
+
+多个节点可以共用同一个队列文件（放在共享目录上）：
+- 取任务时获得带有效期的租约（lease），处理期间由心跳续期；
+- 节点宕机后租约过期，任务会被其他节点自动重新领取；
+- 每次领取都会生成新的租约令牌，完成/失败/续期都要求令牌一致，
+  因此租约已被别人接手的旧节点无法再提交结果，每个任务只会被完成一次。
+所有写操作都在 BEGIN IMMEDIATE 事务中进行，多个进程同时领取也不会拿到同一个任务。
+等待锁时会阻塞（最长 queue_busy_timeout 秒），守护进程通过 asyncio.to_thread 调用，
+同一个连接上的操作由线程锁串行执行。
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# 从配置文件导入
+from config import DAEMON_CONFIG
+
+LINKS = "links"
+DOWNLOAD = "download"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        comic_id INTEGER NOT NULL,
+        priority REAL NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        payload TEXT NOT NULL,
+        last_error TEXT,
+        not_before REAL NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        lease_owner TEXT,
+        lease_expires REAL NOT NULL DEFAULT 0,
+        lease_token INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (kind, comic_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (kind, state, priority DESC, id)",
+]
+
+# 旧版本队列文件没有租约相关的列
+_LEASE_COLUMNS = {
+    "lease_owner": "TEXT",
+    "lease_expires": "REAL NOT NULL DEFAULT 0",
+    "lease_token": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    comic_id: int
+    priority: float
+    attempts: int
+    payload: Dict
+    owner: str = ""
+    token: int = 0
+
+
+def default_queue_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), DAEMON_CONFIG['queue_file'])
+
+
+def default_node_id(queue_path: Optional[str] = None) -> str:
+    """默认节点ID：主机名 + 队列文件路径，重启后不变，recover 才能找回上次异常退出时持有的任务
+
+    同一台机器上对同一个队列运行多个节点时，需要用 node_id 配置或 --node-id 区分。
+    """
+    if DAEMON_CONFIG['node_id']:
+        return DAEMON_CONFIG['node_id']
+    return f"{socket.gethostname()}:{os.path.abspath(queue_path or default_queue_path())}"
+
+
+class JobQueue:
+    """任务状态: pending → running（持有租约）→ done / failed（失败会退回 pending 重试，直到达到最大次数）"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_queue_path()
+        # 自己管理事务（isolation_level=None），写操作统一用 BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.path, timeout=DAEMON_CONFIG['queue_busy_timeout'], isolation_level=None,
+                                    check_same_thread=False)
+        self._lock = threading.RLock()  # 可能从不同线程调用（asyncio.to_thread），事务不能交叉
+        # 网络文件系统上 WAL 不可用，可在配置中改为 DELETE
+        self.conn.execute(f"PRAGMA journal_mode={DAEMON_CONFIG['queue_journal_mode']}")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self.conn.execute(statement)
+            existing = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _LEASE_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    # ---------- 入队 ---------- #
+    def _insert(self, kind: str, comic_id: int, payload: Dict, priority: float) -> bool:
+        now = time.time()
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, comic_id, priority, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, comic_id, priority, json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        return cur.rowcount > 0
+
+    def push(self, kind: str, comic_id: int, payload: Dict, priority: float = 0.0) -> bool:
+        """入队，已存在（无论状态）时忽略并返回 False"""
+        with self._transaction():
+            return self._insert(kind, comic_id, payload, priority)
+
+    # ---------- 领取与租约 ---------- #
+    def claim(self, kind: str, owner: str, lease_seconds: Optional[float] = None) -> Optional[Job]:
+        """领取优先级最高的可处理任务（待处理的，或租约已过期的），返回 None 表示暂时没有"""
+        lease_seconds = lease_seconds or DAEMON_CONFIG['lease_seconds']
+        with self._transaction():
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT id, kind, comic_id, priority, attempts, payload, lease_token FROM jobs "
+                "WHERE kind = ? AND ((state = 'pending' AND not_before <= ?) "
+                "                    OR (state = 'running' AND lease_expires < ?)) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (kind, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            token = row[6] + 1
+            self.conn.execute(
+                "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?, lease_token = ?, "
+                "updated_at = ? WHERE id = ?",
+                (owner, now + lease_seconds, token, now, row[0]),
+            )
+        return Job(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), owner, token)
+
+    def heartbeat(self, job: Job, lease_seconds: Optional[float] = None) -> bool:
+        """续期租约，返回 False 表示租约已经丢失（过期后被其他节点领取）"""
+        lease_seconds = lease_seconds or DAEMON_CONFIG['lease_seconds']
+        with self._transaction():
+            cur = self.conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = 'running' AND lease_token = ?",
+                (time.time() + lease_seconds, job.id, job.token),
+            )
+        return cur.rowcount > 0
+
+    def complete(self, job: Job, then: Optional[Tuple[str, Dict]] = None) -> bool:
+        """完成任务；then=(kind, payload) 时在同一事务中入队后续任务（沿用本任务的优先级）
+
+        只有仍持有租约的节点才能完成，返回 False 表示租约已丢失、结果被丢弃。
+        """
+        with self._transaction():
+            cur = self.conn.execute(
+                "UPDATE jobs SET state = 'done', lease_expires = 0, updated_at = ? "
+                "WHERE id = ? AND state = 'running' AND lease_token = ?",
+                (time.time(), job.id, job.token),
+            )
+            if cur.rowcount == 0:
+                return False
+            if then is not None:
+                self._insert(then[0], job.comic_id, then[1], job.priority)
+        return True
+
+    def fail(self, job: Job, error: str, retry_delay: float = 0.0) -> Optional[bool]:
+        """记录失败；未达到最大次数时退回队列（retry_delay 秒后才会再被取出）
+
+        返回是否还会重试；租约已丢失（任务已由其他节点接手）时不做任何修改，返回 None。
+        """
+        attempts = job.attempts + 1
+        retry = attempts < DAEMON_CONFIG['max_attempts']
+        now = time.time()
+        with self._transaction():
+            cur = self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = ?, last_error = ?, not_before = ?, lease_expires = 0, "
+                "updated_at = ? WHERE id = ? AND state = 'running' AND lease_token = ?",
+                ("pending" if retry else "failed", attempts, error[:500], now + retry_delay, now,
+                 job.id, job.token),
+            )
+        if cur.rowcount == 0:
+            return None
+        return retry
+
+    def release(self, job: Job, delay: float = 0.0) -> bool:
+        """未处理完就停止（或暂时无法处理）时，把任务原样放回队列，不计入失败次数；delay 秒后才会再被取出
+
+        返回 False 表示租约已丢失，任务不归本节点处理。
+        """
+        now = time.time()
+        with self._transaction():
+            cur = self.conn.execute(
+                "UPDATE jobs SET state = 'pending', lease_expires = 0, not_before = ?, updated_at = ? "
+                "WHERE id = ? AND state = 'running' AND lease_token = ?",
+                (now + delay, now, job.id, job.token),
+            )
+        return cur.rowcount > 0
+
+    def recover(self, owner: Optional[str] = None) -> int:
+        """启动时调用：把指定节点（默认本节点）上次异常退出时持有的任务放回队列
+
+        其他节点的任务不动，它们的租约过期后会被自动领取。
+        """
+        with self._transaction():
+            cur = self.conn.execute(
+                "UPDATE jobs SET state = 'pending', lease_expires = 0 WHERE state = 'running' AND lease_owner = ?",
+                (owner or default_node_id(self.path),),
+            )
+        return cur.rowcount
+
+    # ---------- 统计 ---------- #
+    def ready_count(self, kind: str) -> int:
+        """现在就可以领取的任务数（不含等待重试的和租约有效的）"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE kind = ? AND ((state = 'pending' AND not_before <= ?) "
+                "OR (state = 'running' AND lease_expires < ?))",
+                (kind, now, now),
+            ).fetchone()
+        return row[0]
+
+    def pending_count(self, kind: str) -> int:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE kind = ? AND state IN ('pending', 'running')", (kind,)
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """按任务类型和状态统计"""
+        result: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            rows = self.conn.execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state").fetchall()
+        for kind, state, count in rows:
+            result.setdefault(kind, {})[state] = count
+        return result
+
+    def running_by_node(self) -> Dict[str, int]:
+        """各节点当前持有（租约未过期）的任务数"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT lease_owner, COUNT(*) FROM jobs WHERE state = 'running' AND lease_expires >= ? "
+                "GROUP BY lease_owner",
+                (time.time(),),
+            ).fetchall()
+        return {owner: count for owner, count in rows}
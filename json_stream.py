@@ -0,0 +1,200 @@
+"""
+流式 JSON 读写
+search_results/ 和 url/ 下的文件可能有几十MB（indent=2），json.load 要先把所有记录读进内存才能开始处理。
+这里逐条解析顶层对象中的 comics 数组：解析出一条就交出一条，内存占用与文件大小无关；
+数组前后的其他顶层字段（total_comics、search_metadata 等）照常读取。
+写入时同样逐条写出，输出与 json.dump(..., ensure_ascii=False, indent=2) 完全一致。
+"""
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024  # 每次从文件读取的字符数
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _Scanner:
+    """带缓冲的增量扫描器：只保留尚未解析的部分，每个值交给 C 实现的 raw_decode 解析"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（文件结束时返回空串）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise json.JSONDecodeError(f"期望 {ch!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 值被缓冲区截断：再读一段重试，文件已读完时才是真正的格式错误
+                if self._fill():
+                    continue
+                raise
+            # 数字恰好在缓冲区末尾时可能只解析了一部分
+            if end >= len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+class JsonStream:
+    """逐条读取顶层对象中的数组（默认 comics）
+
+        with JsonStream(path) as stream:
+            for comic in stream:
+                ...
+            stream.fields  # 数组以外的顶层字段，遍历完数组后才完整
+
+    数组只能遍历一次。
+    """
+
+    def __init__(self, path: str, array_key: str = "comics"):
+        self.path = path
+        self.array_key = array_key
+        self.fields: Dict[str, Any] = {}
+        self.count = 0
+        self._file = None
+        self._scanner: Optional[_Scanner] = None
+        self._in_array = False
+
+    def __enter__(self) -> "JsonStream":
+        self._file = open(self.path, "r", encoding="utf-8")
+        self._scanner = _Scanner(self._file)
+        self._scanner.expect("{")
+        self._read_fields()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._file.close()
+
+    def _read_fields(self) -> None:
+        """读取顶层字段，直到进入目标数组或对象结束"""
+        scanner = self._scanner
+        while True:
+            ch = scanner.peek()
+            if ch == "}":
+                scanner.pos += 1
+                return
+            if ch == ",":
+                scanner.pos += 1
+                continue
+            if ch == "":
+                raise json.JSONDecodeError("文件意外结束", scanner.buf, scanner.pos)
+            key = scanner.value()
+            scanner.expect(":")
+            if key == self.array_key and scanner.peek() == "[":
+                scanner.pos += 1
+                self._in_array = True
+                return
+            self.fields[key] = scanner.value()
+
+    def __iter__(self) -> Iterator[Any]:
+        scanner = self._scanner
+        while self._in_array:
+            ch = scanner.peek()
+            if ch == "]":
+                scanner.pos += 1
+                self._in_array = False
+                self._read_fields()
+                return
+            if ch == ",":
+                scanner.pos += 1
+                continue
+            if ch == "":
+                raise json.JSONDecodeError("文件意外结束", scanner.buf, scanner.pos)
+            item = scanner.value()
+            self.count += 1
+            yield item
+
+    def drain(self) -> Dict[str, Any]:
+        """跳过剩余的数组元素（只计数），返回完整的顶层字段"""
+        for _ in self:
+            pass
+        return self.fields
+
+
+def iter_items(path: str, array_key: str = "comics") -> Iterator[Any]:
+    """逐条返回文件中数组的元素"""
+    with JsonStream(path, array_key) as stream:
+        yield from stream
+
+
+class JsonStreamWriter:
+    """逐条写出 {...字段, "comics": [...], ...字段}
+
+    先写入临时文件，正常结束时才替换目标文件；出错时目标文件保持不变。
+    """
+
+    def __init__(self, path: str, array_key: str = "comics", fields_before: Optional[Dict] = None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.array_key = array_key
+        self.fields_before = fields_before or {}
+        self.fields_after: Dict[str, Any] = {}  # 只写出数组前还没有写过的字段
+        self._written = set()
+        self.count = 0
+        self._file = None
+
+    def __enter__(self) -> "JsonStreamWriter":
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self._file.write("{")
+        for key, value in self.fields_before.items():
+            self._write_field(key, value)
+            self._file.write(",")
+            self._written.add(key)
+        self._file.write(f"\n  {json.dumps(self.array_key, ensure_ascii=False)}: [")
+        return self
+
+    def _write_field(self, key: str, value: Any) -> None:
+        text = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._file.write(f"\n  {json.dumps(key, ensure_ascii=False)}: {text}")
+
+    def write(self, item: Any) -> None:
+        text = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        self._file.write(f"{',' if self.count else ''}\n    {text}")
+        self.count += 1
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is not None:
+            self._file.close()
+            os.remove(self.tmp_path)
+            return
+        self._file.write("\n  ]" if self.count else "]")
+        for key, value in self.fields_after.items():
+            if key in self._written:
+                continue
+            self._file.write(",")
+            self._write_field(key, value)
+        self._file.write("\n}")
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
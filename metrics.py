@@ -0,0 +1,256 @@
+"""
+运行指标
+以 Prometheus 文本格式暴露请求数、延迟直方图、下载字节数、吞吐、重试、镜像切换、进行中任务和队列深度。
+可以开启 HTTP `/metrics` 端点，也可以定期写入 textfile（供 node_exporter 的 textfile collector 读取）。
+
+指标始终在内存中累加（只是字典查找和整数加法），下载循环中按块批量上报，不会拖慢热路径；
+只有开启端点或 textfile 时才会有额外的线程。
+"""
+import atexit
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+# 从配置文件导入
+from config import METRICS_CONFIG
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_str(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _sort_key(item):
+    # 标签值可能混合整数状态码和错误类型名，统一按字符串排序
+    return tuple(str(v) for v in item[0])
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values.items(), key=_sort_key):
+            lines.append(f"{self.name}{_label_str(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels) -> None:
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels) -> None:
+        self.inc(-amount, *labels)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values.items(), key=_sort_key):
+            lines.append(f"{self.name}{_label_str(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, list] = {}  # labels -> [各桶计数..., 总和, 总数]
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, series in sorted(self.series.items(), key=_sort_key):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _label_str(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _label_str(self.label_names + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.label_names, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_str(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+# --------------------------------------------------------------------------- #
+#                                  指标定义                                    #
+# --------------------------------------------------------------------------- #
+REQUESTS = Counter("wnacg_requests_total", "HTTP requests by host, page type and status",
+                   ("host", "page_type", "status"))
+REQUEST_LATENCY = Histogram("wnacg_request_duration_seconds", "HTTP request latency by host and page type",
+                            ("host", "page_type"))
+DOWNLOAD_BYTES = Counter("wnacg_download_bytes_total", "Archive bytes downloaded", ("host",))
+DOWNLOAD_THROUGHPUT = Gauge("wnacg_download_throughput_bytes_per_second",
+                            "Throughput of the most recent archive download", ("host",))
+DOWNLOADS = Counter("wnacg_downloads_total", "Finished comic downloads by result", ("result",))
+RETRIES = Counter("wnacg_retries_total", "Retries by component", ("component",))
+MIRROR_FALLBACKS = Counter("wnacg_mirror_fallbacks_total", "Switches to another mirror or download link",
+                           ("kind",))
+INFLIGHT = Gauge("wnacg_inflight_tasks", "Tasks currently in flight", ("component",))
+QUEUE_DEPTH = Gauge("wnacg_queue_depth", "Items waiting in a queue", ("queue",))
+ACCOUNT_REQUESTS = Counter("wnacg_account_requests_total", "Logged-in page requests by pool account and result",
+                           ("account", "result"))
+CIRCUIT_OPEN = Gauge("wnacg_circuit_open", "1 while the circuit breaker for a host is open", ("host",))
+DISK_BYTES = Gauge("wnacg_disk_bytes", "Free and reserved bytes on the download disk", ("kind",))
+
+ALL_METRICS = [REQUESTS, REQUEST_LATENCY, DOWNLOAD_BYTES, DOWNLOAD_THROUGHPUT, DOWNLOADS,
+               RETRIES, MIRROR_FALLBACKS, INFLIGHT, QUEUE_DEPTH, ACCOUNT_REQUESTS,
+               CIRCUIT_OPEN, DISK_BYTES]
+
+
+def page_type(url: str) -> str:
+    """根据URL路径归类页面类型，避免标签基数爆炸"""
+    path = urlparse(url).path if "://" in url else url
+    if path.startswith("/search/"):
+        return "search"
+    if path.startswith("/albums-index-"):
+        return "tag"
+    if path.startswith("/users-users_fav-"):
+        return "favorite"
+    if path.startswith("/download-index-"):
+        return "download_page"
+    if path.startswith("/users-check_login"):
+        return "login"
+    if path.startswith("/photos-gallery-"):
+        return "gallery"
+    if path.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp")):
+        return "image"
+    return "other"
+
+
+def observe_request(url: str, status, duration: float) -> None:
+    """记录一次HTTP请求（status 为状态码或错误类型名）"""
+    host = urlparse(url).netloc
+    kind = page_type(url)
+    REQUESTS.inc(1, host, kind, status)
+    REQUEST_LATENCY.observe(duration, host, kind)
+
+
+def render() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------------------------- #
+#                               端点 & textfile                                #
+# --------------------------------------------------------------------------- #
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_textfile_thread: Optional[threading.Thread] = None
+
+
+def write_textfile(path: str) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> int:
+    """在后台线程启动 /metrics 端点，返回实际端口"""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server.server_address[1]
+
+
+def start_textfile_writer(path: str, interval: float) -> None:
+    """在后台线程定期写入 textfile，进程退出时再写一次"""
+    global _textfile_thread
+    if _textfile_thread is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_textfile(path)
+            except OSError:
+                pass
+
+    _textfile_thread = threading.Thread(target=loop, name="metrics-textfile", daemon=True)
+    _textfile_thread.start()
+    atexit.register(write_textfile, path)
+
+
+def start_from_config(port: Optional[int] = None, textfile: Optional[str] = None) -> None:
+    """按参数 / 环境变量 / METRICS_CONFIG 开启指标输出（都未配置时什么也不做）"""
+    if port is None:
+        port = int(os.environ.get("WNACG_METRICS_PORT") or METRICS_CONFIG["port"] or 0)
+    if textfile is None:
+        textfile = os.environ.get("WNACG_METRICS_TEXTFILE") or METRICS_CONFIG["textfile"]
+
+    if port:
+        actual = start_http_server(port)
+        print(f"指标端点: http://127.0.0.1:{actual}/metrics")
+    if textfile:
+        start_textfile_writer(textfile, METRICS_CONFIG["textfile_interval"])
+        print(f"指标将定期写入: {textfile}")
@@ -0,0 +1,164 @@
+"""
+下载镜像历史表现
+每次下载都按 parse_download_links 给出的顺序尝试链接，即使第一个镜像已经连续几周又慢又不稳定。
+这里按下载链接的主机记录每次下载尝试的结果，保存在 url/.mirror_stats，跨运行累积：
+- 成功率：成功/失败次数按 decay 衰减，反映最近的表现，恢复正常的镜像几次成功后就能回到前面；
+- 首字节时间（TTFB）和下载速度：各保留最近 window 个样本，取中位数；
+- 失败类型：超时、停滞、HTTP 状态码等，便于查看镜像出了什么问题。
+下载前按预计完成时间 (TTFB + 大小 / 速度) / 成功率 排列链接，没有记录的镜像按先验值估计；
+另有 epsilon 的概率把一个非最优链接放到最前面试一次，这样最近恢复的镜像也能被发现。
+
+用法: python mirror_stats.py
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# 从配置文件导入
+from config import DIRECTORIES, DOWNLOAD_CONFIG, MIRROR_STATS_CONFIG
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _median(values) -> Optional[float]:
+    return statistics.median(values) if values else None
+
+
+def link_host(link_info: Dict) -> str:
+    return urlparse(link_info.get("url", "")).netloc
+
+
+class MirrorStats:
+    """下载镜像（按主机）的成功率、TTFB、速度和失败类型"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else Path(BASE_DIR) / DIRECTORIES['downloads'] / MIRROR_STATS_CONFIG['file']
+        self.hosts: Dict[str, Dict] = {}  # 主机 -> {"ok", "fail", "errors", "ttfb", "speed", "updated"}
+        self._load()
+
+    @classmethod
+    def from_config(cls) -> Optional["MirrorStats"]:
+        """按配置加载；未启用时返回 None（保持链接原有顺序）"""
+        if not MIRROR_STATS_CONFIG['enabled']:
+            return None
+        return cls()
+
+    # ---------- 读写 ---------- #
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.hosts = json.load(f).get("hosts", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.hosts = {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"hosts": self.hosts}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # ---------- 记录 ---------- #
+    def _entry(self, host: str) -> Dict:
+        entry = self.hosts.setdefault(host, {"ok": 0.0, "fail": 0.0, "errors": {}, "ttfb": [], "speed": []})
+        # 旧的结果逐渐失去权重
+        decay = MIRROR_STATS_CONFIG['decay']
+        entry["ok"] *= decay
+        entry["fail"] *= decay
+        entry["updated"] = time.time()
+        return entry
+
+    @staticmethod
+    def _sample(samples: list, value: float) -> None:
+        samples.append(round(value, 3))
+        del samples[:-MIRROR_STATS_CONFIG['window']]
+
+    def record_success(self, host: str, ttfb: float, speed: float) -> None:
+        """一次完整下载：ttfb 为收到响应头的耗时（秒），speed 为响应体的下载速度（字节/秒）"""
+        entry = self._entry(host)
+        entry["ok"] += 1
+        self._sample(entry["ttfb"], ttfb)
+        if speed > 0:
+            self._sample(entry["speed"], speed)
+        self.save()
+
+    def record_failure(self, host: str, error: str, ttfb: Optional[float] = None,
+                       speed: Optional[float] = None) -> None:
+        """一次失败的尝试；停滞时的速度同样计入速度样本"""
+        entry = self._entry(host)
+        entry["fail"] += 1
+        entry["errors"][error] = entry["errors"].get(error, 0) + 1
+        if ttfb is not None:
+            self._sample(entry["ttfb"], ttfb)
+        if speed is not None:
+            self._sample(entry["speed"], speed)
+        self.save()
+
+    # ---------- 估计 & 排序 ---------- #
+    def success_rate(self, host: str) -> float:
+        """Beta(1, 1) 先验平滑后的成功率，没有记录时为 0.5"""
+        entry = self.hosts.get(host, {})
+        ok, fail = entry.get("ok", 0.0), entry.get("fail", 0.0)
+        return (ok + 1) / (ok + fail + 2)
+
+    def expected_seconds(self, host: str, size: Optional[int] = None) -> float:
+        """在该镜像上下载 size 字节预计需要的时间（含失败后重来的期望开销）"""
+        entry = self.hosts.get(host, {})
+        if size is None:
+            size = DOWNLOAD_CONFIG['unknown_size_mb'] * 1024 * 1024
+        ttfb = _median(entry.get("ttfb"))
+        if ttfb is None:
+            ttfb = MIRROR_STATS_CONFIG['prior_ttfb']
+        speed = _median(entry.get("speed"))
+        if speed is None:
+            speed = MIRROR_STATS_CONFIG['prior_speed_kb'] * 1024
+        # 总是停滞的镜像中位数速度为 0：按下限估计（预计时间很长），而不是当作没有记录
+        speed = max(speed, MIRROR_STATS_CONFIG['min_speed_kb'] * 1024)
+        return (ttfb + size / speed) / self.success_rate(host)
+
+    def order(self, links: Dict[str, Dict], size: Optional[int] = None) -> Dict[str, Dict]:
+        """按预计完成时间重新排列下载链接；相同时保持原顺序"""
+        if len(links) < 2:
+            return links
+        items = list(links.items())
+        # sorted 是稳定排序，没有记录的镜像之间保持 parse_download_links 的顺序
+        items = sorted(items, key=lambda item: self.expected_seconds(link_host(item[1]), size))
+        if random.random() < MIRROR_STATS_CONFIG['epsilon']:
+            # 探索：随机把一个非最优链接放到最前面，其余顺序不变
+            items.insert(0, items.pop(random.randrange(1, len(items))))
+        return dict(items)
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+def main() -> int:
+    stats = MirrorStats()
+    if not stats.hosts:
+        print(f"还没有下载记录: {stats.path}")
+        return 0
+    size = DOWNLOAD_CONFIG['unknown_size_mb'] * 1024 * 1024
+    print(f"镜像记录: {stats.path}（预计时间按 {DOWNLOAD_CONFIG['unknown_size_mb']} MB 计算）")
+    for host in sorted(stats.hosts, key=lambda h: stats.expected_seconds(h, size)):
+        entry = stats.hosts[host]
+        speed = _median(entry["speed"])
+        ttfb = _median(entry["ttfb"])
+        errors = sorted(entry["errors"].items(), key=lambda pair: -pair[1])[:3]
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.get("updated", 0)))
+        print(f"  {host}: 成功率 {stats.success_rate(host):.0%} | "
+              f"速度 {f'{speed / 1024:.0f} KB/s' if speed is not None else '-'} | "
+              f"TTFB {f'{ttfb:.2f}s' if ttfb is not None else '-'} | "
+              f"预计 {stats.expected_seconds(host, size):.0f}s | 最近 {updated}")
+        if errors:
+            print(f"      失败: {'，'.join(f'{name} ×{count}' for name, count in errors)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
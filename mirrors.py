@@ -0,0 +1,155 @@
+"""
+镜像域名选择
+对 API_DOMAINS 中的域名测速（RTT）和健康检查，自动选用最快的可用域名；
+请求失败时切换到下一个可用域名。所有页面URL都在发送时通过 config.api_url 拼接，
+因此切换后排队中的请求会直接使用新域名，不会丢失
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiohttp
+import requests
+
+# 从配置文件导入
+from config import get_api_domains, get_api_domain, set_api_domain, get_headers, api_url, MIRROR_CONFIG
+import metrics
+
+
+class MirrorSelector:
+    """记录每个域名的RTT和健康状态，并选出当前最优域名"""
+
+    def __init__(self, domains: Optional[List[str]] = None):
+        self.domains = domains or get_api_domains()
+        self.stats: Dict[str, Dict] = {
+            d: {"rtt": None, "healthy": True, "failures": 0, "checked_at": 0.0} for d in self.domains
+        }
+        self._lock = threading.Lock()
+
+    # ---------- 状态更新 ---------- #
+    def record_probe(self, domain: str, ok: bool, rtt: Optional[float] = None) -> None:
+        with self._lock:
+            stat = self.stats[domain]
+            stat["checked_at"] = time.time()
+            if ok:
+                # 指数加权平均，避免单次抖动导致频繁切换
+                stat["rtt"] = rtt if stat["rtt"] is None else 0.7 * stat["rtt"] + 0.3 * rtt
+                stat["healthy"] = True
+                stat["failures"] = 0
+            else:
+                stat["healthy"] = False
+                stat["failures"] += 1
+
+    def report_failure(self, domain: str) -> None:
+        """请求失败时调用，连续失败达到阈值后切换域名"""
+        if domain not in self.stats:
+            return
+        with self._lock:
+            stat = self.stats[domain]
+            stat["failures"] += 1
+            if stat["failures"] >= MIRROR_CONFIG['failure_threshold']:
+                stat["healthy"] = False
+        if domain == get_api_domain():
+            self.select()
+
+    def report_success(self, domain: str) -> None:
+        if domain not in self.stats:
+            return
+        with self._lock:
+            self.stats[domain]["failures"] = 0
+            self.stats[domain]["healthy"] = True
+
+    def select(self) -> str:
+        """选出最快的可用域名并设为当前域名"""
+        with self._lock:
+            healthy = [d for d in self.domains if self.stats[d]["healthy"]]
+            candidates = healthy or self.domains
+            # 未测速的域名排在已测速的之后，保持配置中的先后顺序
+            best = min(candidates, key=lambda d: (self.stats[d]["rtt"] is None,
+                                                  self.stats[d]["rtt"] or 0,
+                                                  self.domains.index(d)))
+        current = get_api_domain()
+        if best != current:
+            print(f"切换域名: {current} -> {best}")
+            set_api_domain(best)
+            metrics.MIRROR_FALLBACKS.inc(1, "api_domain")
+        return best
+
+    # ---------- 测速 ---------- #
+    async def probe(self, session: aiohttp.ClientSession, domain: str) -> None:
+        timeout = aiohttp.ClientTimeout(total=MIRROR_CONFIG['probe_timeout'])
+        start = time.monotonic()
+        try:
+            async with session.get(api_url("/", domain), headers=get_headers(api_url("/", domain)),
+                                   timeout=timeout, allow_redirects=False) as resp:
+                ok = resp.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            ok = False
+        self.record_probe(domain, ok, time.monotonic() - start)
+
+    async def probe_all(self, session: aiohttp.ClientSession) -> str:
+        await asyncio.gather(*(self.probe(session, d) for d in self.domains))
+        return self.select()
+
+    def probe_sync(self, domain: str) -> None:
+        start = time.monotonic()
+        try:
+            resp = requests.get(api_url("/", domain), headers=get_headers(api_url("/", domain)),
+                                timeout=MIRROR_CONFIG['probe_timeout'], allow_redirects=False)
+            ok = resp.status_code < 500
+        except requests.RequestException:
+            ok = False
+        self.record_probe(domain, ok, time.monotonic() - start)
+
+    def probe_all_sync(self) -> str:
+        with ThreadPoolExecutor(max_workers=len(self.domains)) as executor:
+            list(executor.map(self.probe_sync, self.domains))
+        return self.select()
+
+    async def run_background(self, session: aiohttp.ClientSession) -> None:
+        """后台周期测速"""
+        while True:
+            await asyncio.sleep(MIRROR_CONFIG['probe_interval'])
+            await self.probe_all(session)
+
+
+_selector: Optional[MirrorSelector] = None
+
+
+def get_mirror_selector() -> MirrorSelector:
+    """获取进程内共享的 MirrorSelector"""
+    global _selector
+    if _selector is None:
+        _selector = MirrorSelector()
+    return _selector
+
+
+def select_fastest_sync() -> str:
+    """同步工具启动时调用：只有一个域名时不测速"""
+    selector = get_mirror_selector()
+    if len(selector.domains) > 1:
+        return selector.probe_all_sync()
+    return get_api_domain()
+
+
+@asynccontextmanager
+async def mirror_probing(session: aiohttp.ClientSession):
+    """异步工具运行期间：先测速选出最快域名，然后在后台周期测速"""
+    selector = get_mirror_selector()
+    if len(selector.domains) <= 1:
+        yield selector
+        return
+
+    await selector.probe_all(session)
+    task = asyncio.create_task(selector.run_background(session))
+    try:
+        yield selector
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,221 @@
+"""
+下载后处理
+下载完成的压缩包交给进程池处理，下载协程只负责提交，CPU 密集的工作在其他核上与下载同时进行：
+- 逐个读取 ZIP/CBZ 中的图片（不解压到磁盘）；
+- 可选用 Pillow 转码为更小的格式（webp/jpeg）并限制宽度，转码后反而更大的图片保留原图；
+- 根据保存的漫画记录（标题、ID、书架）生成 ComicInfo.xml；
+- 按页码顺序重新打包为 CBZ，写入 POSTPROCESS_CONFIG['output_dir']。
+RAR/7z 等格式需要外部工具，直接跳过。
+
+用法: python postprocess.py <压缩包或目录>...
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from xml.etree import ElementTree
+
+from tqdm import tqdm
+
+# 从配置文件导入
+from config import api_url, POSTPROCESS_CONFIG
+import metrics
+import tracing
+import profiling
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖，只有转码需要
+    Image = None
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+ARCHIVE_EXTENSIONS = {".zip", ".cbz"}
+_PIL_FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+
+def _natural_key(name: str):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def comic_record(comic: Dict) -> Dict:
+    """ComicInfo.xml 需要的字段（在主进程中生成，避免子进程依赖镜像选择状态）"""
+    shelf = comic.get("shelf") or {}
+    record = {"title": comic.get("title", ""), "id": comic.get("id"), "shelf": shelf.get("name", "")}
+    if comic.get("id") is not None:
+        record["web"] = api_url(f"/photos-index-aid-{comic['id']}.html")
+    return record
+
+
+def build_comic_info(record: Dict, page_count: int) -> bytes:
+    root = ElementTree.Element("ComicInfo", {
+        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+        "xmlns:xsd": "http://www.w3.org/2001/XMLSchema",
+    })
+    fields = [
+        ("Title", record.get("title")),
+        ("Web", record.get("web")),
+        ("Notes", f"wnacg:{record['id']}" if record.get("id") is not None else None),
+        ("Genre", record.get("shelf")),
+        ("PageCount", str(page_count)),
+        ("Manga", "YesAndRightToLeft"),
+    ]
+    for tag, value in fields:
+        if value:
+            ElementTree.SubElement(root, tag).text = value
+    ElementTree.indent(root)
+    return b'<?xml version="1.0" encoding="utf-8"?>\n' + ElementTree.tostring(root, encoding="utf-8")
+
+
+def _transcode(data: bytes, name: str, options: Dict):
+    """转码单张图片，返回 (数据, 文件名)；转码后没有变小时返回原图"""
+    fmt, ext = _PIL_FORMATS[options["transcode"]]
+    with Image.open(io.BytesIO(data)) as img:
+        if options["max_width"] and img.width > options["max_width"]:
+            height = round(img.height * options["max_width"] / img.width)
+            img = img.resize((options["max_width"], height), Image.LANCZOS)
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, fmt, quality=options["quality"])
+    if out.tell() >= len(data):
+        return data, name
+    return out.getvalue(), os.path.splitext(name)[0] + ext
+
+
+def process_archive(archive_path: str, output_path: str, record: Dict, options: Dict) -> Dict:
+    """在子进程中运行：读取压缩包 → 转码 → 写入带 ComicInfo.xml 的 CBZ，返回统计"""
+    start = time.monotonic()
+    transcode = options.get("transcode") and Image is not None
+    stats = {"archive": archive_path, "output": output_path, "pages": 0, "transcoded": 0,
+             "input_bytes": os.path.getsize(archive_path)}
+
+    part = output_path + ".part"
+    with zipfile.ZipFile(archive_path) as src, \
+            zipfile.ZipFile(part, "w", compression=zipfile.ZIP_STORED) as dst:
+        members = [m for m in src.infolist()
+                   if not m.is_dir() and os.path.splitext(m.filename)[1].lower() in IMAGE_EXTENSIONS]
+        members.sort(key=lambda m: _natural_key(m.filename))
+        for index, member in enumerate(members, 1):
+            data = src.read(member)
+            name = f"{index:03d}{os.path.splitext(member.filename)[1].lower()}"
+            if transcode:
+                new_data, name = _transcode(data, name, options)
+                stats["transcoded"] += new_data is not data
+                data = new_data
+            # 图片本身已压缩，存储模式即可
+            dst.writestr(name, data)
+        stats["pages"] = len(members)
+        dst.writestr("ComicInfo.xml", build_comic_info(record, len(members)), compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(part, output_path)
+
+    if not options.get("keep_archive", True) and os.path.abspath(archive_path) != os.path.abspath(output_path):
+        os.remove(archive_path)
+    stats["output_bytes"] = os.path.getsize(output_path)
+    stats["seconds"] = time.monotonic() - start
+    return stats
+
+
+class PostProcessor:
+    """把下载完成的压缩包提交到进程池；submit 不等待，close 时等待全部完成并汇总"""
+
+    def __init__(self, output_dir: Optional[str] = None, workers: Optional[int] = None):
+        self.options = dict(POSTPROCESS_CONFIG)
+        self.output_dir = Path(output_dir or self.options['output_dir'])
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        workers = workers or self.options['workers'] or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.tasks: List[asyncio.Future] = []
+        self.results: List[Dict] = []
+        self.failed: List[str] = []
+        if self.options['transcode'] and Image is None:
+            tqdm.write("⚠ 未安装 Pillow（pip install Pillow），跳过图片转码，只重新打包并写入 ComicInfo.xml")
+
+    def submit(self, archive_path: Path, comic: Dict) -> Optional[asyncio.Future]:
+        """提交一个压缩包，立即返回（不支持的格式返回 None）"""
+        if archive_path.suffix.lower() not in ARCHIVE_EXTENSIONS:
+            tqdm.write(f"  后处理跳过 {archive_path.name}: 只支持 ZIP/CBZ")
+            return None
+        output_path = self.output_dir / f"{archive_path.stem}.cbz"
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, process_archive, str(archive_path), str(output_path),
+                                      comic_record(comic), self.options)
+        metrics.QUEUE_DEPTH.inc(1, "postprocess")
+        task = asyncio.ensure_future(self._collect(future, archive_path))
+        self.tasks.append(task)
+        return task
+
+    async def _collect(self, future: asyncio.Future, archive_path: Path) -> None:
+        try:
+            with tracing.span("postprocess", "cpu", file=archive_path.name):
+                stats = await future
+        except Exception as e:  # 子进程中的任何错误都只影响这一个文件
+            self.failed.append(archive_path.name)
+            tqdm.write(f"  ✗ 后处理失败 {archive_path.name}: {e}")
+        else:
+            self.results.append(stats)
+            tqdm.write(f"  ✓ 已处理 {archive_path.name}: {stats['pages']} 页，"
+                       f"{stats['input_bytes'] / 1024 / 1024:.1f} MB → {stats['output_bytes'] / 1024 / 1024:.1f} MB")
+        finally:
+            metrics.QUEUE_DEPTH.dec(1, "postprocess")
+
+    async def close(self) -> None:
+        """等待所有已提交的任务完成并关闭进程池"""
+        if self.tasks:
+            pending = sum(1 for t in self.tasks if not t.done())
+            if pending:
+                tqdm.write(f"\n等待 {pending} 个后处理任务完成...")
+            with profiling.stage_span("postprocess_wait", "wait"):
+                await asyncio.gather(*self.tasks)
+        self.executor.shutdown()
+        self.print_summary()
+
+    def print_summary(self) -> None:
+        if not self.results and not self.failed:
+            return
+        before = sum(r["input_bytes"] for r in self.results)
+        after = sum(r["output_bytes"] for r in self.results)
+        transcoded = sum(r["transcoded"] for r in self.results)
+        tqdm.write(f"后处理: 成功 {len(self.results)} 个，失败 {len(self.failed)} 个，转码 {transcoded} 张图片，"
+                   f"{before / 1024 / 1024:.1f} MB → {after / 1024 / 1024:.1f} MB，输出到 {self.output_dir.resolve()}")
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+async def main(paths: List[str]) -> bool:
+    """处理已有的压缩包（目录会扫描其中的 ZIP/CBZ），标题取自文件名"""
+    archives = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            archives.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in ARCHIVE_EXTENSIONS))
+        elif path.exists():
+            archives.append(path)
+        else:
+            print(f"文件不存在: {path}")
+    if not archives:
+        print("没有找到需要处理的 ZIP/CBZ 文件")
+        return False
+
+    processor = PostProcessor()
+    for archive in archives:
+        processor.submit(archive, {"title": archive.stem})
+    await processor.close()
+    return not processor.failed
+
+
+if __name__ == "__main__":
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
+    if len(sys.argv) < 2:
+        print("用法: python postprocess.py <压缩包或目录>... [--profile]")
+        sys.exit(1)
+    try:
+        sys.exit(0 if asyncio.run(main(sys.argv[1:])) else 1)
+    except KeyboardInterrupt:
+        print("\n用户取消")
+        sys.exit(130)
@@ -0,0 +1,208 @@
+"""
+性能剖析
+`--profile` 时用 cProfile（确定性剖析）包住整个运行，同时开启 tracemalloc，
+并把耗时和内存分配归到各个阶段（parse_search_result、calculate_similarity、parse_get_favorite、
+parse_download_links、JSON 写入、下载循环等），退出时写到 profiles/ 目录：
+
+  <入口>_<时间>.prof         cProfile 原始数据，可用 `python -m pstats` 或 snakeviz 查看
+  <入口>_<时间>.tracemalloc  tracemalloc 快照，可用 tracemalloc.Snapshot.load 与其他运行对比
+  <入口>_<时间>.txt          文字报告：阶段汇总、最耗时函数、内存分配最多的代码行
+
+阶段用 @stage 装饰器或 stage_span() 标记，同时也会成为 tracing 的 span；两者都未开启时只多一次判断。
+cProfile 只剖析主线程（异步工具都在主线程的事件循环里），批量搜索的工作线程只体现在阶段汇总中。
+"""
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import PROFILING_CONFIG
+import tracing
+
+_profiler: Optional["Profiler"] = None
+
+
+class StageStats:
+    __slots__ = ("calls", "wall", "max_wall", "alloc")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.max_wall = 0.0
+        self.alloc = 0
+
+
+class Profiler:
+    """cProfile + tracemalloc，外加按阶段的耗时/内存汇总"""
+
+    def __init__(self, output_dir: str, name: str):
+        self.output_dir = output_dir
+        self.name = name
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile()
+        self._started = 0.0
+        self._baseline = None
+
+    def start(self) -> None:
+        tracemalloc.start(PROFILING_CONFIG['traceback_frames'])
+        self._baseline = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self._profile.enable()
+
+    def record(self, name: str, wall: float, alloc: int) -> None:
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.calls += 1
+            stats.wall += wall
+            stats.max_wall = max(stats.max_wall, wall)
+            stats.alloc += alloc
+
+    def stop(self) -> List[str]:
+        """停止剖析并写出文件，返回写出的文件路径"""
+        self._profile.disable()
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self._profile.dump_stats(base + ".prof")
+        snapshot.dump(base + ".tracemalloc")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(self.report(elapsed, peak, snapshot))
+        return [base + ".prof", base + ".tracemalloc", base + ".txt"]
+
+    def report(self, elapsed: float, peak: int, snapshot: tracemalloc.Snapshot) -> str:
+        top = PROFILING_CONFIG['top']
+        out = io.StringIO()
+        out.write(f"入口: {self.name}\n总耗时: {elapsed:.3f} s\n内存峰值（tracemalloc）: {peak / 1024 / 1024:.1f} MB\n\n")
+
+        out.write("=== 阶段汇总 ===\n")
+        out.write(f"{'阶段':<24}{'调用次数':>10}{'总耗时(s)':>12}{'占比':>8}{'单次最长(ms)':>14}{'净分配(MB)':>12}\n")
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1].wall, reverse=True)
+        for name, stats in stages:
+            share = stats.wall / elapsed * 100 if elapsed else 0
+            out.write(f"{name:<24}{stats.calls:>10}{stats.wall:>12.3f}{share:>7.1f}%"
+                      f"{stats.max_wall * 1000:>14.1f}{stats.alloc / 1024 / 1024:>12.2f}\n")
+        out.write("（并发的异步阶段会互相重叠，占比之和可能超过100%）\n\n")
+
+        out.write("=== 最耗时函数（累计时间） ===\n")
+        pstats.Stats(self._profile, stream=out).strip_dirs().sort_stats("cumulative").print_stats(top)
+
+        out.write("=== 内存分配最多的代码行（相对启动时） ===\n")
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = snapshot.filter_traces(filters).compare_to(self._baseline.filter_traces(filters), "lineno")
+        for stat in diff[:top]:
+            out.write(f"{stat}\n")
+        return out.getvalue()
+
+
+def enabled() -> bool:
+    return _profiler is not None
+
+
+def _entry_name() -> str:
+    return os.path.splitext(os.path.basename(sys.argv[0] or ""))[0] or "python"
+
+
+def start(output_dir: Optional[str] = None, name: Optional[str] = None) -> Profiler:
+    """开始剖析，进程退出时写出报告"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(output_dir or PROFILING_CONFIG['output_dir'], name or _entry_name())
+        _profiler.start()
+
+        def _stop():
+            paths = _profiler.stop()
+            print(f"性能剖析结果已保存到: {', '.join(paths)}")
+
+        atexit.register(_stop)
+    return _profiler
+
+
+def consume_cli_flag(argv: List[str]) -> Optional[str]:
+    """从 argv 中移除 `--profile` / `--profile=目录`（供按位置解析参数的脚本使用）
+
+    返回输出目录；只有 `--profile` 时返回空字符串（使用默认目录），没有该参数时返回 None。
+    """
+    for i, arg in enumerate(argv[1:], 1):
+        if arg == "--profile" or arg.startswith("--profile="):
+            del argv[i]
+            return arg.partition("=")[2]
+    return None
+
+
+def start_from_config(output_dir: Optional[str] = None, name: Optional[str] = None) -> Optional[Profiler]:
+    """按参数 / 环境变量 WNACG_PROFILE / PROFILING_CONFIG 开启剖析（都未配置时什么也不做）
+
+    output_dir 为 None 表示命令行未指定，空字符串表示指定了但使用默认目录。
+    """
+    if output_dir is None:
+        env = os.environ.get("WNACG_PROFILE")
+        if env is not None and env not in ("", "0"):
+            output_dir = "" if env == "1" else env
+        elif PROFILING_CONFIG['enabled']:
+            output_dir = ""
+    if output_dir is None:
+        return None
+    return start(output_dir or None, name)
+
+
+# --------------------------------------------------------------------------- #
+#                                   阶段                                       #
+# --------------------------------------------------------------------------- #
+@contextmanager
+def _measure(profiler: Profiler, name: str):
+    alloc_before = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, time.perf_counter() - start_time,
+                        tracemalloc.get_traced_memory()[0] - alloc_before)
+
+
+def stage_span(name: str, cat: str = "phase", **args):
+    """标记一个阶段：剖析时计入阶段汇总，追踪时记录为 span"""
+    profiler = _profiler
+    if profiler is None:
+        return tracing.span(name, cat, **args)
+    if not tracing.enabled():
+        return _measure(profiler, name)
+    return _combined(profiler, name, cat, args)
+
+
+@contextmanager
+def _combined(profiler: Profiler, name: str, cat: str, args: Dict):
+    with tracing.span(name, cat, **args), _measure(profiler, name):
+        yield
+
+
+def stage(name: Optional[str] = None, cat: str = "parse", trace: bool = True):
+    """函数装饰器版的 stage_span；trace=False 时不生成追踪 span（用于调用极其频繁的小函数）"""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None and not (trace and tracing.enabled()):
+                return func(*args, **kwargs)
+            context = stage_span(stage_name, cat) if trace else _measure(_profiler, stage_name)
+            with context:
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
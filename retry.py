@@ -0,0 +1,263 @@
+"""
+统一重试策略
+- RetryPolicy: 指数退避 + full jitter（第n次重试前随机等待 0 ~ min(cap, base * 2**n) 秒），
+  只重试网络错误、超时和可重试状态码（429/5xx），服务器返回 Retry-After 时按它等待；
+- CircuitBreaker: 按主机熔断。同一主机连续失败 breaker_threshold 次后熔断，
+  冷却期内对它的请求立即失败（CircuitOpenError），不再排队重试占用时间；
+  冷却结束后放行一个试探请求，成功则恢复，失败则重新熔断。
+页面请求、封面、压缩包下载和同步搜索共用同一套策略，只是参数不同（RETRY_CONFIG）。
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar, Union
+
+import aiohttp
+import requests
+
+# 从配置文件导入
+from config import RETRY_CONFIG
+import metrics
+import tracing
+
+T = TypeVar("T")
+HostArg = Union[str, Callable[[], str], None]
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """主机已熔断，请求未发出"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"主机 {host} 已熔断，{retry_in:.0f} 秒后再试")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class HostDegraded(RuntimeError):
+    """主机有响应但无法正常完成请求（例如下载停滞）：不重试，但计入熔断的连续失败次数"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或HTTP日期），无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """异常对应的HTTP状态码（HTTPStatusError / aiohttp / requests），没有则返回 None"""
+    status = getattr(error, "status", None)
+    if status is None and isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    return status
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError,
+                              requests.ConnectionError, requests.Timeout, ConnectionError))
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None and isinstance(error, requests.HTTPError) and error.response is not None:
+        retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+    return retry_after
+
+
+# --------------------------------------------------------------------------- #
+#                                  熔断器                                      #
+# --------------------------------------------------------------------------- #
+class _HostState:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None  # 熔断时间（monotonic），None 表示正常
+        self.probing = False  # 冷却结束后正在进行试探请求
+
+
+class CircuitBreaker:
+    """按主机记录连续失败次数（线程安全，同步搜索和异步请求可以共用）"""
+
+    def __init__(self, threshold: Optional[int] = None, cooldown: Optional[float] = None):
+        self.threshold = threshold or RETRY_CONFIG['breaker_threshold']
+        self.cooldown = cooldown or RETRY_CONFIG['breaker_cooldown']
+        self.hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> _HostState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = _HostState()
+        return state
+
+    def before(self, host: str) -> None:
+        """发送请求前调用，主机熔断中时抛出 CircuitOpenError"""
+        with self._lock:
+            state = self._state(host)
+            if state.opened_at is None:
+                return
+            retry_in = state.opened_at + self.cooldown - time.monotonic()
+            if retry_in > 0 or state.probing:
+                raise CircuitOpenError(host, max(retry_in, 0.0))
+            state.probing = True  # 冷却结束，放行这一个试探请求
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            state = self._state(host)
+            if state.opened_at is not None:
+                print(f"主机 {host} 已恢复")
+                metrics.CIRCUIT_OPEN.set(0, host)
+            state.failures = 0
+            state.opened_at = None
+            state.probing = False
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            state = self._state(host)
+            state.failures += 1
+            if state.probing or (state.opened_at is None and state.failures >= self.threshold):
+                if state.opened_at is None:
+                    print(f"主机 {host} 连续失败 {state.failures} 次，熔断 {self.cooldown} 秒")
+                metrics.CIRCUIT_OPEN.set(1, host)
+                state.opened_at = time.monotonic()
+                state.probing = False
+
+    def abandon(self, host: str) -> None:
+        """试探请求被取消，没有结果：让下一个请求继续试探"""
+        with self._lock:
+            self._state(host).probing = False
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            state = self.hosts.get(host)
+            return state is not None and state.opened_at is not None
+
+
+_breaker: Optional[CircuitBreaker] = None
+
+
+def get_breaker() -> CircuitBreaker:
+    """进程内共享的熔断器"""
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker()
+    return _breaker
+
+
+# --------------------------------------------------------------------------- #
+#                                  重试策略                                    #
+# --------------------------------------------------------------------------- #
+class RetryPolicy:
+    def __init__(self, name: str, max_attempts: int, base: float, cap: float):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+
+    @classmethod
+    def from_config(cls, name: str) -> "RetryPolicy":
+        return cls(name, **RETRY_CONFIG[name])
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次（从0开始）重试前的等待时间"""
+        if retry_after is not None:
+            return min(retry_after, RETRY_CONFIG['max_retry_after'])
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def _on_error(self, error: Exception, attempt: int, max_attempts: int, host: Optional[str],
+                  component: str) -> float:
+        """记录一次失败，返回重试前的等待时间；不应重试时重新抛出"""
+        retryable = is_retryable(error)
+        if host:
+            breaker = get_breaker()
+            if retryable or isinstance(error, HostDegraded):
+                breaker.record_failure(host)
+            elif error_status(error) is not None:
+                breaker.record_success(host)  # 主机返回了HTTP响应（如404），只是请求本身失败
+            elif not isinstance(error, CircuitOpenError):
+                breaker.abandon(host)  # 与主机无关的错误（如写入文件失败），不改变主机状态
+        if not retryable or attempt == max_attempts - 1:
+            raise error
+        metrics.RETRIES.inc(1, component)
+        return self.backoff(attempt, _retry_after(error))
+
+    async def run(self, func: Callable[[], Awaitable[T]], *, host: HostArg = None,
+                  component: Optional[str] = None, max_attempts: Optional[int] = None,
+                  on_retry: Optional[Callable[[int, float, Exception], None]] = None) -> T:
+        """执行 func，按策略重试
+
+        host 为请求的主机，用于熔断；每次尝试的主机可能不同（镜像切换）时传入返回主机的函数，
+        它会在每次尝试前调用。on_retry(attempt, delay, error) 在每次等待重试前调用。
+        """
+        max_attempts = max_attempts or self.max_attempts
+        component = component or self.name
+        breaker = get_breaker()
+        for attempt in range(max_attempts):
+            current_host = host() if callable(host) else host
+            if current_host:
+                breaker.before(current_host)
+            try:
+                result = await func()
+            except Exception as e:
+                error = e
+                delay = self._on_error(e, attempt, max_attempts, current_host, component)
+            except BaseException:
+                if current_host:
+                    breaker.abandon(current_host)
+                raise
+            else:
+                if current_host:
+                    breaker.record_success(current_host)
+                return result
+            if on_retry is not None:
+                on_retry(attempt, delay, error)
+            with tracing.span("retry_backoff", "wait"):
+                await asyncio.sleep(delay)
+
+    def run_sync(self, func: Callable[[], T], *, host: HostArg = None, component: Optional[str] = None,
+                 max_attempts: Optional[int] = None,
+                 on_retry: Optional[Callable[[int, float, Exception], None]] = None) -> T:
+        """run 的同步版本"""
+        max_attempts = max_attempts or self.max_attempts
+        component = component or self.name
+        breaker = get_breaker()
+        for attempt in range(max_attempts):
+            current_host = host() if callable(host) else host
+            if current_host:
+                breaker.before(current_host)
+            try:
+                result = func()
+            except Exception as e:
+                error = e
+                delay = self._on_error(e, attempt, max_attempts, current_host, component)
+            except BaseException:
+                if current_host:
+                    breaker.abandon(current_host)
+                raise
+            else:
+                if current_host:
+                    breaker.record_success(current_host)
+                return result
+            if on_retry is not None:
+                on_retry(attempt, delay, error)
+            with tracing.span("retry_backoff", "wait"):
+                time.sleep(delay)
+
+
+PAGE_POLICY = RetryPolicy.from_config("page")
+DOWNLOAD_POLICY = RetryPolicy.from_config("download")
@@ -2,24 +2,52 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import sys
-from urllib.parse import quote
+from urllib.parse import quote, urlparse
 import re
 from difflib import SequenceMatcher
 import json
 import csv
 from datetime import datetime
 import os
+import threading
+import heapq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
 # 从配置文件导入
 from config import (
-    API_DOMAIN, get_headers, REQUEST_CONFIG, SEARCH_CONFIG, 
+    REQUEST_CONFIG, SEARCH_CONFIG, 
     DIRECTORIES
 )
+from http_client import sync_get, resolve_url
+from retry import PAGE_POLICY, CircuitOpenError
+from mirrors import select_fastest_sync
+import metrics
+import tracing
+import profiling
 
 class SearchError(Exception):
     """搜索相关的异常"""
     pass
 
+class RateLimiter:
+    """线程安全的共享限速器，保证任意两次请求之间至少间隔 min_interval 秒"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait_time > 0:
+            with tracing.span("rate_limit", "wait"):
+                time.sleep(wait_time)
+
+@profiling.stage()
 def parse_search_result(html, is_tag=False):
     soup = BeautifulSoup(html, "html.parser")
     comics = []
@@ -82,27 +110,29 @@ def parse_search_result(html, is_tag=False):
         "is_search_by_tag": is_tag,
     }
 
-def make_request(url, params=None, max_retries=None):
-    """发送HTTP请求，包含重试机制"""
-    if max_retries is None:
-        max_retries = REQUEST_CONFIG['max_retries']
-    
-    headers = get_headers()
-    timeout = REQUEST_CONFIG['timeout']
-    
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, params=params, headers=headers, timeout=timeout)
-            resp.raise_for_status()
-            return resp
-        except requests.RequestException as e:
-            if attempt == max_retries - 1:
-                raise SearchError(f"请求失败: {e}")
-            print(f"请求失败，{2**attempt}秒后重试... ({attempt + 1}/{max_retries})")
-            time.sleep(2**attempt)
-
-def search_by_keyword(keyword, page_num=1):
-    """根据关键词搜索"""
+def make_request(url, params=None, max_retries=None, rate_limiter=None):
+    """发送HTTP请求，按统一策略（retry.PAGE_POLICY）重试
+
+    url 可以是站内路径（以 / 开头），每次重试都使用当前选用的镜像域名
+    """
+    def attempt():
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        resp = sync_get(url, params=params)
+        resp.raise_for_status()
+        return resp
+
+    def on_retry(attempt_index, delay, error):
+        print(f"请求失败，{delay:.1f}秒后重试... ({attempt_index + 1}/{max_retries or PAGE_POLICY.max_attempts}): {error}")
+
+    try:
+        return PAGE_POLICY.run_sync(attempt, host=lambda: urlparse(resolve_url(url)[0]).netloc,
+                                    component="search", max_attempts=max_retries, on_retry=on_retry)
+    except (requests.RequestException, CircuitOpenError) as e:
+        raise SearchError(f"请求失败: {e}")
+
+def keyword_search_request(keyword, page_num=1):
+    """关键词搜索页的 (站内路径, 查询参数)"""
     params = {
         "q": keyword,
         "syn": "yes",
@@ -110,17 +140,28 @@ def search_by_keyword(keyword, page_num=1):
         "s": "create_time_DESC",
         "p": page_num,
     }
-    url = f"https://{API_DOMAIN}/search/index.php"
-    resp = make_request(url, params=params)
+    return "/search/index.php", params
+
+def tag_search_request(tag_name, page_num=1):
+    """标签搜索页的 (站内路径, 查询参数)"""
+    encoded_tag = quote(tag_name, safe='')
+    return f"/albums-index-page-{page_num}-tag-{encoded_tag}.html", None
+
+def search_by_keyword(keyword, page_num=1, rate_limiter=None):
+    """根据关键词搜索"""
+    url, params = keyword_search_request(keyword, page_num)
+    resp = make_request(url, params=params, rate_limiter=rate_limiter)
     return parse_search_result(resp.text, is_tag=False)
 
-def search_by_tag(tag_name, page_num=1):
+def search_by_tag(tag_name, page_num=1, rate_limiter=None):
     """根据标签搜索"""
-    encoded_tag = quote(tag_name, safe='')
-    url = f"https://{API_DOMAIN}/albums-index-page-{page_num}-tag-{encoded_tag}.html"
-    resp = make_request(url)
+    url, params = tag_search_request(tag_name, page_num)
+    resp = make_request(url, params=params, rate_limiter=rate_limiter)
     return parse_search_result(resp.text, is_tag=True)
 
+# 结果按创建时间倒序排列的搜索（关键词搜索带 s=create_time_DESC；标签页不保证顺序）
+DATE_SORTED_SEARCHES = (search_by_keyword,)
+
 def normalize_title(title):
     """标准化标题，去除多余的空格和符号"""
     # 统一全角半角字符
@@ -157,6 +198,7 @@ def extract_chapter_info(title):
                 return match.group(1)
     return None
 
+@profiling.stage(cat="cpu", trace=False)
 def calculate_similarity(query, title):
     """计算查询词与标题的相似度"""
     query_norm = normalize_title(query.lower())
@@ -199,44 +241,158 @@ def smart_match_titles(query, comics, min_similarity=None):
     matched_comics.sort(key=lambda x: x['similarity'], reverse=True)
     return matched_comics
 
-def get_all_search_results(search_func, query, max_pages=None):
-    """获取所有搜索结果"""
+def iter_search_pages(search_func, query, max_pages=None, delay=0.5, verbose=True):
+    """逐页获取搜索结果的生成器，每获取一页即 yield (页码, 漫画列表)
+
+    调用方停止迭代即可提前结束，后续页面不会再被请求。
+    """
     if max_pages is None:
         max_pages = REQUEST_CONFIG['max_pages']
     
-    all_comics = []
+    log = print if verbose else (lambda *args, **kwargs: None)
     current_page = 1
     
-    print(f"正在获取搜索结果...")
-    
     while current_page <= max_pages:
         try:
-            print(f"正在获取第 {current_page} 页...", end='', flush=True)
+            log(f"正在获取第 {current_page} 页...", end='', flush=True)
             results = search_func(query, current_page)
-            
-            if not results['comics']:
-                print(" 无结果")
-                break
-            
-            all_comics.extend(results['comics'])
-            print(f" 获取到 {len(results['comics'])} 个结果")
-            
-            if current_page >= results['total_page']:
-                break
-            
-            current_page += 1
-            time.sleep(0.5)  # 避免请求过于频繁
-            
         except SearchError as e:
-            print(f"\n获取第 {current_page} 页时出错: {e}")
-            break
+            print(f"\n获取 '{query}' 第 {current_page} 页时出错: {e}")
+            return
         except Exception as e:
-            print(f"\n未知错误: {e}")
-            break
+            print(f"\n'{query}' 未知错误: {e}")
+            return
+        
+        if not results['comics']:
+            log(" 无结果")
+            return
+        
+        log(f" 获取到 {len(results['comics'])} 个结果")
+        yield current_page, results['comics']
+        
+        if current_page >= results['total_page']:
+            return
+        
+        current_page += 1
+        if delay:
+            with tracing.span("page_delay", "wait"):
+                time.sleep(delay)  # 避免请求过于频繁
+
+def get_all_search_results(search_func, query, max_pages=None, delay=0.5, verbose=True, on_page=None):
+    """获取所有搜索结果
+
+    on_page: 可选回调 on_page(query, comics)，每获取一页即调用一次
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    all_comics = []
+    
+    log("正在获取搜索结果...")
     
-    print(f"总共获取到 {len(all_comics)} 个结果")
+    for _, comics in iter_search_pages(search_func, query, max_pages, delay, verbose):
+        all_comics.extend(comics)
+        if on_page is not None:
+            on_page(query, comics)
+    
+    log(f"总共获取到 {len(all_comics)} 个结果")
     return all_comics
 
+def extract_create_date(comic):
+    """从 additional_info 中提取创建日期（如 '創建於2023-06-01'），失败返回 None"""
+    match = re.search(r'(\d{4})-(\d{1,2})-(\d{1,2})', comic.get('additional_info', ''))
+    if not match:
+        return None
+    try:
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))).date()
+    except ValueError:
+        return None
+
+class TopKMatches:
+    """维护相似度最高的 k 个结果（小顶堆）"""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._counter = 0  # 相似度相同时按出现顺序比较，避免比较字典
+
+    def add(self, comic):
+        item = (comic['similarity'], -self._counter, comic)
+        self._counter += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def items(self):
+        return [comic for _, _, comic in sorted(self._heap, reverse=True)]
+
+def stream_search(search_func, query, max_pages=None, top=None, min_similarity=None,
+                  high_similarity=None, enough_high=None, empty_page_patience=None,
+                  date_cutoff=None, date_sorted=None, verbose=True):
+    """流式搜索：逐页 yield 本页的匹配结果，并在满足条件时提前结束
+
+    - top: 可选 TopKMatches，用于维护全局最佳结果
+    - 高度匹配（>= high_similarity）累计达到 enough_high 个后停止
+    - 连续 empty_page_patience 页没有任何匹配后停止
+    - date_cutoff: datetime.date，早于该日期的结果被过滤掉
+    - date_sorted: 结果是否按创建时间倒序（默认按 search_func 判断，见 DATE_SORTED_SEARCHES）；
+      倒序时某页出现任何早于 date_cutoff 的结果即停止，后面的页只会更早；否则只过滤，不提前停止
+    """
+    if date_sorted is None:
+        date_sorted = search_func in DATE_SORTED_SEARCHES
+    if high_similarity is None:
+        high_similarity = SEARCH_CONFIG['high_similarity']
+    if enough_high is None:
+        enough_high = SEARCH_CONFIG['stream_enough_high']
+    if empty_page_patience is None:
+        empty_page_patience = SEARCH_CONFIG['stream_empty_page_patience']
+    
+    high_count = 0
+    empty_pages = 0
+    
+    for page_num, comics in iter_search_pages(search_func, query, max_pages, verbose=verbose):
+        reached_cutoff = False
+        if date_cutoff is not None:
+            dated = [(comic, extract_create_date(comic)) for comic in comics]
+            comics = [comic for comic, date in dated if date is None or date >= date_cutoff]
+            reached_cutoff = date_sorted and any(date is not None and date < date_cutoff for _, date in dated)
+        
+        matched = smart_match_titles(query, comics, min_similarity)
+        if top is not None:
+            for comic in matched:
+                top.add(comic)
+        if matched:
+            yield matched
+        
+        high_count += sum(1 for comic in matched if comic['similarity'] >= high_similarity)
+        empty_pages = 0 if matched else empty_pages + 1
+        
+        if high_count >= enough_high:
+            if verbose:
+                print(f"已找到 {high_count} 个高度匹配结果，提前结束 (第 {page_num} 页)")
+            return
+        if empty_pages >= empty_page_patience:
+            if verbose:
+                print(f"连续 {empty_pages} 页没有匹配结果，提前结束 (第 {page_num} 页)")
+            return
+        if reached_cutoff:
+            if verbose:
+                print(f"已到达日期下限 {date_cutoff}，提前结束 (第 {page_num} 页)")
+            return
+
+def get_top_search_results(search_func, query, max_pages=None, top_k=None, date_cutoff=None):
+    """使用流式搜索获取最佳匹配结果（按相似度排序）"""
+    if top_k is None:
+        top_k = SEARCH_CONFIG['stream_top_k']
+    
+    top = TopKMatches(top_k)
+    print("正在流式获取搜索结果...")
+    for _ in stream_search(search_func, query, max_pages, top=top, date_cutoff=date_cutoff):
+        pass
+    
+    comics = top.items()
+    print(f"保留最佳匹配结果 {len(comics)} 个")
+    return comics
+
 def display_category(title, comics_list):
         if not comics_list:
             return
@@ -269,8 +425,9 @@ def display_smart_results(query, comics, show_all=False):
         return
     
     # 分类显示
-    high_match = [c for c in matched_comics if c['similarity'] >= 0.8]
-    medium_match = [c for c in matched_comics if 0.5 <= c['similarity'] < 0.8]
+    high_similarity = SEARCH_CONFIG['high_similarity']
+    high_match = [c for c in matched_comics if c['similarity'] >= high_similarity]
+    medium_match = [c for c in matched_comics if 0.5 <= c['similarity'] < high_similarity]
     low_match = [c for c in matched_comics if c['similarity'] < 0.5]
     
     # 显示结果
@@ -290,7 +447,7 @@ def display_smart_results(query, comics, show_all=False):
     if show_all:
         total_shown += len(low_match)
     
-    print(f"\n=== 搜索统计 ===")
+    print("\n=== 搜索统计 ===")
     print(f"总结果数: {len(comics)}")
     print(f"匹配结果数: {len(matched_comics)}")
     print(f"显示结果数: {total_shown}")
@@ -301,7 +458,7 @@ def display_smart_results(query, comics, show_all=False):
 def save_results_to_json(results, filename):
     """保存结果到JSON文件"""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        with profiling.stage_span("json_dump", "io"), open(filename, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
         print(f"结果已保存到: {filename}")
         return True
@@ -352,10 +509,10 @@ def group_results_by_manga_name(comics):
     return manga_groups
 
 def save_grouped_results(comics, query, save_format='json'):
-    """按漫画名字保存分组结果，使用统一的书架格式"""
+    """按漫画名字保存分组结果，使用统一的书架格式，返回保存的文件路径列表"""
     if not comics:
         print("没有结果可保存")
-        return False
+        return []
     
     # 创建保存目录
     save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['search_results'])
@@ -424,7 +581,7 @@ def save_grouped_results(comics, query, save_format='json'):
     print(f"\n格式说明: 已转换为与书架信息相同的JSON格式，保存在search_results目录下")
     print(f"可使用get_url.py自动扫描该目录并选择文件获取下载链接")
     
-    return len(saved_files) > 0
+    return saved_files
 
 def ask_save_results(comics, query):
     """询问是否保存结果"""
@@ -476,6 +633,149 @@ def convert_search_result_to_shelf_format(comic, search_query=""):
         }
     }
 
+def load_batch_queries(queries_file):
+    """读取批量查询文件
+
+    每行一个查询，格式为 `keyword:关键词` 或 `tag:标签名`，
+    没有前缀的行按关键词处理；空行和以 # 开头的行会被忽略。
+    """
+    queries = []
+    seen = set()
+    with open(queries_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            search_type = 'keyword'
+            prefix, sep, rest = line.partition(':')
+            if sep and prefix.strip().lower() in ('keyword', 'tag'):
+                search_type = prefix.strip().lower()
+                line = rest.strip()
+            if not line or (search_type, line) in seen:
+                continue
+            seen.add((search_type, line))
+            queries.append((search_type, line))
+    return queries
+
+def batch_search(queries, max_pages=None, max_workers=None, min_interval=None):
+    """并发执行多个查询，共享同一个限速器，并在结果到达时按漫画ID去重
+
+    queries: [(search_type, query), ...]，search_type 为 'keyword' 或 'tag'
+    返回 (去重后的漫画列表, 每个查询的统计信息)
+    """
+    if max_workers is None:
+        max_workers = SEARCH_CONFIG['batch_workers']
+    if min_interval is None:
+        min_interval = SEARCH_CONFIG['batch_min_interval']
+    
+    rate_limiter = RateLimiter(min_interval)
+    merged = {}  # comic_id -> 漫画记录（保持首次出现的顺序）
+    query_stats = {}
+    lock = threading.Lock()
+    
+    def on_page(label, query, comics):
+        with lock:
+            stats = query_stats[label]
+            for comic in comics:
+                stats['results'] += 1
+                similarity = calculate_similarity(query, comic['title'])
+                existing = merged.get(comic['id'])
+                if existing is None:
+                    comic_copy = comic.copy()
+                    comic_copy['similarity'] = similarity
+                    comic_copy['chapter_info'] = extract_chapter_info(comic['title'])
+                    comic_copy['matched_queries'] = [label]
+                    merged[comic['id']] = comic_copy
+                    stats['new'] += 1
+                else:
+                    if label not in existing['matched_queries']:
+                        existing['matched_queries'].append(label)
+                    existing['similarity'] = max(existing['similarity'], similarity)
+    
+    def run_query(search_type, query):
+        search_func = search_by_tag if search_type == 'tag' else search_by_keyword
+        search_func = partial(search_func, rate_limiter=rate_limiter)
+        return get_all_search_results(search_func, query, max_pages, delay=0, verbose=False,
+                                      on_page=partial(on_page, f"{search_type}:{query}"))
+    
+    for search_type, query in queries:
+        query_stats[f"{search_type}:{query}"] = {'search_type': search_type, 'results': 0, 'new': 0}
+    
+    print(f"批量搜索: {len(queries)} 个查询，并发 {max_workers}，请求间隔 {min_interval}s")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_query, search_type, query): f"{search_type}:{query}"
+                   for search_type, query in queries}
+        for done, future in enumerate(as_completed(futures), 1):
+            label = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"查询 '{label}' 失败: {e}")
+            stats = query_stats[label]
+            with lock:
+                total_unique = len(merged)
+            print(f"[{done}/{len(queries)}] {label}: {stats['results']} 个结果，新增 {stats['new']} 个 (累计去重 {total_unique} 个)")
+    
+    return list(merged.values()), query_stats
+
+def save_batch_results(comics, queries_file, query_stats):
+    """将批量搜索结果保存为与书架格式统一的单个JSON文件"""
+    save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['search_results'])
+    os.makedirs(save_dir, exist_ok=True)
+    
+    batch_name = clean_filename(os.path.splitext(os.path.basename(queries_file))[0])
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filepath = os.path.join(save_dir, f"search_batch_{batch_name}_{timestamp}.json")
+    
+    converted_comics = []
+    for comic in comics:
+        first_query = comic['matched_queries'][0].split(':', 1)[1]
+        converted = convert_search_result_to_shelf_format(comic, first_query)
+        converted['search_info']['matched_queries'] = comic['matched_queries']
+        converted_comics.append(converted)
+    
+    save_data = {
+        'comics': converted_comics,
+        'total_comics': len(converted_comics),
+        'search_metadata': {
+            'search_query': os.path.basename(queries_file),
+            'search_time': datetime.now().isoformat(),
+            'queries': query_stats,
+            'search_type': 'batch'
+        }
+    }
+    
+    if save_results_to_json(save_data, filepath):
+        return filepath
+    return None
+
+def batch_search_from_file(queries_file, max_pages=None):
+    """非交互式批量搜索入口"""
+    try:
+        queries = load_batch_queries(queries_file)
+    except OSError as e:
+        print(f"读取查询文件失败: {e}")
+        return None
+    
+    if not queries:
+        print("查询文件中没有有效的查询")
+        return None
+    
+    comics, query_stats = batch_search(queries, max_pages)
+    print(f"\n=== 批量搜索统计 ===")
+    print(f"查询数: {len(queries)}")
+    print(f"原始结果数: {sum(stats['results'] for stats in query_stats.values())}")
+    print(f"去重后结果数: {len(comics)}")
+    
+    if not comics:
+        print("没有结果可保存")
+        return None
+    
+    filepath = save_batch_results(comics, queries_file, query_stats)
+    if filepath:
+        print(f"可使用get_url.py处理该文件获取下载链接")
+    return filepath
+
 def interactive_search():
     """交互式搜索界面"""
     print("=== WNACG 智能搜索工具 ===")
@@ -515,13 +815,16 @@ def interactive_search():
             except ValueError:
                 max_pages = 20
             
+            quick = input("快速模式（找到足够多高度匹配后提前结束）? (y/N): ").strip().lower() == 'y'
+            
             print(f"\n开始智能搜索: {query}")
             
-            # 直接获取所有页面结果
-            if search_type == '1':
-                all_comics = get_all_search_results(search_by_keyword, query, max_pages)
+            search_func = search_by_keyword if search_type == '1' else search_by_tag
+            if quick:
+                all_comics = get_top_search_results(search_func, query, max_pages)
             else:
-                all_comics = get_all_search_results(search_by_tag, query, max_pages)
+                # 直接获取所有页面结果
+                all_comics = get_all_search_results(search_func, query, max_pages)
             
             # 直接显示所有匹配度的结果
             display_smart_results(query, all_comics, show_all=True)
@@ -543,13 +846,35 @@ def search_command_line():
         print("用法:")
         print("  python search_id.py keyword <关键词> [页码]")
         print("  python search_id.py tag <标签名> [页码]")
+        print("  python search_id.py batch <查询文件> [最大页数]  # 批量搜索")
+        print("  python search_id.py stream <关键词> [日期下限YYYY-MM-DD]  # 流式搜索，提前结束")
+        print("  python search_id.py stream-tag <标签名> [日期下限YYYY-MM-DD]")
         print("  python search_id.py interactive  # 交互模式")
         return
     
     search_type = sys.argv[1].lower()
     query = sys.argv[2]
-    page = int(sys.argv[3]) if len(sys.argv) > 3 else 1
     
+    if search_type == 'batch':
+        max_pages = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        batch_search_from_file(query, max_pages)
+        return
+    
+    if search_type in ('stream', 'stream-tag'):
+        date_cutoff = None
+        if len(sys.argv) > 3:
+            try:
+                date_cutoff = datetime.strptime(sys.argv[3], '%Y-%m-%d').date()
+            except ValueError:
+                print("日期格式应为 YYYY-MM-DD")
+                return
+        search_func = search_by_tag if search_type == 'stream-tag' else search_by_keyword
+        comics = get_top_search_results(search_func, query, date_cutoff=date_cutoff)
+        display_smart_results(query, comics, show_all=True)
+        ask_save_results(comics, query)
+        return
+    
+    page = int(sys.argv[3]) if len(sys.argv) > 3 else 1
     try:
         if search_type == 'keyword':
             results = search_by_keyword(query, page)
@@ -570,6 +895,10 @@ def search_command_line():
         print(f"发生错误: {e}")
 
 if __name__ == "__main__":
+    metrics.start_from_config()
+    tracing.start_from_config()
+    profiling.start_from_config(profiling.consume_cli_flag(sys.argv))
+    select_fastest_sync()
     if len(sys.argv) > 1 and sys.argv[1].lower() == 'interactive':
         interactive_search()
     elif len(sys.argv) > 1:
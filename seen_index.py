@@ -0,0 +1,241 @@
+"""
+全局漫画ID索引
+书架和搜索结果经常重叠，每次运行 get_url.py 都会为其他 url/*_with_downloads.json 中已有链接的漫画重新获取链接。
+这里把 search_results/、url/ 和下载目录（压缩包存储）中出现过的漫画ID汇总成位图：
+- 每个来源文件的ID保存为有序的 uint32 数组（按文件大小和修改时间增量更新，只重新扫描变化的文件）；
+- 加载时按类别合并为位图：listed（search_results 中列出）、resolved（url 中已有下载链接）、
+  downloaded（压缩包存储中已下载），每个ID的查询都是 O(1)；
+- 索引保存在 url/.seen_index，文件很小，读取远快于重新解析所有 JSON。
+
+用法: python seen_index.py [漫画ID...]
+"""
+import base64
+import json
+import os
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+# 从配置文件导入
+from config import DIRECTORIES, SEEN_INDEX_CONFIG, STORE_CONFIG
+from json_stream import iter_items
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KINDS = ("listed", "resolved", "downloaded")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class Bitmap:
+    """非负整数集合，第 i 位表示 i 是否存在"""
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, value: int) -> None:
+        index = value >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index + 1 - len(self.bits)))
+        self.bits[index] |= 1 << (value & 7)
+
+    def update(self, values: Iterable[int]) -> None:
+        values = list(values)
+        if values:
+            self.add(max(values))  # 一次扩展到位
+        for value in values:
+            self.bits[value >> 3] |= 1 << (value & 7)
+
+    def __contains__(self, value) -> bool:
+        if not isinstance(value, int) or value < 0:
+            return False
+        index = value >> 3
+        return index < len(self.bits) and bool(self.bits[index] >> (value & 7) & 1)
+
+    def __len__(self) -> int:
+        return sum(bin(byte).count("1") for byte in self.bits if byte)
+
+
+def _comic_id(value) -> Optional[int]:
+    if isinstance(value, int) and value >= 0:
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def _pack(ids: Iterable[int]) -> str:
+    packed = array("I", sorted(set(ids)))
+    if not _LITTLE_ENDIAN:
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> array:
+    packed = array("I")
+    packed.frombytes(base64.b64decode(data))
+    if not _LITTLE_ENDIAN:
+        packed.byteswap()
+    return packed
+
+
+class SeenIndex:
+    """search_results/、url/ 和下载目录中出现过的漫画ID
+
+    exclude 中的文件不计入（例如正在重新生成的输出文件，否则它上次的内容会让本次所有漫画都被跳过）。
+    """
+
+    def __init__(self, download_dir: Optional[str] = None, exclude: Iterable[str] = ()):
+        self.search_dir = Path(BASE_DIR) / DIRECTORIES['search_results']
+        self.url_dir = Path(BASE_DIR) / DIRECTORIES['downloads']
+        self.store_index = Path(download_dir or SEEN_INDEX_CONFIG['download_dir']) / STORE_CONFIG['dir'] / "index.json"
+        self.index_path = self.url_dir / SEEN_INDEX_CONFIG['file']
+        self.exclude = {os.path.realpath(path) for path in exclude}
+        self.files: Dict[str, Dict] = {}  # 来源文件 -> {"kind", "size", "mtime", "ids"}
+        self.listed = Bitmap()
+        self.resolved = Bitmap()
+        self.downloaded = Bitmap()
+        self.scanned = 0  # 本次重新扫描的文件数
+
+    @classmethod
+    def from_config(cls, download_dir: Optional[str] = None, exclude: Iterable[str] = ()) -> Optional["SeenIndex"]:
+        """按配置加载并更新索引；未启用时返回 None"""
+        if not SEEN_INDEX_CONFIG['enabled']:
+            return None
+        index = cls(download_dir, exclude)
+        index.refresh()
+        return index
+
+    # ---------- 来源文件 ---------- #
+    def _sources(self) -> Dict[str, str]:
+        """当前所有来源文件 -> 类别"""
+        sources = {}
+        for directory, kind in ((self.search_dir, "listed"), (self.url_dir, "resolved")):
+            if directory.is_dir():
+                for path in directory.glob("*.json"):
+                    sources[str(path.resolve())] = kind
+        if self.store_index.exists():
+            sources[str(self.store_index.resolve())] = "downloaded"
+        return sources
+
+    @staticmethod
+    def _scan(path: str, kind: str) -> Iterable[int]:
+        if kind == "downloaded":
+            with open(path, "r", encoding="utf-8") as f:
+                ids = (_comic_id(key) for key in json.load(f).get("comics", {}))
+        elif kind == "resolved":
+            # 只有真正拿到下载链接的漫画才算，获取失败的下次还要重试
+            ids = (_comic_id(c.get("id")) for c in iter_items(path) if isinstance(c, dict) and c.get("download_links"))
+        else:
+            ids = (_comic_id(c.get("id")) for c in iter_items(path) if isinstance(c, dict))
+        return [comic_id for comic_id in ids if comic_id is not None]
+
+    # ---------- 加载 & 更新 ---------- #
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.files = {}
+
+    def save(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> None:
+        """重新扫描新增或变化的来源文件，删除已不存在的文件，然后合并为位图"""
+        self._load()
+        sources = self._sources()
+        changed = False
+        for path in list(self.files):
+            if path not in sources:
+                del self.files[path]
+                changed = True
+
+        for path, kind in sources.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = self.files.get(path)
+            if entry and entry["kind"] == kind and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            try:
+                ids = self._scan(path, kind)
+            except (OSError, ValueError) as e:  # 损坏或正在写入的文件下次再试
+                print(f"索引文件失败 {os.path.basename(path)}: {e}")
+                self.files.pop(path, None)
+                continue
+            self.files[path] = {"kind": kind, "size": stat.st_size, "mtime": stat.st_mtime, "ids": _pack(ids)}
+            self.scanned += 1
+            changed = True
+
+        if changed:
+            self.save()
+        self._build()
+
+    def _build(self) -> None:
+        self.listed, self.resolved, self.downloaded = Bitmap(), Bitmap(), Bitmap()
+        for path, entry in self.files.items():
+            if path in self.exclude:
+                continue
+            getattr(self, entry["kind"]).update(_unpack(entry["ids"]))
+
+    # ---------- 查询 ---------- #
+    def is_resolved(self, comic_id) -> bool:
+        """已在其他 url 文件中拿到下载链接"""
+        return _comic_id(comic_id) in self.resolved
+
+    def is_downloaded(self, comic_id) -> bool:
+        return _comic_id(comic_id) in self.downloaded
+
+    def is_listed(self, comic_id) -> bool:
+        return _comic_id(comic_id) in self.listed
+
+    def find_links(self, comic_ids: Iterable) -> Dict[str, Dict]:
+        """从其他 url 文件中取出这些漫画已有的下载链接，返回 漫画ID（字符串） -> download_links
+
+        只读取ID数组中包含所需漫画的文件；文件在建索引后被改动、找不到链接的漫画不在结果中。
+        """
+        wanted = {cid for cid in map(_comic_id, comic_ids) if cid is not None}
+        found: Dict[str, Dict] = {}
+        for path, entry in self.files.items():
+            if not wanted:
+                break
+            if entry["kind"] != "resolved" or path in self.exclude or not wanted.intersection(_unpack(entry["ids"])):
+                continue
+            try:
+                for comic in iter_items(path):
+                    comic_id = _comic_id(comic.get("id")) if isinstance(comic, dict) else None
+                    if comic_id in wanted and comic.get("download_links"):
+                        found[str(comic_id)] = comic["download_links"]
+                        wanted.discard(comic_id)
+            except (OSError, ValueError) as e:
+                print(f"读取 {os.path.basename(path)} 中的下载链接失败: {e}")
+        return found
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+def main(ids) -> int:
+    index = SeenIndex()
+    index.refresh()
+    counts = {kind: 0 for kind in KINDS}
+    for entry in index.files.values():
+        counts[entry["kind"]] += 1
+    print(f"索引: {index.index_path}（来源文件 {len(index.files)} 个，本次扫描 {index.scanned} 个）")
+    print(f"搜索结果/书架中的漫画: {len(index.listed)} 本（{counts['listed']} 个文件）")
+    print(f"已有下载链接: {len(index.resolved)} 本（{counts['resolved']} 个文件）")
+    print(f"已下载: {len(index.downloaded)} 本")
+    for comic_id in ids:
+        states = [name for name, ok in (("已列出", index.is_listed(comic_id)), ("已有链接", index.is_resolved(comic_id)),
+                                         ("已下载", index.is_downloaded(comic_id))) if ok]
+        print(f"  {comic_id}: {'，'.join(states) or '未出现过'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
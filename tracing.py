@@ -0,0 +1,191 @@
+"""
+请求追踪
+按需记录每个请求的 DNS / 建连（含TLS）/ 首字节（TTFB）/ 响应体传输耗时，以及解析、写文件、主动等待等阶段，
+输出为 Chrome trace JSON，可直接拖进 chrome://tracing 或 https://ui.perfetto.dev 查看时间都花在哪里。
+
+默认关闭；未开启时 span() 只返回一个空上下文，不记录任何东西。
+异步请求按所属 asyncio 任务分到不同的"线程"轨道，并发请求不会互相重叠。
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from config import TRACING_CONFIG
+
+_tracer: Optional["Tracer"] = None
+
+
+class Tracer:
+    """收集 Chrome trace 事件（完整事件 ph=X，时间单位为微秒）"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.events: List[Dict] = []
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._tids: Dict[object, int] = {}
+        self._lock = threading.Lock()
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def current_tid(self) -> int:
+        """当前 asyncio 任务（没有则为当前线程）对应的轨道编号"""
+        try:
+            owner = asyncio.current_task()
+        except RuntimeError:
+            owner = None
+        if owner is not None:
+            key, name = id(owner), owner.get_name()
+        else:
+            thread = threading.current_thread()
+            key, name = thread.ident, thread.name
+        with self._lock:
+            tid = self._tids.get(key)
+            if tid is None:
+                tid = self._tids[key] = len(self._tids) + 1
+                self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid,
+                                    "args": {"name": name}})
+        return tid
+
+    def add(self, name: str, cat: str, start_us: float, end_us: float,
+            tid: Optional[int] = None, args: Optional[Dict] = None) -> None:
+        event = {"ph": "X", "name": name, "cat": cat, "pid": self.pid,
+                 "tid": tid if tid is not None else self.current_tid(),
+                 "ts": round(start_us, 1), "dur": round(max(end_us - start_us, 0), 1)}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def save(self) -> str:
+        with self._lock:
+            events = list(self.events)
+        tmp_path = self.output + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.output)
+        return self.output
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def start(output: str) -> Tracer:
+    """开启追踪，进程退出时写入 output"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(output)
+
+        def _save():
+            path = _tracer.save()
+            print(f"追踪数据已保存到: {path}（可用 chrome://tracing 或 ui.perfetto.dev 打开）")
+
+        atexit.register(_save)
+    return _tracer
+
+
+def start_from_config(output: Optional[str] = None) -> Optional[Tracer]:
+    """按参数 / 环境变量 WNACG_TRACE / TRACING_CONFIG 开启追踪（都未配置时什么也不做）"""
+    if output is None:
+        output = os.environ.get("WNACG_TRACE") or TRACING_CONFIG["output"]
+    if not output:
+        return None
+    return start(output)
+
+
+@contextmanager
+def _span(tracer: Tracer, name: str, cat: str, args: Dict):
+    tid = tracer.current_tid()
+    start_us = tracer.now_us()
+    try:
+        yield
+    finally:
+        tracer.add(name, cat, start_us, tracer.now_us(), tid, args or None)
+
+
+def span(name: str, cat: str = "phase", **args):
+    """记录一个阶段的耗时，可用于同步代码，也可以包住 await"""
+    if _tracer is None:
+        return nullcontext()
+    return _span(_tracer, name, cat, args)
+
+
+# --------------------------------------------------------------------------- #
+#                            aiohttp TraceConfig                              #
+# --------------------------------------------------------------------------- #
+def _request_name(url) -> str:
+    parsed = urlparse(str(url))
+    return f"{parsed.netloc}{parsed.path}"
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.tid = _tracer.current_tid()
+    ctx.start = _tracer.now_us()
+    ctx.sent = ctx.start
+    ctx.name = _request_name(params.url)
+
+
+async def _on_dns_start(session, ctx, params):
+    ctx.dns_start = _tracer.now_us()
+
+
+async def _on_dns_end(session, ctx, params):
+    _tracer.add("dns", "net", ctx.dns_start, _tracer.now_us(), ctx.tid, {"host": params.host})
+
+
+async def _on_connection_create_start(session, ctx, params):
+    ctx.connect_start = _tracer.now_us()
+
+
+async def _on_connection_create_end(session, ctx, params):
+    now = _tracer.now_us()
+    _tracer.add("connect", "net", ctx.connect_start, now, ctx.tid)
+    ctx.sent = now
+
+
+async def _on_connection_reuseconn(session, ctx, params):
+    ctx.sent = _tracer.now_us()
+    ctx.reused = True
+
+
+async def _on_request_end(session, ctx, params):
+    # 收到响应头即触发：从连接就绪到此为首字节时间，响应体由调用方的 body span 记录
+    now = _tracer.now_us()
+    _tracer.add("ttfb", "net", ctx.sent, now, ctx.tid)
+    _tracer.add(f"GET {ctx.name}", "request", ctx.start, now, ctx.tid,
+                {"status": params.response.status, "reused": getattr(ctx, "reused", False)})
+
+
+async def _on_request_exception(session, ctx, params):
+    _tracer.add(f"GET {ctx.name}", "request", ctx.start, _tracer.now_us(), ctx.tid,
+                {"error": type(params.exception).__name__})
+
+
+def trace_configs() -> list:
+    """create_session 使用：追踪开启时返回 [TraceConfig]，否则返回空列表"""
+    if _tracer is None:
+        return []
+    import aiohttp
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_dns_resolvehost_start.append(_on_dns_start)
+    config.on_dns_resolvehost_end.append(_on_dns_end)
+    config.on_connection_create_start.append(_on_connection_create_start)
+    config.on_connection_create_end.append(_on_connection_create_end)
+    config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    config.on_request_end.append(_on_request_end)
+    config.on_request_exception.append(_on_request_exception)
+    return [config]
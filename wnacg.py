@@ -0,0 +1,328 @@
+"""
+WNACG 命令行入口
+把各个工具整合为一个命令，所有交互式提示都有对应的参数，便于 cron 和脚本在没有终端的情况下调用。
+各子命令用到的模块（bs4/aiohttp/requests/tqdm 等）只在执行该子命令时才导入，
+`python wnacg.py --help` 等简单操作不会为这些依赖付出启动时间。
+
+用法:
+  python wnacg.py search <关键词> [--tag] [--max-pages N] [--stream] [--since YYYY-MM-DD] [--save]
+  python wnacg.py search --batch <查询文件> [--max-pages N]
+  python wnacg.py shelf [--shelf-id N] [--list]
+  python wnacg.py links (--file <JSON> | --latest | --id <漫画ID>)
+  python wnacg.py download (--file <JSON> | --latest) [--gallery-mode fallback|always|off] [--postprocess]
+  python wnacg.py gallery <漫画ID> [--title 标题]
+  python wnacg.py postprocess <压缩包或目录>...
+  python wnacg.py store [--dir 下载目录] [--verify] [--prune]
+  python wnacg.py pipeline [--shelf-id N | --input <JSON>] [--no-download]
+  python wnacg.py daemon [--once] [--status] [--no-sync] [--queue FILE] [--node-id ID]
+  python wnacg.py bench-startup [--runs N]
+"""
+import argparse
+import os
+import sys
+
+
+# --------------------------------------------------------------------------- #
+#                                  子命令                                     #
+# --------------------------------------------------------------------------- #
+def cmd_search(args) -> int:
+    import search_id
+    from mirrors import select_fastest_sync
+
+    select_fastest_sync()
+
+    if args.batch:
+        return 0 if search_id.batch_search_from_file(args.batch, args.max_pages) else 1
+
+    if not args.query:
+        print("请提供搜索内容，或使用 --batch 指定查询文件")
+        return 2
+
+    search_func = search_id.search_by_tag if args.tag else search_id.search_by_keyword
+    if args.stream or args.since:
+        date_cutoff = None
+        if args.since:
+            from datetime import datetime
+            try:
+                date_cutoff = datetime.strptime(args.since, '%Y-%m-%d').date()
+            except ValueError:
+                print("日期格式应为 YYYY-MM-DD")
+                return 2
+        comics = search_id.get_top_search_results(search_func, args.query, args.max_pages,
+                                                  top_k=args.top_k, date_cutoff=date_cutoff)
+    else:
+        comics = search_id.get_all_search_results(search_func, args.query, args.max_pages)
+
+    search_id.display_smart_results(args.query, comics, show_all=True)
+    if args.save and comics:
+        return 0 if search_id.save_grouped_results(comics, args.query, save_format='json') else 1
+    return 0
+
+
+def _load_cookie():
+    from config import get_cookie
+    try:
+        return get_cookie()
+    except ValueError as e:
+        print(f"配置错误: {e}")
+        return None
+
+
+def _latest_search_file():
+    from get_url import scan_json_files
+    files = scan_json_files()
+    return files[0]['filepath'] if files else None
+
+
+def _latest_url_file():
+    from download import scan_json_files_with_downloads
+    files = scan_json_files_with_downloads(_url_dir())
+    return files[0]['filepath'] if files else None
+
+
+def _url_dir():
+    from config import DIRECTORIES
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), DIRECTORIES['downloads'])
+
+
+def cmd_shelf(args) -> int:
+    import asyncio
+    import get_shelf_info
+
+    cookie = _load_cookie()
+    if cookie is None:
+        return 1
+    if args.list:
+        asyncio.run(get_shelf_info.list_shelves(cookie))
+        return 0
+    return 0 if asyncio.run(get_shelf_info.main(cookie, args.shelf_id)) else 1
+
+
+def cmd_links(args) -> int:
+    import asyncio
+    import get_url
+
+    cookie = _load_cookie()
+    if cookie is None:
+        return 1
+    if args.id is not None:
+        return 0 if asyncio.run(get_url.main_single(cookie, args.id)) else 1
+
+    json_file = args.file or _latest_search_file()
+    if not json_file:
+        print("没有找到可用的JSON文件，请先运行 search 或 shelf")
+        return 1
+    print(f"处理文件: {json_file}")
+    return 0 if asyncio.run(get_url.main_from_json(cookie, json_file)) else 1
+
+
+def cmd_download(args) -> int:
+    import asyncio
+    from download import ComicDownloader
+
+    json_file = args.file or _latest_url_file()
+    if not json_file:
+        print("url/ 目录下没有可用 JSON，请先运行 links")
+        return 1
+    print(f"处理文件: {json_file}")
+    downloader = ComicDownloader(gallery_mode=args.gallery_mode, postprocess=args.postprocess or None)
+    asyncio.run(downloader.download_from_json(json_file))
+    return 0
+
+
+def cmd_gallery(args) -> int:
+    import asyncio
+    import gallery
+
+    return 0 if asyncio.run(gallery.main(args.id, args.title or str(args.id))) else 1
+
+
+def cmd_postprocess(args) -> int:
+    import asyncio
+    import postprocess
+
+    return 0 if asyncio.run(postprocess.main(args.paths)) else 1
+
+
+def cmd_store(args) -> int:
+    import archive_store
+
+    return archive_store.main(args.dir, verify=args.verify, prune=args.prune)
+
+
+def cmd_mirror_stats(args) -> int:
+    import mirror_stats
+
+    return mirror_stats.main()
+
+
+def cmd_pipeline(args) -> int:
+    import asyncio
+    import get_shelf_info
+    import get_url
+
+    cookie = _load_cookie()
+    if cookie is None:
+        return 1
+
+    json_file = args.input
+    if not json_file:
+        json_file = asyncio.run(get_shelf_info.main(cookie, args.shelf_id))
+        if not json_file:
+            return 1
+
+    url_file = asyncio.run(get_url.main_from_json(cookie, json_file))
+    if not url_file:
+        return 1
+    if args.no_download:
+        return 0
+
+    from download import ComicDownloader
+    asyncio.run(ComicDownloader().download_from_json(url_file))
+    return 0
+
+
+def cmd_daemon(args) -> int:
+    import daemon
+    return daemon.run_daemon(args.once, args.queue, args.status, not args.no_sync, args.node_id)
+
+
+def cmd_bench_startup(args) -> int:
+    """比较 `wnacg.py --help` 与直接导入各工具模块的启动耗时"""
+    import statistics
+    import subprocess
+    import time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "wnacg.py")
+    cases = [
+        ("wnacg --help", [sys.executable, script, "--help"]),
+        ("wnacg search --help", [sys.executable, script, "search", "--help"]),
+        ("import config", [sys.executable, "-c", "import config"]),
+        ("import search_id", [sys.executable, "-c", "import search_id"]),
+        ("import get_url", [sys.executable, "-c", "import get_url"]),
+        ("import download", [sys.executable, "-c", "import download"]),
+    ]
+
+    print(f"启动耗时（{args.runs} 次取中位数/最小值）:")
+    for name, cmd in cases:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run(cmd, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - start) * 1000)
+            if result.returncode != 0:
+                break
+        if result.returncode != 0:
+            print(f"  {name:<24} 失败 (退出码 {result.returncode})")
+            continue
+        print(f"  {name:<24} 中位数 {statistics.median(timings):7.1f} ms | 最小 {min(timings):7.1f} ms")
+    return 0
+
+
+# --------------------------------------------------------------------------- #
+#                                  参数                                       #
+# --------------------------------------------------------------------------- #
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="wnacg", description="WNACG 工具集")
+    parser.add_argument("--metrics-port", type=int, default=None, help="开启 HTTP /metrics 端点")
+    parser.add_argument("--metrics-textfile", default=None, help="定期把指标写入该文件")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="记录请求与各阶段耗时，退出时写入 Chrome trace JSON")
+    parser.add_argument("--profile", action="store_true", help="CPU/内存剖析，退出时写出 .prof 和报告")
+    parser.add_argument("--profile-dir", metavar="DIR", default=None,
+                        help="剖析结果的输出目录（默认 profiles/，指定后自动开启 --profile）")
+    sub = parser.add_subparsers(dest="command", metavar="<command>")
+    sub.required = True
+
+    p = sub.add_parser("search", help="关键词/标签搜索")
+    p.add_argument("query", nargs="?", help="搜索内容")
+    p.add_argument("--tag", action="store_true", help="按标签搜索（默认按关键词）")
+    p.add_argument("--max-pages", type=int, default=None, help="最大页数")
+    p.add_argument("--stream", action="store_true", help="流式搜索，找到足够多高度匹配后提前结束")
+    p.add_argument("--top-k", type=int, default=None, help="流式搜索保留的结果数")
+    p.add_argument("--since", help="日期下限 YYYY-MM-DD（隐含 --stream）")
+    p.add_argument("--save", action="store_true", help="保存结果到 search_results/")
+    p.add_argument("--batch", metavar="FILE", help="从查询文件批量搜索并合并保存")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("shelf", help="导出收藏夹书架")
+    p.add_argument("--shelf-id", type=int, default=0, help="书架ID（默认 0 = 全部）")
+    p.add_argument("--list", action="store_true", help="只列出书架")
+    p.set_defaults(func=cmd_shelf)
+
+    p = sub.add_parser("links", help="获取下载链接")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--file", help="search_results 下的 JSON 文件")
+    group.add_argument("--latest", action="store_true", help="使用最新的 JSON 文件（默认）")
+    group.add_argument("--id", type=int, help="只获取单个漫画的下载链接")
+    p.set_defaults(func=cmd_links)
+
+    p = sub.add_parser("download", help="批量下载")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--file", help="url 下的 JSON 文件")
+    group.add_argument("--latest", action="store_true", help="使用最新的 JSON 文件（默认）")
+    p.add_argument("--gallery-mode", choices=("fallback", "always", "off"), default=None,
+                   help="逐页下载图片: 压缩包失败时 / 总是 / 不使用（默认 GALLERY_CONFIG['mode']）")
+    p.add_argument("--postprocess", action="store_true",
+                   help="下载完成后重新打包为带 ComicInfo.xml 的 CBZ（默认 POSTPROCESS_CONFIG['enabled']）")
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser("gallery", help="逐页下载单本漫画的图片并打包为 CBZ")
+    p.add_argument("id", type=int, help="漫画ID")
+    p.add_argument("--title", default=None, help="文件名使用的标题（默认为漫画ID）")
+    p.set_defaults(func=cmd_gallery)
+
+    p = sub.add_parser("postprocess", help="把已下载的 ZIP/CBZ 重新打包为带 ComicInfo.xml 的 CBZ")
+    p.add_argument("paths", nargs="+", help="压缩包或包含压缩包的目录")
+    p.set_defaults(func=cmd_postprocess)
+
+    p = sub.add_parser("store", help="查看/校验/清理按内容哈希存储的压缩包")
+    p.add_argument("--dir", default="downloads", help="下载目录（默认 downloads）")
+    p.add_argument("--verify", action="store_true", help="重新计算哈希，删除损坏的对象")
+    p.add_argument("--prune", action="store_true", help="删除下载目录中已没有文件指向的对象")
+    p.set_defaults(func=cmd_store)
+
+    p = sub.add_parser("mirror-stats", help="查看各下载镜像的历史成功率、速度和失败类型")
+    p.set_defaults(func=cmd_mirror_stats)
+
+    p = sub.add_parser("pipeline", help="书架导出 → 获取链接 → 下载")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--shelf-id", type=int, default=0, help="书架ID（默认 0 = 全部）")
+    group.add_argument("--input", help="跳过书架导出，直接使用已有的 JSON 文件")
+    p.add_argument("--no-download", action="store_true", help="只获取链接，不下载")
+    p.set_defaults(func=cmd_pipeline)
+
+    p = sub.add_parser("daemon", help="守护进程：定期同步书架/查询，按优先级获取链接并下载")
+    p.add_argument("--once", action="store_true", help="同步一次并处理完队列后退出")
+    p.add_argument("--queue", default=None, help="任务队列文件（默认 DAEMON_CONFIG['queue_file']）")
+    p.add_argument("--status", action="store_true", help="只显示队列状态")
+    p.add_argument("--no-sync", action="store_true", help="不同步书架/查询，只处理队列中的任务（工作节点）")
+    p.add_argument("--node-id", default=None, help="节点ID（默认 主机名:队列文件路径）")
+    p.set_defaults(func=cmd_daemon)
+
+    p = sub.add_parser("bench-startup", help="测量各入口的启动耗时")
+    p.add_argument("--runs", type=int, default=5, help="每项运行次数")
+    p.set_defaults(func=cmd_bench_startup)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    import metrics
+    metrics.start_from_config(args.metrics_port, args.metrics_textfile)
+    import tracing
+    tracing.start_from_config(args.trace)
+    import profiling
+    profile_dir = args.profile_dir if args.profile_dir is not None else ("" if args.profile else None)
+    profiling.start_from_config(profile_dir, name=f"wnacg_{args.command}")
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        print("\n用户取消")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+"""
+ZIP 目录探测
+下载几百MB的压缩包之前，只用 Range 请求读取文件末尾：
+- 解析 ZIP 的目录结束记录（EOCD，必要时读取 ZIP64 记录），再读取中央目录；
+- 得到页数、图片格式、解压后总大小和每个文件的 CRC32，再读取第一张图片的开头得到分辨率；
+- 结果作为 manifest 保存在漫画记录中，可以按页数/分辨率过滤而不下载任何内容，
+  下载完成后再用其中的 CRC32 校验压缩包是否与探测时一致；
+- manifest 按漫画ID缓存在 url/.zip_manifests，跨运行保留，同一本漫画不会重复探测。
+服务器不支持 Range 或文件不是 ZIP 时探测失败，不影响正常下载。
+
+用法: python zip_probe.py <压缩包URL>
+      python zip_probe.py <带下载链接的 JSON 文件>   # 探测整个文件并列出会被过滤的漫画，不下载
+"""
+import asyncio
+import json
+import os
+import re
+import struct
+import sys
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import ClientTimeout
+from tqdm import tqdm
+
+# 从配置文件导入
+from config import DIRECTORIES, DOWNLOAD_CONFIG, ZIP_PROBE_CONFIG
+import tracing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+
+_EOCD = struct.Struct("<4s4H2LH")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+)")
+
+
+class ZipProbeError(ValueError):
+    """无法通过 Range 请求读取目录（不支持 Range、不是 ZIP 或目录损坏）"""
+    pass
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    compressed_size: int
+    size: int
+    crc32: int
+    method: int
+    offset: int  # 本地文件头的位置
+
+
+def _natural_key(name: str):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+# --------------------------------------------------------------------------- #
+#                                  解析                                       #
+# --------------------------------------------------------------------------- #
+def parse_eocd(tail: bytes, tail_start: int) -> Tuple[int, int, int, Optional[int]]:
+    """从文件末尾的数据中找到目录结束记录，返回 (文件数, 目录大小, 目录位置, ZIP64 记录位置)
+
+    ZIP64 记录位置不为 None 时，前三项需要以 ZIP64 记录中的值为准。
+    """
+    pos = tail.rfind(b"PK\x05\x06")
+    if pos < 0 or len(tail) - pos < _EOCD.size:
+        raise ZipProbeError("文件末尾没有 ZIP 目录结束记录")
+    _, _, _, _, entries, cd_size, cd_offset, _ = _EOCD.unpack_from(tail, pos)
+    if entries != 0xFFFF and cd_size != 0xFFFFFFFF and cd_offset != 0xFFFFFFFF:
+        return entries, cd_size, cd_offset, None
+
+    locator = pos - _ZIP64_LOCATOR.size
+    if locator < 0 or tail[locator:locator + 4] != b"PK\x06\x07":
+        raise ZipProbeError("缺少 ZIP64 目录定位记录")
+    _, _, zip64_offset, _ = _ZIP64_LOCATOR.unpack_from(tail, locator)
+    return entries, cd_size, cd_offset, zip64_offset
+
+
+def parse_zip64_eocd(data: bytes) -> Tuple[int, int, int]:
+    if len(data) < _ZIP64_EOCD.size or data[:4] != b"PK\x06\x06":
+        raise ZipProbeError("ZIP64 目录结束记录损坏")
+    fields = _ZIP64_EOCD.unpack_from(data)
+    return fields[7], fields[8], fields[9]
+
+
+def _zip64_extra(extra: bytes, size: int, compressed: int, offset: int) -> Tuple[int, int, int]:
+    """按 ZIP64 扩展字段补全被截断为 0xFFFFFFFF 的大小和位置"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<2H", extra, pos)
+        if tag == 0x0001:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, pos + 4))
+            if size == 0xFFFFFFFF:
+                size = next(values, size)
+            if compressed == 0xFFFFFFFF:
+                compressed = next(values, compressed)
+            if offset == 0xFFFFFFFF:
+                offset = next(values, offset)
+            break
+        pos += 4 + length
+    return size, compressed, offset
+
+
+def parse_central_directory(data: bytes, entries: int) -> List[ZipEntry]:
+    """解析中央目录；文件名的解码方式与 zipfile 相同，便于之后与本地压缩包对比"""
+    result = []
+    pos = 0
+    for _ in range(entries):
+        if data[pos:pos + 4] != b"PK\x01\x02":
+            raise ZipProbeError("中央目录损坏")
+        fields = _CENTRAL_HEADER.unpack_from(data, pos)
+        flags, method = fields[5], fields[6]
+        crc, compressed, size = fields[9], fields[10], fields[11]
+        name_len, extra_len, comment_len = fields[12], fields[13], fields[14]
+        offset = fields[18]
+        start = pos + _CENTRAL_HEADER.size
+        raw_name = data[start:start + name_len]
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = data[start + name_len:start + name_len + extra_len]
+        size, compressed, offset = _zip64_extra(extra, size, compressed, offset)
+        result.append(ZipEntry(name, compressed, size, crc, method, offset))
+        pos = start + name_len + extra_len + comment_len
+    return result
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """从图片开头的字节中读取宽高（JPEG/PNG/GIF/WebP），无法识别时返回 None"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">2L", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<2H", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<2H", data[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return None
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 9 <= len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                pos += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+            # SOF0-SOF15，排除 DHT(C4)、JPG(C8)、DAC(CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">2H", data[pos + 5:pos + 9])
+                return w, h
+            pos += 2 + length
+    return None
+
+
+def build_manifest(total_size: int, entries: List[ZipEntry], sample: Optional[Tuple[int, int]]) -> Dict:
+    """漫画记录中保存的目录摘要；files 为 [文件名, 解压后大小, CRC32]"""
+    images = [e for e in entries if os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS]
+    formats: Dict[str, int] = {}
+    for entry in images:
+        ext = os.path.splitext(entry.name)[1].lower().lstrip(".")
+        formats[ext] = formats.get(ext, 0) + 1
+    manifest = {
+        "size": total_size,
+        "pages": len(images),
+        "formats": formats,
+        "uncompressed": sum(e.size for e in entries),
+        "files": [[e.name, e.size, e.crc32] for e in entries if not e.name.endswith("/")],
+    }
+    if sample:
+        manifest["width"], manifest["height"] = sample
+    return manifest
+
+
+# --------------------------------------------------------------------------- #
+#                                  探测                                       #
+# --------------------------------------------------------------------------- #
+async def fetch_range(session: aiohttp.ClientSession, url: str, spec: str,
+                      timeout: ClientTimeout) -> Tuple[bytes, int, int]:
+    """请求 bytes=spec，返回 (数据, 起始位置, 文件总大小)；服务器忽略 Range 时不读取响应体"""
+    async with session.get(url, headers={"Range": f"bytes={spec}"}, ssl=False, timeout=timeout) as resp:
+        match = _CONTENT_RANGE.search(resp.headers.get("Content-Range", ""))
+        if resp.status != 206 or not match:
+            raise ZipProbeError(f"服务器不支持 Range 请求 (HTTP {resp.status})")
+        return await resp.read(), int(match.group(1)), int(match.group(3))
+
+
+async def probe_zip(session: aiohttp.ClientSession, url: str) -> Dict:
+    """只读取文件末尾和第一张图片的开头，返回压缩包的 manifest"""
+    timeout = ClientTimeout(total=DOWNLOAD_CONFIG['probe_timeout'])
+    tail, tail_start, total = await fetch_range(session, url, f"-{ZIP_PROBE_CONFIG['tail_bytes']}", timeout)
+
+    async def read(start: int, length: int) -> bytes:
+        if start >= tail_start:  # 已在末尾数据中
+            return tail[start - tail_start:start - tail_start + length]
+        data, _, _ = await fetch_range(session, url, f"{start}-{start + length - 1}", timeout)
+        return data
+
+    entries, cd_size, cd_offset, zip64_offset = parse_eocd(tail, tail_start)
+    if zip64_offset is not None:
+        entries, cd_size, cd_offset = parse_zip64_eocd(await read(zip64_offset, _ZIP64_EOCD.size))
+    if cd_size > ZIP_PROBE_CONFIG['max_directory_mb'] * 1024 * 1024 or cd_offset + cd_size > total:
+        raise ZipProbeError(f"中央目录大小异常: {cd_size} 字节")
+    directory = parse_central_directory(await read(cd_offset, cd_size), entries)
+
+    # 读取第一张图片的开头得到分辨率（存储模式直接读取，deflate 解压前一段）
+    sample = None
+    images = sorted((e for e in directory if os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS),
+                    key=lambda e: _natural_key(e.name))
+    if images and images[0].method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        first = images[0]
+        head = await read(first.offset, _LOCAL_HEADER.size + 1024 + ZIP_PROBE_CONFIG['sample_bytes'])
+        if head[:4] == b"PK\x03\x04":
+            fields = _LOCAL_HEADER.unpack_from(head)
+            data = head[_LOCAL_HEADER.size + fields[9] + fields[10]:]
+            if first.method == zipfile.ZIP_DEFLATED:
+                try:
+                    data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+                except zlib.error:
+                    data = b""
+            sample = image_size(data)
+    return build_manifest(total, directory, sample)
+
+
+async def probe_comic_manifest(session: aiohttp.ClientSession, comic: Dict) -> Optional[Dict]:
+    """按顺序尝试漫画的下载链接，保存第一个成功的 manifest 到 comic['manifest']（同时得到 size）"""
+    for link_info in comic.get("download_links", {}).values():
+        try:
+            manifest = await probe_zip(session, link_info["url"])
+        except (ZipProbeError, aiohttp.ClientError, asyncio.TimeoutError, struct.error):
+            continue
+        comic["manifest"] = manifest
+        comic["size"] = manifest["size"]
+        return manifest
+    return None
+
+
+class ManifestCache:
+    """漫画ID -> manifest，保存在 url 目录，下次运行或只做过滤时不必重新探测"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else Path(BASE_DIR) / DIRECTORIES['downloads'] / ZIP_PROBE_CONFIG['cache_file']
+        self.manifests: Dict[str, Dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.manifests = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def get(self, comic_id) -> Optional[Dict]:
+        return self.manifests.get(str(comic_id)) if comic_id is not None else None
+
+    def put(self, comic_id, manifest: Dict) -> None:
+        if comic_id is not None:
+            self.manifests[str(comic_id)] = manifest
+
+    def forget(self, comic_id) -> None:
+        """下载的压缩包与缓存的 manifest 不符（可能已重新打包），下次重新探测"""
+        if self.manifests.pop(str(comic_id), None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifests, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+_cache: Optional[ManifestCache] = None
+
+
+def get_manifest_cache() -> ManifestCache:
+    """进程内共享的 manifest 缓存"""
+    global _cache
+    if _cache is None:
+        _cache = ManifestCache()
+    return _cache
+
+
+async def probe_manifests(session: aiohttp.ClientSession, comics: List[Dict]) -> None:
+    """并发探测所有漫画压缩包的目录（已有 manifest 或缓存中有的跳过），结果写入缓存"""
+    cache = get_manifest_cache()
+    for comic in comics:
+        cached = cache.get(comic.get("id")) if "manifest" not in comic else None
+        if cached is not None:
+            comic["manifest"] = cached
+            comic["size"] = cached["size"]
+    todo = [c for c in comics if "manifest" not in c and c.get("download_links")]
+    if not todo:
+        return
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONFIG['probe_concurrency'])
+
+    with tracing.span("probe_manifests", "phase", count=len(todo)), \
+            tqdm(total=len(todo), desc="探测压缩包目录", dynamic_ncols=True, leave=False) as bar:
+        async def probe(comic: Dict) -> None:
+            async with semaphore:
+                await probe_comic_manifest(session, comic)
+            bar.update(1)
+
+        await asyncio.gather(*(probe(c) for c in todo))
+
+    found = [c for c in todo if "manifest" in c]
+    tqdm.write(f"已探测 {len(found)}/{len(todo)} 本的压缩包目录")
+    for comic in found:
+        cache.put(comic.get("id"), comic["manifest"])
+    if found:
+        cache.save()
+
+
+def filter_reason(comic: Dict) -> Optional[str]:
+    """按 ZIP_PROBE_CONFIG 的页数/分辨率条件检查 manifest，不满足时返回原因"""
+    manifest = comic.get("manifest")
+    if not manifest:
+        return None
+    pages = manifest["pages"]
+    if ZIP_PROBE_CONFIG['min_pages'] and pages < ZIP_PROBE_CONFIG['min_pages']:
+        return f"只有 {pages} 页"
+    if ZIP_PROBE_CONFIG['max_pages'] and pages > ZIP_PROBE_CONFIG['max_pages']:
+        return f"有 {pages} 页"
+    width = manifest.get("width")
+    if ZIP_PROBE_CONFIG['min_width'] and width is not None and width < ZIP_PROBE_CONFIG['min_width']:
+        return f"图片宽度只有 {width} 像素"
+    return None
+
+
+def verify_archive(path: str, manifest: Dict) -> Optional[str]:
+    """对照 manifest 检查下载的压缩包：文件列表和 CRC32 一致，且数据能通过 CRC 校验；返回问题描述或 None"""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            local = {info.filename: info.CRC for info in zf.infolist() if not info.is_dir()}
+            for name, _, crc in manifest["files"]:
+                if name not in local:
+                    return f"缺少文件 {name}"
+                if local[name] != crc:
+                    return f"{name} 的 CRC32 与探测时不同"
+            bad = zf.testzip()
+            if bad is not None:
+                return f"{bad} 数据损坏"
+    except (zipfile.BadZipFile, OSError) as e:
+        return f"无法读取压缩包: {e}"
+    return None
+
+
+# --------------------------------------------------------------------------- #
+#                                  入口                                       #
+# --------------------------------------------------------------------------- #
+async def probe_file(json_path: str) -> int:
+    """探测 JSON 中所有漫画的压缩包目录并按配置的条件检查，不下载"""
+    from http_client import create_session
+    from json_stream import iter_items
+
+    comics = [c for c in iter_items(json_path) if isinstance(c, dict) and c.get("download_links")]
+    if not comics:
+        print("JSON 中没有带下载链接的漫画")
+        return 1
+    async with create_session(verify_ssl=False) as session:
+        await probe_manifests(session, comics)
+    skipped = 0
+    for comic in comics:
+        reason = filter_reason(comic)
+        if reason is not None:
+            skipped += 1
+            print(f"  会跳过 {comic.get('title', '')} (ID: {comic.get('id')}): {reason}")
+    probed = sum(1 for c in comics if "manifest" in c)
+    print(f"共 {len(comics)} 本，有压缩包目录 {probed} 本，按当前条件会跳过 {skipped} 本")
+    return 0
+
+
+async def main(url: str) -> int:
+    from download_scheduler import format_size
+    from http_client import create_session
+
+    if url.lower().endswith(".json") and os.path.exists(url):
+        return await probe_file(url)
+    async with create_session(verify_ssl=False) as session:
+        try:
+            manifest = await probe_zip(session, url)
+        except (ZipProbeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"探测失败: {e}")
+            return 1
+    formats = ", ".join(f"{ext} {count}" for ext, count in sorted(manifest["formats"].items()))
+    print(f"压缩包大小: {format_size(manifest['size'])}，解压后: {format_size(manifest['uncompressed'])}")
+    print(f"页数: {manifest['pages']}（{formats or '无图片'}）")
+    if "width" in manifest:
+        print(f"第一页分辨率: {manifest['width']}x{manifest['height']}")
+    print(f"文件数: {len(manifest['files'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python zip_probe.py <压缩包URL 或 带下载链接的 JSON 文件>")
+        sys.exit(1)
+    sys.exit(asyncio.run(main(sys.argv[1])))